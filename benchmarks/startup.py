@@ -0,0 +1,168 @@
+"""
+Startup latency benchmarks for snk and generated workflow executables.
+
+Measures the wall time and number of imported modules of:
+
+  - `snk --version`
+  - `snk list` with 1, 100 and 1000 installed workflows
+  - `<workflow> --help` for an executable created by `Nest.create_executable`
+
+Results are written as JSON and compared against a stored baseline. The script
+exits with a non-zero status if a benchmark regressed.
+
+Usage:
+  python benchmarks/startup.py [--output results.json] [--update-baseline]
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+WORKFLOW = ROOT / "tests" / "data" / "workflow"
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+SNK = [sys.executable, "-c", "import sys; from snk.main import app; sys.argv[0] = 'snk'; app()"]
+
+
+def run(command, repeat: int) -> dict:
+    """
+    Time a command and count the modules it imports.
+
+    Args:
+      command (list): The command to run.
+      repeat (int): The number of timed runs.
+
+    Returns:
+      dict: The median wall time (seconds) and the number of imported modules.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, capture_output=True)
+        times.append(time.perf_counter() - start)
+    if command[0] == sys.executable:
+        command = [sys.executable, "-X", "importtime"] + command[1:]
+    else:
+        # executables are python scripts
+        command = [sys.executable, "-X", "importtime"] + command
+    process = subprocess.run(command, check=True, capture_output=True, text=True)
+    imports = [line for line in process.stderr.splitlines() if line.startswith("import time:")]
+    # the first line is the header
+    return {"wall_time": statistics.median(times), "imports": len(imports) - 1}
+
+
+def populate(snk_home: Path, bin_dir: Path, count: int):
+    """
+    Install the test workflow `count` times.
+
+    The workflows are linked in editable mode so populating large homes is fast.
+    """
+    from snk import Nest
+
+    nest = Nest(snk_home, bin_dir)
+    entries = []
+    for i in range(len(nest.registry.entries()), count):
+        name = f"workflow-{i}"
+        workflow_path = nest.local(WORKFLOW, name, editable=True)
+        executable = nest.create_executable(workflow_path, name)
+        nest.link_workflow_executable_to_bin(executable)
+        entries.append(nest._registry_entry(name, version="editable", editable=True))
+    nest.registry.update(entries)
+    return nest
+
+
+def benchmark(repeat: int) -> dict:
+    results = {}
+    results["snk --version"] = run(SNK + ["--version"], repeat)
+    with tempfile.TemporaryDirectory() as tmp:
+        snk_home = Path(tmp) / "snk"
+        bin_dir = Path(tmp) / "bin"
+        for count in [1, 100, 1000]:
+            nest = populate(snk_home, bin_dir, count)
+            command = SNK + ["--home", str(snk_home), "--bin", str(bin_dir), "list"]
+            results[f"snk list ({count} workflows)"] = run(command, repeat)
+        executable = nest.snk_executable_dir / "workflow-0"
+        nest.compile_cli_spec(executable)
+        results["<workflow> --help"] = run([str(executable), "--help"], repeat)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compare benchmark results against the baseline.
+
+    Args:
+      results (dict): The benchmark results.
+      baseline (dict): The baseline results.
+      tolerance (float): The allowed relative slowdown of the wall time.
+
+    Returns:
+      list: A description of every regression.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]
+        if result["wall_time"] > expected["wall_time"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: wall time {result['wall_time']:.3f}s > baseline {expected['wall_time']:.3f}s"
+            )
+        if result["imports"] > expected["imports"]:
+            regressions.append(
+                f"{name}: {result['imports']} imports > baseline {expected['imports']} imports"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--output", type=Path, help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", type=Path, default=BASELINE, help="The baseline JSON file.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="Allowed relative slowdown of the wall time before failing (default 0.5).",
+    )
+    parser.add_argument(
+        "--update-baseline", action="store_true", help="Store the results as the new baseline."
+    )
+    args = parser.parse_args()
+
+    results = benchmark(args.repeat)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    for name, result in results.items():
+        print(f"{name:<30} {result['wall_time']:.3f}s  {result['imports']:>5} imports")
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print(f"No baseline found at {args.baseline}, run with --update-baseline")
+        return
+    baseline = json.loads(args.baseline.read_text())["results"]
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\nStartup regressions compared to the baseline:", file=sys.stderr)
+        for regression in regressions:
+            print(f"  {regression}", file=sys.stderr)
+        sys.exit(1)
+    print("\nNo regressions compared to the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,18 @@
 # SPDX-License-Identifier: MIT
 from pathlib import Path
 
-from snk_cli import CLI, validate_config  # noqa: F401
 
-from .nest import Nest  # noqa: F401
+def __getattr__(name):
+    # snk_cli imports snakemake, so it is only loaded when it is first used
+    if name in ("CLI", "validate_config"):
+        import snk_cli
+
+        return getattr(snk_cli, name)
+    if name == "Nest":
+        from .nest import Nest
+
+        return Nest
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def create_cli(p):
@@ -23,6 +32,8 @@ def create_cli(p):
       >>> create_cli("/path/to/workflow")
       ... # CLI is created and executed
     """
+    from snk_cli import CLI
+
     workflow_dir_path = Path(p)
     cli = CLI(workflow_dir_path)
     cli()
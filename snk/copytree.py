@@ -0,0 +1,176 @@
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .scan import load_ignore_patterns, walk
+
+# Files that snk edits in place after installing a workflow. Linking them would
+# modify the source workflow, so they are always copied.
+NEVER_LINK = [
+    "snk.yaml",
+    ".snk",
+    "config.yaml",
+    "config.yml",
+    "config/config.yaml",
+    "config/config.yml",
+]
+
+# Files larger than this are copied in chunks of this size in parallel.
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# ioctl request to clone a file (share its extents) on filesystems with reflinks
+# (e.g. btrfs, XFS), from linux/fs.h.
+FICLONE = 0x40049409
+
+
+def copy_workflow(
+    src: Path,
+    dst: Path,
+    patterns: Optional[List[str]] = None,
+    link: bool = True,
+    max_workers: int = None,
+) -> Dict[str, int]:
+    """
+    Copy a workflow directory, skipping ignored paths.
+
+    File contents are shared with the source where possible: files are
+    reflinked (copy-on-write clones) if the filesystem supports it, otherwise
+    hardlinked when the source and destination are on the same filesystem.
+    Otherwise files are copied in parallel, large files in chunks. Files snk
+    edits in place (`NEVER_LINK`) are always copied.
+
+    Args:
+      src (Path): The path to the workflow directory.
+      dst (Path): The path to copy the workflow to. Must not exist.
+      patterns (List[str], optional): The ignore patterns. Defaults to `load_ignore_patterns(src)`.
+      link (bool, optional): Reflink or hardlink files where possible. Defaults to True.
+      max_workers (int, optional): The number of threads copying files. Defaults to the number of CPUs (max 8).
+
+    Returns:
+      Dict[str, int]: The number of files that were reflinked, hardlinked and copied.
+
+    Examples:
+      >>> copy_workflow(Path("/path/to/workflow"), Path("/path/to/snk/workflows/example"))
+      {'reflinked': 0, 'hardlinked': 120, 'copied': 3}
+    """
+    src = Path(src)
+    dst = Path(dst)
+    if patterns is None:
+        patterns = load_ignore_patterns(src)
+    if max_workers is None:
+        max_workers = min(8, os.cpu_count() or 1)
+    dst.mkdir(parents=True)
+    counts = {"reflinked": 0, "hardlinked": 0, "copied": 0}
+    copier = _Copier(link=link)
+    chunks = []
+    for entry in walk(src, patterns, include_dirs=True, follow_symlinks=True):
+        relative_path = Path(os.path.relpath(entry.path, src))
+        target = dst / relative_path
+        if entry.is_dir():
+            target.mkdir(exist_ok=True)
+            continue
+        if not os.path.exists(entry.path):
+            # dangling symlink
+            continue
+        method = None
+        if relative_path.as_posix() not in NEVER_LINK:
+            method = copier.link(entry.path, target)
+        if method:
+            counts[method] += 1
+            continue
+        counts["copied"] += 1
+        chunks.extend(_plan_copy(entry.path, target))
+    if chunks:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(lambda chunk: _copy_chunk(*chunk), chunks))
+        for source, target, offset, _ in chunks:
+            if offset == 0:
+                shutil.copystat(source, target)
+    return counts
+
+
+class _Copier:
+    """Remembers which ways of sharing file contents work between two directories."""
+
+    def __init__(self, link: bool = True) -> None:
+        self.reflink = link and sys.platform.startswith("linux")
+        self.hardlink = link
+
+    def link(self, source: str, target: Path) -> Optional[str]:
+        if self.reflink:
+            try:
+                _reflink(source, target)
+                return "reflinked"
+            except OSError:
+                # not supported by the filesystem (or across filesystems)
+                self.reflink = False
+                _unlink(target)
+        if self.hardlink:
+            try:
+                os.link(source, target)
+                return "hardlinked"
+            except OSError:
+                self.hardlink = False
+        return None
+
+
+def _reflink(source: str, target: Path):
+    import fcntl
+
+    with open(source, "rb") as fsrc, open(target, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(source, target)
+
+
+def _unlink(path: Path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _plan_copy(source: str, target: Path) -> List[tuple]:
+    """Create the target file and split copying the source into chunks."""
+    size = os.path.getsize(source)
+    with open(target, "wb") as f:
+        f.truncate(size)
+    if size == 0:
+        return [(source, target, 0, 0)]
+    return [
+        (source, target, offset, min(CHUNK_SIZE, size - offset))
+        for offset in range(0, size, CHUNK_SIZE)
+    ]
+
+
+def _copy_chunk(source: str, target: Path, offset: int, length: int):
+    with open(source, "rb") as fsrc, open(target, "r+b") as fdst:
+        copied = 0
+        if hasattr(os, "copy_file_range"):
+            try:
+                while copied < length:
+                    n = os.copy_file_range(
+                        fsrc.fileno(),
+                        fdst.fileno(),
+                        length - copied,
+                        offset + copied,
+                        offset + copied,
+                    )
+                    if n == 0:
+                        break
+                    copied += n
+                return
+            except OSError:
+                # e.g. not supported across filesystems on older kernels
+                pass
+        fsrc.seek(offset + copied)
+        fdst.seek(offset + copied)
+        remaining = length - copied
+        while remaining > 0:
+            data = fsrc.read(min(remaining, 1024 * 1024))
+            if not data:
+                break
+            fdst.write(data)
+            remaining -= len(data)
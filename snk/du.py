@@ -0,0 +1,236 @@
+import os
+import pickle
+import stat
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+# Directories modified this recently are not cached, their mtime may not change
+# again on filesystems with coarse timestamps when more files are added.
+RACY_MTIME_NS = 2_000_000_000
+
+
+@dataclass
+class WorkflowUsage:
+    """
+    The disk usage of an installed workflow in bytes.
+
+    Attributes:
+      name (str): The name of the workflow.
+      workflow (int): The workflow (and repo) checkout, executable and CLI spec. Defaults to 0.
+      venv (int): The venv of the workflow and the base venvs it is layered over. Defaults to 0.
+      envs (int): The conda envs and singularity images created in the workflow directory. Defaults to 0.
+      total (int): All of the above, hardlinked files counted once. Defaults to 0.
+    """
+
+    name: str
+    workflow: int = 0
+    venv: int = 0
+    envs: int = 0
+    total: int = 0
+
+
+@dataclass
+class DiskUsageReport:
+    """
+    The disk usage of the installed workflows in bytes.
+
+    Attributes:
+      workflows (List[WorkflowUsage]): The disk usage of each workflow.
+      total (int): The disk usage of all workflows, shared venvs and hardlinked files counted once. Defaults to 0.
+      home (int, optional): The disk usage of SNK_HOME (incl. caches and the trash). Defaults to None.
+    """
+
+    workflows: List[WorkflowUsage] = field(default_factory=list)
+    total: int = 0
+    home: Optional[int] = None
+
+
+def _is_dir(path: str) -> bool:
+    try:
+        return stat.S_ISDIR(os.lstat(path).st_mode)
+    except OSError:
+        return False
+
+
+class DiskUsage:
+    """
+    Measures the size of directory trees.
+
+    Directories are listed with `os.scandir` in parallel and files with several
+    hardlinks are counted once. The listing of each directory (the sizes of its
+    files and its subdirectories) is cached by the directory mtime, which changes
+    when entries are added, removed or renamed. Measuring a tree again only
+    stats its directories. Files rewritten in place are not picked up until
+    their directory changes.
+
+    Args:
+      cache_path (Path, optional): The file to cache the directory listings in. Defaults to None (no cache).
+      max_workers (int, optional): The number of threads listing directories. Defaults to the number of CPUs (max 8).
+
+    Examples:
+      >>> usage = DiskUsage(Path("/path/to/snk/.cache/du.pickle"))
+      >>> usage.size([Path("/path/to/snk/venvs")])
+      104857600
+      >>> usage.save()
+    """
+
+    def __init__(self, cache_path: Path = None, max_workers: int = None) -> None:
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        # path: (mtime_ns, size of the files with one link, ((dev, ino, size), ...), subdirs)
+        self._dirs: Dict[str, tuple] = {}
+        # listings of recently modified directories, not cached
+        self._fresh: Dict[str, tuple] = {}
+        self._visited = set()
+        self._roots = set()
+        if self.cache_path:
+            try:
+                with open(self.cache_path, "rb") as f:
+                    self._dirs = pickle.load(f)
+            except Exception:
+                self._dirs = {}
+
+    def scan(self, paths: Iterable[Path]):
+        """
+        List the directories of the given trees in parallel.
+
+        Args:
+          paths (Iterable[Path]): The roots of the trees.
+        """
+        roots = [str(p) for p in paths]
+        roots = [p for p in roots if p not in self._visited and _is_dir(p)]
+        if not roots:
+            return
+        self._roots.update(roots)
+        self._visited.update(roots)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {executor.submit(self._scan_dir, root) for root in roots}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, listing = future.result()
+                    if listing is None:
+                        continue
+                    for name in listing[3]:
+                        subdir = os.path.join(path, name)
+                        if subdir not in self._visited:
+                            self._visited.add(subdir)
+                            pending.add(executor.submit(self._scan_dir, subdir))
+
+    def _scan_dir(self, path: str):
+        try:
+            st = os.lstat(path)
+            cached = self._dirs.get(path)
+            if cached and cached[0] == st.st_mtime_ns:
+                return path, cached
+            size = 0
+            linked = []
+            subdirs = []
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                            continue
+                        entry_st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if entry_st.st_nlink > 1:
+                        linked.append((entry_st.st_dev, entry_st.st_ino, entry_st.st_size))
+                    else:
+                        size += entry_st.st_size
+        except OSError:
+            self._dirs.pop(path, None)
+            return path, None
+        listing = (st.st_mtime_ns, size, tuple(linked), tuple(subdirs))
+        if time.time_ns() - st.st_mtime_ns > RACY_MTIME_NS:
+            self._dirs[path] = listing
+        else:
+            self._dirs.pop(path, None)
+            self._fresh[path] = listing
+        return path, listing
+
+    def size(self, paths: Iterable[Path], exclude: Iterable[Path] = ()) -> int:
+        """
+        Get the size of the files in the given paths without following symlinks.
+
+        Files with several hardlinks are counted once, also across the paths.
+
+        Args:
+          paths (Iterable[Path]): The files and directories to measure.
+          exclude (Iterable[Path], optional): Directories in the trees to skip. Defaults to ().
+
+        Returns:
+          int: The size in bytes.
+
+        Examples:
+          >>> usage.size([Path("/path/to/snk/workflows/example")], exclude=[Path("/path/to/snk/workflows/example/.conda")])
+          1048576
+        """
+        paths = [str(p) for p in paths]
+        exclude = {str(p) for p in exclude}
+        self.scan(p for p in paths if p not in exclude)
+        total = 0
+        linked = {}
+        stack = []
+        for path in paths:
+            if path in exclude:
+                continue
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                stack.append(path)
+            elif st.st_nlink > 1:
+                linked[(st.st_dev, st.st_ino)] = st.st_size
+            else:
+                total += st.st_size
+        seen = set()
+        while stack:
+            path = stack.pop()
+            listing = self._fresh.get(path) or self._dirs.get(path)
+            if path in seen or path not in self._visited or listing is None:
+                continue
+            seen.add(path)
+            total += listing[1]
+            for dev, ino, size in listing[2]:
+                linked[(dev, ino)] = size
+            for name in listing[3]:
+                subdir = os.path.join(path, name)
+                if subdir not in exclude:
+                    stack.append(subdir)
+        return total + sum(linked.values())
+
+    def save(self):
+        """
+        Write the directory listings to the cache.
+
+        Listings of directories in the scanned trees that are gone are dropped.
+        """
+        if not self.cache_path:
+            return
+        for path in list(self._dirs):
+            if path in self._visited:
+                continue
+            parent = os.path.dirname(path)
+            while parent and parent not in self._roots:
+                next_parent = os.path.dirname(parent)
+                parent = next_parent if next_parent != parent else None
+            if parent:
+                # in a scanned tree but not found
+                del self._dirs[path]
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(self._dirs, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
@@ -26,3 +26,9 @@ class InvalidWorkflowError(NestError):
     """
     Thrown if the given workflow appears to have an invalid format.
     """
+
+
+class LockTimeoutError(NestError):
+    """
+    Thrown if a lock in SNK_HOME (e.g. of a workflow being installed) is not released in time.
+    """
@@ -0,0 +1,132 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+# The phases of an install in the order they run. `clone` and `copy` are
+# alternatives (remote or local workflows). `pip` is timed inside `venv` when the
+# packages of an environment are installed.
+INSTALL_PHASES = [
+    "resolve",
+    "clone",
+    "copy",
+    "validate",
+    "config",
+    "venv",
+    "pip",
+    "shim",
+    "dedupe",
+    "confirm",
+    "link",
+    "registry",
+    "publish",
+    "spec",
+]
+
+
+class InstallEvents:
+    """
+    Times the phases of an install and reports them as structured events.
+
+    Every event is a dict with the `event` type, the `workflow` being installed,
+    its `name` (once it is known) and the `time` (seconds since the epoch):
+
+    - `install_start` when the install starts.
+    - `phase_start` and `phase_end` for each phase, with the `phase`. `phase_end`
+      also has the `duration` in seconds and the `status` ("ok" or "error").
+    - `install_end` with the total `duration`, the `status`, the `timings` of each
+      phase and the `error` message if the install failed.
+
+    Args:
+      workflow (str): The workflow being installed (URL or path).
+      callback (Callable[[dict], None], optional): Called with every event. Defaults to None.
+
+    Examples:
+      >>> with InstallEvents("Wytamma/snk-basic-pipeline", callback=print) as events:
+      ...     events.step("clone")
+      {'event': 'install_start', 'workflow': 'Wytamma/snk-basic-pipeline', 'name': None, 'time': 1700000000.0}
+      {'event': 'phase_start', 'workflow': 'Wytamma/snk-basic-pipeline', 'name': None, 'time': 1700000000.0, 'phase': 'clone'}
+      ...
+    """
+
+    def __init__(self, workflow: str, callback: Callable[[dict], None] = None) -> None:
+        self.workflow = workflow
+        self.name: Optional[str] = None
+        self.callback = callback
+        self.timings: Dict[str, float] = {}
+        self._start = None
+        self._step = None
+
+    def __enter__(self) -> "InstallEvents":
+        self._start = time.perf_counter()
+        self.emit("install_start")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._end_step("error" if exc else "ok")
+        end = {
+            "duration": round(time.perf_counter() - self._start, 6),
+            "status": "error" if exc else "ok",
+            "timings": {phase: round(t, 6) for phase, t in self.timings.items()},
+        }
+        if exc:
+            end["error"] = str(exc)
+        self.emit("install_end", **end)
+
+    def emit(self, event: str, **fields):
+        """
+        Report an event to the callback.
+
+        Args:
+          event (str): The type of the event.
+          **fields: Additional fields of the event.
+        """
+        if self.callback is None:
+            return
+        self.callback(
+            {
+                "event": event,
+                "workflow": self.workflow,
+                "name": self.name,
+                "time": time.time(),
+                **fields,
+            }
+        )
+
+    def step(self, phase: str):
+        """
+        End the current phase of the install and start the next one.
+
+        Args:
+          phase (str): The name of the phase, see `INSTALL_PHASES`.
+        """
+        self._end_step("ok")
+        self.emit("phase_start", phase=phase)
+        self._step = (phase, time.perf_counter())
+
+    @contextmanager
+    def phase(self, phase: str) -> Iterator[None]:
+        """
+        Time a phase nested in the current phase.
+
+        Args:
+          phase (str): The name of the phase, see `INSTALL_PHASES`.
+        """
+        self.emit("phase_start", phase=phase)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            yield
+            status = "ok"
+        finally:
+            self._record(phase, start, status)
+
+    def _end_step(self, status: str):
+        if self._step is not None:
+            self._record(*self._step, status)
+            self._step = None
+
+    def _record(self, phase: str, start: float, status: str):
+        # repeated phases are added up
+        duration = time.perf_counter() - start
+        self.timings[phase] = self.timings.get(phase, 0.0) + duration
+        self.emit("phase_end", phase=phase, duration=round(duration, 6), status=status)
@@ -0,0 +1,562 @@
+import inspect
+import json
+import subprocess
+from pathlib import Path
+
+# Set when running a workflow executable to only (re)build its CLI spec.
+COMPILE_CLI_SPEC_ENV = "SNK_COMPILE_CLI_SPEC"
+
+# Set to profile a run of a workflow executable, see `PROFILE_MODES`.
+PROFILE_ENV = "SNK_PROFILE"
+
+# cprofile: a cProfile of the CLI (open with `python -m pstats` or snakeviz).
+# imports: the `-X importtime` trace of the imports.
+# wall: the time spent loading the spec, importing snk_cli, building the CLI and running the command.
+PROFILE_MODES = ["cprofile", "imports", "wall"]
+
+# standard: python is started through /bin/sh and initialises sys.path as usual.
+# frozen: python runs in isolated mode without `site`, with the sys.path recorded at install time.
+SHIM_FLAVOURS = ["standard", "frozen"]
+
+# The precompiled help is rendered this wide, narrower terminals let the CLI render it.
+HELP_WIDTH = 80
+
+# The shells the workflow executables complete from the CLI spec.
+COMPLETION_SHELLS = ["bash", "zsh", "fish"]
+
+# Bumped when the layout of the CLI spec changes, older specs are rebuilt.
+SPEC_FORMAT = 1
+
+# Longer shebang lines are truncated by older kernels.
+MAX_SHEBANG_LENGTH = 127
+
+# Prints the interpreter state that `site` sets up, run in isolated mode so the
+# working directory, PYTHONPATH and the user site are not recorded.
+FREEZE_SCRIPT = """
+import json, os, site, sys
+pth_imports = []
+for site_dir in site.getsitepackages():
+    try:
+        names = sorted(name for name in os.listdir(site_dir) if name.endswith(".pth"))
+    except OSError:
+        continue
+    for name in names:
+        try:
+            with open(os.path.join(site_dir, name), encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except (OSError, UnicodeDecodeError):
+            continue
+        pth_imports += [line for line in lines if line.startswith(("import ", "import\t"))]
+print(json.dumps(dict(
+    path=[p for p in sys.path if p and os.path.exists(p)],
+    prefix=sys.prefix,
+    exec_prefix=sys.exec_prefix,
+    pth_imports=pth_imports,
+)))
+"""
+
+
+def freeze_interpreter(python_interpreter_path: Path) -> dict:
+    """
+    Record the `sys.path` (and prefixes) of an interpreter for a frozen executable.
+
+    Args:
+      python_interpreter_path (Path): The python interpreter used to run the workflow CLI.
+
+    Returns:
+      dict: The `path`, `prefix`, `exec_prefix` and the `import` lines of the `.pth` files (`pth_imports`).
+
+    Examples:
+      >>> freeze_interpreter(Path("/path/to/venv/bin/python"))["prefix"]
+      '/path/to/venv'
+    """
+    process = subprocess.run(
+        [str(python_interpreter_path), "-I", "-c", FREEZE_SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(process.stdout)
+
+
+def executable_template(
+    workflow_path: Path,
+    python_interpreter_path: Path,
+    spec_path: Path,
+    profile_dir: Path,
+    frozen: dict = None,
+) -> str:
+    """
+    Render the source of a workflow executable.
+
+    The executable answers `--help`, `--version`, `--path` and shell completion
+    from a precompiled spec (plain JSON with the rendered help and the options of
+    every command) without importing snk_cli, Typer or snakemake. Other commands
+    build the CLI with `snk_cli.CLI`. The spec is rebuilt whenever its input files
+    (the snk and snakemake config), the files in the envs, scripts and profiles
+    folders or the snk_cli sources change, e.g. after editing an editable install.
+
+    Setting `SNK_PROFILE` to one of `PROFILE_MODES` profiles the run and writes
+    the profile to `profile_dir`.
+
+    If `frozen` is given the executable runs python in isolated mode without the
+    `site` module (`-I -S`). Python then doesn't scan the site directories and
+    `.pth` files on every call, which is slow on network filesystems. The
+    `sys.path` recorded at install time is used instead (see `freeze_interpreter`).
+
+    Args:
+      workflow_path (Path): The path to the workflow directory.
+      python_interpreter_path (Path): The python interpreter used to run the workflow CLI.
+      spec_path (Path): The path to the precompiled CLI spec.
+      profile_dir (Path): The directory profiles are written to.
+      frozen (dict, optional): The interpreter state from `freeze_interpreter` for a frozen executable. Defaults to None.
+
+    Returns:
+      str: The source of the executable.
+
+    Examples:
+      >>> executable_template(
+      ...     Path("/path/to/workflow"),
+      ...     Path("/usr/bin/python"),
+      ...     Path("/path/to/.workflow.spec"),
+      ...     Path("/path/to/snk/profiles"),
+      ... )
+    """
+    profile_modes = ", ".join(PROFILE_MODES)
+    flags = ""
+    preamble = ""
+    if frozen is not None:
+        flags = " -I -S"
+        preamble = (
+            "import sys\n"
+            f"sys.path[:] = {frozen['path']!r}\n"
+            f"sys.prefix = {frozen['prefix']!r}\n"
+            f"sys.exec_prefix = {frozen['exec_prefix']!r}\n"
+        )
+        for line in frozen["pth_imports"]:
+            # run like `site` runs the import lines of .pth files
+            preamble += f"exec({line!r})\n"
+    header = inspect.cleandoc(
+        f"""
+        #!/bin/sh
+        '''exec' "{python_interpreter_path}"{flags} "$0" "$@"
+        ' '''
+        """
+    )
+    shebang = f"#!{python_interpreter_path} -IS"
+    if flags and len(shebang) <= MAX_SHEBANG_LENGTH and " " not in str(python_interpreter_path):
+        # skip starting /bin/sh, the kernel passes the flags as one argument
+        header = shebang
+    body = inspect.cleandoc(
+        f"""
+        # -*- coding: utf-8 -*-
+        import os
+        import sys
+        import time
+        from pathlib import Path
+
+        SPEC_PATH = Path("{spec_path}")
+        PROFILE_DIR = Path("{profile_dir}")
+        TIMINGS = {{}}
+
+        class timed:
+            def __init__(self, phase):
+                self.phase = phase
+
+            def __enter__(self):
+                self.start = time.perf_counter()
+
+            def __exit__(self, *exc):
+                TIMINGS[self.phase] = time.perf_counter() - self.start
+
+        def hash_files(paths):
+            import hashlib
+
+            hashes = {{}}
+            for path in paths:
+                try:
+                    hashes[str(path)] = hashlib.sha256(Path(path).read_bytes()).hexdigest()
+                except OSError:
+                    hashes[str(path)] = None
+            return hashes
+
+        def stat_files(paths):
+            stats = {{}}
+            for path in paths:
+                try:
+                    stats[str(path)] = os.stat(path).st_mtime_ns
+                except OSError:
+                    stats[str(path)] = None
+            return stats
+
+        def list_dirs(paths):
+            listings = {{}}
+            for path in paths:
+                try:
+                    listings[str(path)] = sorted(os.listdir(path))
+                except OSError:
+                    listings[str(path)] = None
+            return listings
+
+        def complete_var(prog):
+            return f"_{{prog.replace('-', '_').upper()}}_COMPLETE"
+
+        def compile_spec(workflow_dir_path):
+            import contextlib
+            import io
+            import json
+
+            # render the help at a fixed width in the 16 standard colours, the colours
+            # are stripped again when the output isn't a terminal
+            os.environ.update(FORCE_COLOR="1", TERM="xterm", TERMINAL_WIDTH="{HELP_WIDTH}")
+            for name in ("NO_COLOR", "COLORTERM"):
+                os.environ.pop(name, None)
+            import snk_cli
+            import typer
+            from snk_cli import CLI
+            from snk_cli.config.config import SnkConfig, get_config_from_workflow_dir
+
+            snk_config = SnkConfig.from_workflow_dir(workflow_dir_path, create_if_not_exists=True)
+            configfile = snk_config.configfile or get_config_from_workflow_dir(workflow_dir_path)
+            # every config file get_config_from_workflow_dir looks for, missing files are hashed
+            # as None so adding one (e.g. config/config.yaml over config.yaml) rebuilds the spec
+            inputs = [workflow_dir_path / "snk.yaml", workflow_dir_path / ".snk"] + [
+                workflow_dir_path / path
+                for path in ["config/config.yaml", "config/config.yml", "config.yaml", "config.yml"]
+            ]
+            if configfile and Path(configfile) not in inputs:
+                inputs.append(configfile)
+            # the env, script and profile commands depend on the files in these folders
+            folders = [
+                folder
+                for name in ("envs", "scripts", "profiles")
+                for folder in (workflow_dir_path / "workflow" / name, workflow_dir_path / name)
+            ]
+            # editing (e.g. an editable install) or upgrading snk_cli rebuilds the spec
+            sources = sorted(
+                os.path.join(root, name)
+                for root, _, names in os.walk(Path(snk_cli.__file__).parent)
+                for name in names
+                if name.endswith(".py")
+            )
+            prog = Path(sys.argv[0]).name
+            root = typer.main.get_command(CLI(workflow_dir_path).app)
+            commands = {{}}
+
+            def invoke(argv):
+                stdout = io.StringIO()
+                try:
+                    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(io.StringIO()):
+                        code = root.main(argv, prog_name=prog, standalone_mode=False)
+                except (Exception, SystemExit):
+                    return None
+                return stdout.getvalue() if code in (None, 0) else None
+
+            def add_command(command, ctx, path):
+                params = [
+                    param
+                    for param in command.get_params(ctx)
+                    if param.param_type_name == "option" and not param.hidden
+                ]
+                subcommands = {{}}
+                commands[" ".join(path)] = dict(
+                    help=invoke(path + ctx.help_option_names[:1]),
+                    help_options=ctx.help_option_names,
+                    options=[
+                        dict(
+                            names=param.opts + param.secondary_opts,
+                            flag=bool(param.is_flag or param.count),
+                            choices=[str(getattr(c, "value", c)) for c in getattr(param.type, "choices", [])],
+                            help=param.help or "",
+                        )
+                        for param in params
+                    ],
+                    commands=subcommands,
+                )
+                for name in command.list_commands(ctx) if hasattr(command, "list_commands") else []:
+                    subcommand = command.get_command(ctx, name)
+                    if subcommand is None or subcommand.hidden:
+                        continue
+                    subcommands[name] = subcommand.get_short_help_str()
+                    settings = subcommand.context_settings
+                    subctx = subcommand.context_class(subcommand, info_name=name, parent=ctx, **settings)
+                    add_command(subcommand, subctx, path + [name])
+                return params
+
+            ctx = root.context_class(root, info_name=prog, **root.context_settings)
+            outputs = {{"": invoke([])}}
+            # e.g. --version, the eager flags of subcommands (run --help-snakemake) can run other programs
+            for param in add_command(root, ctx, []):
+                if param.is_eager and param.is_flag:
+                    for name in set(param.opts) - set(ctx.help_option_names):
+                        outputs[name] = invoke([name])
+            try:
+                from typer._completion_shared import get_completion_script
+
+                completion = {{
+                    shell: get_completion_script(prog_name=prog, complete_var=complete_var(prog), shell=shell)
+                    for shell in {COMPLETION_SHELLS!r}
+                }}
+            except Exception:
+                completion = {{}}
+            spec = dict(
+                format={SPEC_FORMAT},
+                prog=prog,
+                snk_cli=stat_files(sources),
+                inputs=hash_files(inputs),
+                folders=list_dirs(folders),
+                outputs=outputs,
+                commands=commands,
+                completion=completion,
+            )
+            tmp_path = SPEC_PATH.with_name(f"{{SPEC_PATH.name}}.{{os.getpid()}}.tmp")
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(spec, f, ensure_ascii=False)
+                os.replace(tmp_path, SPEC_PATH)
+            except OSError:
+                pass
+            return spec
+
+        def load_spec():
+            import json
+
+            try:
+                with open(SPEC_PATH, encoding="utf-8") as f:
+                    spec = json.load(f)
+            except (OSError, ValueError):
+                return None
+            return spec if spec.get("format") == {SPEC_FORMAT} else None
+
+        def is_fresh(spec):
+            return (
+                hash_files(spec["inputs"]) == spec["inputs"]
+                and list_dirs(spec["folders"]) == spec["folders"]
+                and stat_files(spec["snk_cli"]) == spec["snk_cli"]
+            )
+
+        def recompile_spec():
+            import subprocess
+
+            env = {{k: v for k, v in os.environ.items() if k != "{PROFILE_ENV}"}}
+            env["{COMPILE_CLI_SPEC_ENV}"] = "1"
+            flags = ["-I", "-S"] if sys.flags.no_site else []
+            command = [sys.executable, *flags, __file__]
+            subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return load_spec()
+
+        def split_arg_string(string):
+            import shlex
+
+            lex = shlex.shlex(string, posix=True)
+            lex.whitespace_split = True
+            lex.commenters = ""
+            words = []
+            try:
+                for word in lex:
+                    words.append(word)
+            except ValueError:
+                # an unclosed quote, complete the partial word
+                words.append(lex.token)
+            return words
+
+        def completion_args(shell):
+            if shell == "bash":
+                words = split_arg_string(os.environ.get("COMP_WORDS", ""))
+                cword = int(os.environ.get("COMP_CWORD", len(words)))
+                return words[1:cword], words[cword] if cword < len(words) else ""
+            line = os.environ.get("_TYPER_COMPLETE_ARGS", "")
+            args = split_arg_string(line)[1:]
+            if args and not line.endswith(" "):
+                return args[:-1], args[-1]
+            return args, ""
+
+        def completions(spec, args, incomplete):
+            path = []
+            command = spec["commands"][""]
+            option = None
+            for arg in args:
+                if option is not None:
+                    # the value of the previous option
+                    option = None
+                    continue
+                matches = [o for o in command["options"] if arg.split("=", 1)[0] in o["names"]]
+                if matches:
+                    option = None if matches[0]["flag"] or "=" in arg else matches[0]
+                elif arg in command["commands"]:
+                    path.append(arg)
+                    command = spec["commands"][" ".join(path)]
+            if option is not None:
+                return [(choice, "") for choice in option["choices"] if choice.startswith(incomplete)]
+            if incomplete.startswith("-"):
+                return [
+                    (name, o["help"])
+                    for o in command["options"]
+                    for name in o["names"]
+                    if name.startswith(incomplete)
+                ]
+            return [(name, h) for name, h in command["commands"].items() if name.startswith(incomplete)]
+
+        def zsh_escape(s):
+            for char, escaped in [('"', '""'), ("'", "''"), ("$", r"\\$"), ("`", r"\\`"), (":", r"\\\\:")]:
+                s = s.replace(char, escaped)
+            return s
+
+        def complete(spec, instruction):
+            # the protocol of the Typer completion scripts, e.g. _WORKFLOW_COMPLETE=complete_bash
+            action, _, shell = instruction.partition("_")
+            if action == "source" and shell in spec["completion"]:
+                print(spec["completion"][shell])
+                return 0
+            if action != "complete" or shell not in {COMPLETION_SHELLS!r}:
+                return None
+            items = completions(spec, *completion_args(shell))
+            if shell == "bash":
+                print("\\n".join(value for value, _ in items))
+            elif shell == "zsh":
+                if items:
+                    values = "\\n".join(
+                        f'"{{zsh_escape(v)}}":"{{zsh_escape(h)}}"' if h else f'"{{zsh_escape(v)}}"'
+                        for v, h in items
+                    )
+                    print(f"_arguments '*: :(({{values}}))'")
+                else:
+                    print("_files")
+            elif os.environ.get("_TYPER_COMPLETE_FISH_ACTION") == "is-args":
+                return 0 if items else 1
+            else:
+                print("\\n".join(f"{{v}}\\t{{' '.join(h.split())}}" if h else v for v, h in items))
+            return 0
+
+        def print_output(output):
+            import re
+
+            tty = sys.stdout.isatty()
+            if tty and terminal_columns() < {HELP_WIDTH} or os.environ.get("TERMINAL_WIDTH"):
+                # the precompiled help doesn't fit, let the CLI render it
+                return None
+            if not tty or os.environ.get("NO_COLOR") or os.environ.get("TERM") == "dumb":
+                output = re.sub(r"\\x1b\\[[0-9;]*m", "", output)
+            sys.stdout.write(output)
+            return 0
+
+        def terminal_columns():
+            try:
+                return os.get_terminal_size(sys.stdout.fileno()).columns
+            except (OSError, ValueError):
+                return {HELP_WIDTH}
+
+        def precompiled_output(spec, argv):
+            # the output of the eager flags of the CLI (e.g. -v) and of the help of every command
+            if len(argv) < 2 and "".join(argv) in spec["outputs"]:
+                return spec["outputs"]["".join(argv)]
+            path = []
+            for name in argv[:-1]:
+                if name not in spec["commands"][" ".join(path)]["commands"]:
+                    return None
+                path.append(name)
+            command = spec["commands"][" ".join(path)]
+            return command["help"] if argv[-1] in command["help_options"] else None
+
+        # answers --help, --version and shell completion from the spec without importing
+        # snk_cli, returns None if the CLI has to answer
+        def answer_from_spec(argv):
+            prog = Path(sys.argv[0]).name
+            instruction = os.environ.get(complete_var(prog))
+            spec = load_spec()
+            if spec is None:
+                # only compile the spec for calls it can answer
+                if not (instruction or not argv or argv[-1].startswith("-")):
+                    return None
+                spec = recompile_spec()
+            elif spec["prog"] != prog or not instruction and precompiled_output(spec, argv) is None:
+                return None
+            elif not is_fresh(spec):
+                spec = recompile_spec()
+            if spec is None or spec["prog"] != prog:
+                return None
+            if instruction:
+                return complete(spec, instruction)
+            output = precompiled_output(spec, argv)
+            return None if output is None else print_output(output)
+
+        def create_cli(p):
+            workflow_dir_path = Path(p)
+            if os.environ.get("{COMPILE_CLI_SPEC_ENV}"):
+                compile_spec(workflow_dir_path)
+                return
+            with timed("spec"):
+                code = answer_from_spec(sys.argv[1:])
+            if code is not None:
+                return code
+            with timed("import"):
+                from snk_cli import CLI
+            with timed("cli"):
+                cli = CLI(workflow_dir_path)
+            with timed("dispatch"):
+                cli()
+
+        def profile_path(mode, suffix):
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            name = Path(sys.argv[0]).name
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            return PROFILE_DIR / f"{{name}}-{{stamp}}-{{os.getpid()}}-{{mode}}.{{suffix}}"
+
+        def profile_imports(path):
+            import subprocess
+
+            env = {{k: v for k, v in os.environ.items() if k != "{PROFILE_ENV}"}}
+            flags = ["-I", "-S"] if sys.flags.no_site else []
+            command = [sys.executable, *flags, "-X", "importtime", __file__] + sys.argv[1:]
+            process = subprocess.Popen(command, env=env, stderr=subprocess.PIPE, text=True)
+            with open(path, "w") as f:
+                for line in process.stderr:
+                    if line.startswith("import time:"):
+                        f.write(line)
+                    else:
+                        sys.stderr.write(line)
+            return process.wait()
+
+        def profile_cli(mode, p):
+            if mode == "imports":
+                path = profile_path(mode, "txt")
+                try:
+                    return profile_imports(path)
+                finally:
+                    print(f"snk: profile written to {{path}}", file=sys.stderr)
+            if mode == "cprofile":
+                import cProfile
+
+                path = profile_path(mode, "prof")
+                profiler = cProfile.Profile()
+                try:
+                    return profiler.runcall(create_cli, p)
+                finally:
+                    profiler.dump_stats(path)
+                    print(f"snk: profile written to {{path}}", file=sys.stderr)
+            if mode == "wall":
+                import json
+
+                path = profile_path(mode, "json")
+                start = time.perf_counter()
+                try:
+                    return create_cli(p)
+                finally:
+                    TIMINGS["total"] = time.perf_counter() - start
+                    profile = dict(argv=sys.argv, python=sys.executable, timings=TIMINGS)
+                    path.write_text(json.dumps(profile, indent=2))
+                    print(f"snk: profile written to {{path}}", file=sys.stderr)
+            print(f"snk: unknown {PROFILE_ENV} mode '{{mode}}' (use {profile_modes})", file=sys.stderr)
+            return create_cli(p)
+
+        if __name__ == "__main__":
+            for suffix in ("-script.pyw", ".exe"):
+                if sys.argv[0].endswith(suffix):
+                    sys.argv[0] = sys.argv[0][: -len(suffix)]
+            if os.environ.get("{PROFILE_ENV}") and not os.environ.get("{COMPILE_CLI_SPEC_ENV}"):
+                sys.exit(profile_cli(os.environ["{PROFILE_ENV}"], "{workflow_path}"))
+            sys.exit(create_cli("{workflow_path}"))
+
+        """
+    )
+    return f"{header}\n{preamble}{body}"
@@ -0,0 +1,63 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+
+# venv: a venv no installed workflow uses (or left over from an interrupted install).
+# prepared: a venv prepared by an install that is gone.
+# reference: a reference of a workflow that is not installed on a shared venv.
+# stage: the staging directory of an install that is gone.
+# executable: a workflow executable or CLI spec in SNK_HOME/bin without a workflow.
+# link: a symlink in SNK_BIN to a missing workflow executable.
+# repo: the sparse repo of a subdirectory install without a workflow.
+# mirror: a git mirror that no installed workflow was installed from.
+# registry: a registry entry without a workflow.
+# trash: a discarded path that was not deleted yet.
+# blob: a file in the dedupe store no workflow links to.
+GARBAGE_KINDS = [
+    "venv",
+    "prepared",
+    "reference",
+    "stage",
+    "executable",
+    "link",
+    "repo",
+    "mirror",
+    "registry",
+    "trash",
+    "blob",
+]
+
+
+@dataclass
+class Garbage:
+    """
+    A path in SNK_HOME (or SNK_BIN) that no installed workflow needs.
+
+    Attributes:
+      path (Path): The path to delete.
+      kind (str): What the path is, see `GARBAGE_KINDS`.
+      size (int): The bytes deleting the path reclaims. Defaults to 0.
+    """
+
+    path: Path
+    kind: str
+    size: int = 0
+
+
+def measure(garbage: List[Garbage]) -> List[Garbage]:
+    """
+    Set the sizes of garbage paths (see `snk.du.DiskUsage`).
+
+    Args:
+      garbage (List[Garbage]): The garbage to measure.
+
+    Returns:
+      List[Garbage]: The measured garbage.
+    """
+    from .du import DiskUsage
+
+    usage = DiskUsage()
+    usage.scan(item.path for item in garbage)
+    for item in garbage:
+        item.size = usage.size([item.path])
+    return garbage
@@ -0,0 +1,213 @@
+import os
+import shutil
+import subprocess
+import sys
+import venv
+from pathlib import Path
+from typing import List
+
+INSTALLERS = ["auto", "uv", "pip"]
+
+
+class Installer:
+    """
+    Creates virtual environments and installs packages into them.
+
+    Packages are installed with the wheels in the wheelhouse of SNK_HOME as an
+    additional package source.
+
+    Args:
+      wheelhouse (Path): The path to the wheelhouse.
+    """
+
+    name = None
+
+    def __init__(self, wheelhouse: Path) -> None:
+        self.wheelhouse = Path(wheelhouse)
+
+    def create(self, venv_path: Path, python: Path, with_pip: bool = True):
+        """
+        Create a virtual environment.
+
+        Args:
+          venv_path (Path): The path to the virtual environment. Must not exist.
+          python (Path): The python interpreter of the virtual environment.
+          with_pip (bool, optional): Install pip in the environment if the installer needs it. Defaults to True.
+        """
+        raise NotImplementedError
+
+    def install(self, venv_path: Path, requirements: List[str], offline: bool = False):
+        """
+        Install packages in a virtual environment.
+
+        Args:
+          venv_path (Path): The path to the virtual environment.
+          requirements (List[str]): The pip requirements to install.
+          offline (bool, optional): Only install from the wheelhouse (and cache). Defaults to False.
+        """
+        raise NotImplementedError
+
+    def prefetch(self, venv_path: Path, requirements: List[str]):
+        """
+        Download packages ahead of an install, e.g. while a workflow is downloaded.
+
+        Args:
+          venv_path (Path): The path to the virtual environment.
+          requirements (List[str]): The pip requirements to download.
+        """
+
+    def _offline_error(self, e: Exception) -> Exception:
+        return Exception(
+            f"Failed to install snk_cli in virtual environment offline, a wheel is missing from the wheelhouse ({self.wheelhouse}). Error: {e}"
+        )
+
+
+class PipInstaller(Installer):
+    """
+    Installs packages with pip in the virtual environment.
+
+    Wheels are resolved and built into the wheelhouse, so installs only contact
+    the package index when the wheelhouse is missing a wheel.
+    """
+
+    name = "pip"
+
+    def create(self, venv_path: Path, python: Path, with_pip: bool = True):
+        venv.create(venv_path, with_pip=with_pip, symlinks=True)
+
+    def _pip(self, venv_path: Path) -> list:
+        if sys.platform.startswith("win"):
+            pip_path = venv_path / "Scripts" / "pip.exe"
+            python_path = venv_path / "Scripts" / "python.exe"
+        else:
+            pip_path = venv_path / "bin" / "pip"
+            python_path = venv_path / "bin" / "python"
+        if pip_path.exists():
+            return [pip_path]
+        if python_path.exists():
+            # environments layered over another environment import its pip
+            return [python_path, "-m", "pip"]
+        raise FileNotFoundError(f"pip not found at {pip_path}")
+
+    def _wheel_command(self, pip: list, requirements: List[str]) -> list:
+        wheelhouse = str(self.wheelhouse)
+        return (
+            pip
+            + ["wheel", "--wheel-dir", wheelhouse, "--find-links", wheelhouse]
+            + list(requirements)
+        )
+
+    def install(self, venv_path: Path, requirements: List[str], offline: bool = False):
+        pip = self._pip(venv_path)
+        self.wheelhouse.mkdir(parents=True, exist_ok=True)
+        install_from_wheelhouse = (
+            pip
+            + [
+                "install",
+                "--no-index",
+                "--find-links",
+                str(self.wheelhouse),
+            ]
+            + list(requirements)
+        )
+        if offline:
+            try:
+                subprocess.run(install_from_wheelhouse, check=True)
+            except subprocess.CalledProcessError as e:
+                raise self._offline_error(e)
+            return
+        # only resolve against the index when the wheelhouse is missing a wheel
+        if subprocess.run(install_from_wheelhouse, capture_output=True).returncode == 0:
+            return
+        try:
+            subprocess.run(self._wheel_command(pip, requirements), check=True)
+            subprocess.run(install_from_wheelhouse, check=True)
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"Failed to install snk_cli in virtual environment. Error: {e}")
+
+    def prefetch(self, venv_path: Path, requirements: List[str]):
+        self.wheelhouse.mkdir(parents=True, exist_ok=True)
+        # failures are retried (and reported) by the final install
+        try:
+            pip = self._pip(venv_path)
+        except FileNotFoundError:
+            return
+        subprocess.run(self._wheel_command(pip, requirements), capture_output=True)
+
+
+class UvInstaller(Installer):
+    """
+    Installs packages with uv.
+
+    uv resolves and installs much faster than pip and keeps a global cache that
+    is shared by every virtual environment, so no wheels are built into the
+    wheelhouse (existing wheels are still used).
+
+    Args:
+      wheelhouse (Path): The path to the wheelhouse.
+      uv (str): The path to the uv executable.
+    """
+
+    name = "uv"
+
+    def __init__(self, wheelhouse: Path, uv: str) -> None:
+        super().__init__(wheelhouse)
+        self.uv = uv
+
+    def create(self, venv_path: Path, python: Path, with_pip: bool = True):
+        # uv installs without pip in the environment
+        if venv_path.exists():
+            raise FileExistsError(venv_path)
+        subprocess.run(
+            [self.uv, "venv", "--quiet", "--python", str(python), str(venv_path)],
+            check=True,
+            capture_output=True,
+        )
+
+    def install(self, venv_path: Path, requirements: List[str], offline: bool = False):
+        if sys.platform.startswith("win"):
+            python = venv_path / "Scripts" / "python.exe"
+        else:
+            python = venv_path / "bin" / "python"
+        command = [self.uv, "pip", "install", "--python", str(python)]
+        if self.wheelhouse.exists():
+            command += ["--find-links", str(self.wheelhouse)]
+        if offline:
+            command.append("--offline")
+        try:
+            subprocess.run(command + list(requirements), check=True)
+        except subprocess.CalledProcessError as e:
+            if offline:
+                raise self._offline_error(e)
+            raise Exception(f"Failed to install snk_cli in virtual environment. Error: {e}")
+
+
+def get_installer(name: str = None, wheelhouse: Path = None) -> Installer:
+    """
+    Select the backend that builds isolated environments.
+
+    Args:
+      name (str, optional): One of "auto", "uv" or "pip". Defaults to `$SNK_INSTALLER` or "auto".
+        "auto" uses uv if it is on the PATH and pip otherwise.
+      wheelhouse (Path, optional): The path to the wheelhouse. Defaults to None.
+
+    Returns:
+      Installer: The installer backend.
+
+    Raises:
+      ValueError: If the installer is unknown or uv is requested but not on the PATH.
+
+    Examples:
+      >>> get_installer("auto", Path("/path/to/snk/wheelhouse")).name
+      'uv'
+    """
+    name = (name or os.environ.get("SNK_INSTALLER") or "auto").lower()
+    if name not in INSTALLERS:
+        raise ValueError(f"Unknown installer '{name}'. Choose from: {', '.join(INSTALLERS)}")
+    if name in ["auto", "uv"]:
+        uv = shutil.which("uv")
+        if uv:
+            return UvInstaller(wheelhouse, uv)
+        if name == "uv":
+            raise ValueError("The uv installer was requested but uv was not found on the PATH.")
+    return PipInstaller(wheelhouse)
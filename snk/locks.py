@@ -0,0 +1,305 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+from .errors import LockTimeoutError
+from .trash import pid_is_running
+
+# Seconds to wait for a lock before giving up (unset: wait until it is released).
+LOCK_TIMEOUT_ENV = "SNK_LOCK_TIMEOUT"
+
+# Held locks are touched this often (seconds) to show their owner is alive.
+HEARTBEAT_INTERVAL = 10
+
+# Locks not touched for this long (seconds) are stale, e.g. held by a process on
+# another host that crashed.
+STALE_AFTER = 120
+
+
+class _Heartbeat:
+    """Touches the lock files and other paths in use by this process from a daemon thread."""
+
+    def __init__(self) -> None:
+        self._paths = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, path: Path):
+        with self._lock:
+            self._paths.add(path)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def discard(self, path: Path):
+        with self._lock:
+            self._paths.discard(path)
+
+    @contextmanager
+    def touching(self, path: Path):
+        """Touch a path while in the context."""
+        self.add(path)
+        try:
+            yield path
+        finally:
+            self.discard(path)
+
+    def _run(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self._lock:
+                paths = list(self._paths)
+            for path in paths:
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+
+
+heartbeat = _Heartbeat()
+
+
+def owner_tag() -> str:
+    """
+    Get the `<pid>@<host>` tag of this process.
+
+    Paths a process works in (staging directories, prepared venvs, partial
+    mirrors and trash claims) are named with its tag and touched by the
+    heartbeat while in use, so other processes can tell if it is gone (see
+    `owner_is_alive`).
+
+    Returns:
+      str: The tag, the host only contains letters, digits and underscores.
+    """
+    host = "".join(c if c.isalnum() else "_" for c in socket.gethostname())
+    return f"{os.getpid()}@{host}"
+
+
+def owner_is_alive(tag: str, path: Path) -> bool:
+    """
+    Check if the process that tagged a path may still be using it.
+
+    Processes on this host are checked by pid. Processes on another host are
+    alive until the path was not touched for `STALE_AFTER` seconds.
+
+    Args:
+      tag (str): The `<pid>@<host>` tag, tags without a host are from this host.
+      path (Path): The tagged path.
+
+    Returns:
+      bool: False if the process is gone, True if the tag is not a tag.
+    """
+    pid, _, host = tag.partition("@")
+    if not pid.isdigit():
+        return True
+    if not host or host == owner_tag().partition("@")[2]:
+        return pid_is_running(int(pid))
+    try:
+        return time.time() - os.lstat(path).st_mtime <= STALE_AFTER
+    except FileNotFoundError:
+        return False
+
+
+class FileLock:
+    """
+    A lock shared between processes (and hosts) through a lock file.
+
+    The lock file is created with `O_EXCL`, so only one process can hold it, and
+    records the pid and host of its owner. The owner touches it every
+    `HEARTBEAT_INTERVAL` seconds. A lock is stale if its owner is a process on
+    this host that is gone, or if it was not touched for `STALE_AFTER` seconds.
+    Stale locks are broken by the next process that wants them.
+
+    The lock is reentrant and also excludes the other threads of this process.
+
+    Args:
+      path (Path): The path to the lock file.
+      timeout (float, optional): Seconds to wait for the lock before raising `LockTimeoutError`. Defaults to None (wait).
+      description (str, optional): What the lock guards, used in errors. Defaults to the name of the lock file.
+      poll_interval (float, optional): Seconds between attempts to take the lock. Defaults to 0.05.
+
+    Examples:
+      >>> with FileLock(Path("/path/to/snk/.locks/workflow-example.lock")):
+      ...     pass
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        timeout: float = None,
+        description: str = None,
+        poll_interval: float = 0.05,
+    ) -> None:
+        self.path = Path(path)
+        self.timeout = timeout
+        self.description = description or self.path.name
+        self.poll_interval = poll_interval
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._token = None
+
+    def owner(self) -> Optional[Dict]:
+        """
+        Read the owner of the lock.
+
+        Returns:
+          Optional[Dict]: The `pid`, `host` and `time` the lock was taken, None if it is not held.
+        """
+        try:
+            return _read_lock(self.path)
+        except FileNotFoundError:
+            return None
+
+    def is_stale(self, owner: Dict) -> bool:
+        """
+        Check if a lock was left behind by an owner that is gone.
+
+        Args:
+          owner (Dict): The owner of the lock (see `owner`).
+
+        Returns:
+          bool: True if the owner is gone.
+        """
+        if owner.get("host") == socket.gethostname() and isinstance(owner.get("pid"), int):
+            if not pid_is_running(owner["pid"]):
+                return True
+        return time.time() - owner.get("mtime", time.time()) > STALE_AFTER
+
+    def acquire(self, timeout: float = -1):
+        """
+        Take the lock, waiting for other processes to release it.
+
+        Args:
+          timeout (float, optional): Seconds to wait. Defaults to the timeout of the lock.
+
+        Raises:
+          LockTimeoutError: If the lock was not released in time.
+        """
+        if timeout == -1:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if timeout is None:
+            acquired = self._thread_lock.acquire()
+        elif timeout <= 0:
+            acquired = self._thread_lock.acquire(blocking=False)
+        else:
+            acquired = self._thread_lock.acquire(timeout=timeout)
+        if not acquired:
+            raise LockTimeoutError(
+                f"Timed out waiting for {self.description} (held in this process)"
+            )
+        if self._depth:
+            self._depth += 1
+            return
+        try:
+            while not self._create():
+                owner = self.owner()
+                if owner is not None and self.is_stale(owner):
+                    self._break(owner)
+                    continue
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise LockTimeoutError(
+                        f"Timed out waiting for {self.description}, {_describe(owner)}"
+                    )
+                time.sleep(self.poll_interval)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._depth = 1
+        heartbeat.add(self.path)
+
+    def release(self):
+        """
+        Release the lock.
+        """
+        self._depth -= 1
+        if self._depth == 0:
+            heartbeat.discard(self.path)
+            try:
+                if _read_lock(self.path).get("token") == self._token:
+                    os.unlink(self.path)
+            except (FileNotFoundError, ValueError):
+                pass
+        self._thread_lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def _create(self) -> bool:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        self._token = uuid.uuid4().hex
+        owner = {
+            "pid": os.getpid(),
+            "host": socket.gethostname(),
+            "time": time.time(),
+            "token": self._token,
+        }
+        with os.fdopen(fd, "w") as f:
+            json.dump(owner, f)
+        return True
+
+    def _break(self, owner: Dict):
+        # move the lock out of the way first so only one process breaks it
+        broken = self.path.with_name(f"{self.path.name}.{uuid.uuid4().hex}.stale")
+        try:
+            os.rename(self.path, broken)
+        except FileNotFoundError:
+            return
+        try:
+            if _read_lock(broken).get("token") != owner.get("token"):
+                # taken by another process since it was found stale, put it back
+                try:
+                    os.link(broken, self.path)
+                except OSError:
+                    pass
+        except (OSError, ValueError):
+            pass
+        finally:
+            try:
+                os.unlink(broken)
+            except FileNotFoundError:
+                pass
+
+
+def _read_lock(path: Path) -> Dict:
+    mtime = os.stat(path).st_mtime
+    try:
+        with open(path) as f:
+            owner = json.load(f)
+    except ValueError:
+        # being written, or its owner crashed while writing it
+        owner = {}
+    owner["mtime"] = mtime
+    return owner
+
+
+def _describe(owner: Optional[Dict]) -> str:
+    if not owner or "pid" not in owner:
+        return "held by another process"
+    since = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(owner.get("time", 0)))
+    return f"held by pid {owner['pid']} on {owner.get('host')} since {since}"
+
+
+def default_lock_timeout() -> Optional[float]:
+    """
+    Get the lock timeout from the environment (`SNK_LOCK_TIMEOUT`).
+
+    Returns:
+      Optional[float]: The timeout in seconds, None to wait until locks are released.
+    """
+    value = os.environ.get(LOCK_TIMEOUT_ENV)
+    return float(value) if value else None
@@ -1,13 +1,13 @@
+import json
+import threading
 from pathlib import Path
 from types import SimpleNamespace
 from typing import List, Optional
 
 import typer
-from rich.progress import Progress, SpinnerColumn, TextColumn
-from snk_cli.config import SnkConfig
 
 from .__about__ import __version__
-from .errors import WorkflowExistsError, WorkflowNotFoundError
+from .errors import LockTimeoutError, WorkflowExistsError, WorkflowNotFoundError
 from .nest import Nest
 from .utils import open_text_editor
 
@@ -76,8 +76,8 @@ callback.__doc__ += f"\b\n\nA Snakemake Workflow Management System ({__version__
 @app.command()
 def install(
     ctx: typer.Context,
-    workflow: str = typer.Argument(
-        ..., help="Path, URL or Github name (user/repo) of the workflow to install."
+    workflow: Optional[str] = typer.Argument(
+        None, help="Path, URL or Github name (user/repo) of the workflow to install."
     ),
     name: Optional[str] = typer.Option(
         None,
@@ -115,6 +115,20 @@ def install(
         "-d",
         help="Additional pip dependencies to install with the workflow.",
     ),
+    layered: bool = typer.Option(
+        False,
+        "--layered",
+        help="Install the dependencies in a thin layer over a shared Snakemake environment.",
+    ),
+    offline: bool = typer.Option(
+        False,
+        "--offline",
+        help="Only install packages from the wheelhouse in SNK_HOME (fails if a wheel is missing).",
+    ),
+    subdir: Optional[Path] = typer.Option(
+        None,
+        help="Subdirectory of the repository containing the workflow. Only this subtree is checked out.",
+    ),
     config: Optional[Path] = typer.Option(None, help="Specify a non-standard config location."),
     snakefile: Optional[Path] = typer.Option(
         None, help="Specify a non-standard Snakefile location."
@@ -137,23 +151,94 @@ def install(
         "-e",
         help="Whether to install the workflow in editable mode.",
     ),
+    requirements: Optional[Path] = typer.Option(
+        None,
+        "--requirements",
+        "-r",
+        exists=True,
+        dir_okay=False,
+        help="Install the workflows listed in a YAML manifest.",
+    ),
+    jobs: int = typer.Option(
+        4, "--jobs", "-j", min=1, help="Number of workflows to install at the same time (with -r)."
+    ),
+    installer: str = typer.Option(
+        "auto",
+        "--installer",
+        envvar="SNK_INSTALLER",
+        help="Backend that builds isolated environments: auto (uv if it is on the PATH), uv or pip.",
+    ),
+    shim: str = typer.Option(
+        "standard",
+        "--shim",
+        envvar="SNK_SHIM",
+        help="Workflow executable flavour: standard or frozen (isolated python with the sys.path recorded at install, faster on network filesystems).",
+    ),
+    dedupe: bool = typer.Option(
+        False,
+        "--dedupe",
+        envvar="SNK_DEDUPE",
+        help="Store files identical to files of other workflows once (hardlinked, see snk dedupe).",
+    ),
+    timings: bool = typer.Option(
+        False, "--timings", help="Show how long each phase of the install took."
+    ),
+    json_events: bool = typer.Option(
+        False,
+        "--json-events",
+        help="Stream the install events (phases and durations) to stdout as JSON lines.",
+    ),
 ):
     """
     Install a workflow.
     """
-    nest = Nest(snk_home=ctx.obj.snk_home, bin_dir=ctx.obj.snk_bin)
+    from rich.progress import Progress, SpinnerColumn, TextColumn
+
+    nest = Nest(snk_home=ctx.obj.snk_home, bin_dir=ctx.obj.snk_bin, installer=installer)
     if not nest.bin_dir_in_path():
         bin_dir_yellow = typer.style(nest.bin_dir, fg=typer.colors.YELLOW, bold=False)
-        typer.echo(f"Please add SNK_BIN to your $PATH: {bin_dir_yellow}")
-    if not Path(workflow).exists() and not workflow.startswith("http"):
-        workflow = f"https://github.com/{workflow}.git"
+        typer.echo(f"Please add SNK_BIN to your $PATH: {bin_dir_yellow}", err=json_events)
+    if (workflow is None) == (requirements is None):
+        typer.secho("Specify either a workflow or a manifest (-r).", fg="red", err=True)
+        raise typer.Exit(1)
+    events = []
+    lock = threading.Lock()
+
+    def on_event(event: dict):
+        with lock:
+            events.append(event)
+            if json_events:
+                typer.echo(json.dumps(event))
+        if event["event"] == "phase_start" and progress is not None:
+            progress.update(task, description=f"Installing ({event['phase']})...")
+
+    progress = task = None
+    if requirements:
+        defaults = dict(
+            force=force,
+            conda=not no_conda,
+            isolate=isolate,
+            offline=offline,
+            layered=layered,
+            on_event=on_event,
+            shim=shim,
+            dedupe=dedupe,
+        )
+        try:
+            _install_manifest(nest, requirements, defaults, jobs, quiet=json_events)
+        finally:
+            if timings:
+                _print_timings(events)
+        return
+    workflow = _format_workflow(workflow)
     try:
         with Progress(
             SpinnerColumn(),
             TextColumn("[progress.description]{task.description}"),
             transient=True,
+            disable=json_events,
         ) as progress:
-            progress.add_task(description="Installing...", total=None)
+            task = progress.add_task(description="Installing...", total=None)
             installed_workflow = nest.install(
                 workflow,
                 editable=editable,
@@ -168,6 +253,12 @@ def install(
                 snakemake_version=snakemake_version,
                 dependencies=dependencies,
                 isolate=isolate,
+                offline=offline,
+                subdir=subdir,
+                layered=layered,
+                on_event=on_event,
+                shim=shim,
+                dedupe=dedupe,
             )
     except WorkflowExistsError as e:
         typer.secho(
@@ -179,11 +270,115 @@ def install(
     except Exception as e:
         typer.secho(e, fg="red", err=True)
         raise typer.Exit(1)
-
-    snk_config = SnkConfig.from_workflow_dir(installed_workflow.path, create_if_not_exists=True)
-    version = snk_config.version
-    version_str = f" ({version})" if version else ""
+    finally:
+        if timings:
+            _print_timings(events)
+    if json_events:
+        return
+    entry = nest.registry.get(installed_workflow.name)
+    version_str = f" ({entry.version})" if entry.version else ""
     typer.secho(f"Successfully installed {installed_workflow.name}{version_str}!", fg="green")
+    if entry.venv:
+        metadata = nest.virtual_environment_metadata(entry.venv)
+        typer.echo(f"Isolated environment built with {metadata.get('installer', 'pip')}.")
+
+
+def _print_timings(events: List[dict]):
+    """
+    Print the time each phase of the installs took.
+
+    Args:
+      events (List[dict]): The install events, see `snk.events.InstallEvents`.
+    """
+    from rich.console import Console
+    from rich.table import Table
+
+    table = Table("Workflow", "Phase", "Seconds", show_header=True)
+    for event in events:
+        if event["event"] != "install_end":
+            continue
+        label = event["name"] or event["workflow"]
+        for phase, duration in event["timings"].items():
+            table.add_row(label, phase, f"{duration:.2f}")
+        table.add_row(label, "[bold]total[/bold]", f"[bold]{event['duration']:.2f}[/bold]")
+    Console(stderr=True).print(table)
+
+
+def _format_workflow(workflow: str) -> str:
+    if not Path(workflow).exists() and not workflow.startswith("http"):
+        workflow = f"https://github.com/{workflow}.git"
+    return workflow
+
+
+def _read_manifest(path: Path) -> List[dict]:
+    """
+    Read the workflows listed in a YAML manifest.
+
+    The manifest is a list of workflows (or a mapping with a `workflows` list). Each
+    entry is either the path, URL or Github name of a workflow, or a mapping of
+    `Nest.install` arguments with the workflow under the `workflow` key.
+
+    Args:
+      path (Path): The path to the manifest.
+
+    Returns:
+      List[dict]: The `Nest.install` arguments of each workflow.
+    """
+    import yaml
+
+    with open(path) as f:
+        manifest = yaml.safe_load(f) or []
+    if isinstance(manifest, dict):
+        manifest = manifest.get("workflows", [])
+    workflows = []
+    for entry in manifest:
+        if isinstance(entry, str):
+            entry = {"workflow": entry}
+        if not isinstance(entry, dict) or "workflow" not in entry:
+            raise ValueError(f"Invalid manifest entry in {path}: {entry}")
+        entry = dict(entry)
+        entry["workflow"] = _format_workflow(str(entry["workflow"]))
+        workflows.append(entry)
+    return workflows
+
+
+def _install_manifest(nest: Nest, path: Path, defaults: dict, jobs: int, quiet: bool = False):
+    from rich.progress import Progress, SpinnerColumn, TextColumn
+
+    try:
+        workflows = [{**defaults, **entry} for entry in _read_manifest(path)]
+    except Exception as e:
+        typer.secho(e, fg="red", err=True)
+        raise typer.Exit(1)
+    labels = [w.get("name") or w["workflow"] for w in workflows]
+    with Progress(
+        SpinnerColumn(finished_text="•"),
+        TextColumn("[progress.description]{task.description}"),
+        disable=quiet,
+    ) as progress:
+        tasks = [
+            progress.add_task(description=f"Installing {label}...", total=1) for label in labels
+        ]
+
+        def report(index, result):
+            if isinstance(result, Exception):
+                description = f"[red]Failed to install {labels[index]}[/red]"
+            else:
+                description = f"[green]Installed {result.name}[/green]"
+            progress.update(tasks[index], description=description, completed=1)
+
+        results = nest.install_many(workflows, max_workers=jobs, callback=report)
+    failed = [(label, r) for label, r in zip(labels, results) if isinstance(r, Exception)]
+    for label, error in failed:
+        typer.secho(f"{label}: {error}", fg="red", err=True)
+    installed = len(results) - len(failed)
+    if not quiet:
+        typer.secho(
+            f"Successfully installed {installed} of {len(results)} workflows.",
+            fg="red" if failed else "green",
+        )
+    if failed:
+        raise typer.Exit(1)
 
 
 @app.command()
@@ -200,7 +395,7 @@ def uninstall(
     nest = Nest(snk_home=ctx.obj.snk_home, bin_dir=ctx.obj.snk_bin)
     try:
         uninstalled = nest.uninstall(name, force=force)
-    except WorkflowNotFoundError as e:
+    except (WorkflowNotFoundError, LockTimeoutError) as e:
         typer.secho(e, fg="red")
         raise typer.Exit(1)
     if uninstalled:
@@ -211,6 +406,9 @@ def uninstall(
 def list(
     ctx: typer.Context,
     verbose: bool = typer.Option(False, "--verbose", "-v", help="Show the workflow paths."),
+    size: bool = typer.Option(
+        False, "--size", help="Show the disk usage of the workflows (see snk du)."
+    ),
 ):
     """
     List the installed workflows.
@@ -218,34 +416,103 @@ def list(
     from rich.console import Console
     from rich.table import Table
 
+    nest = Nest(snk_home=ctx.obj.snk_home, bin_dir=ctx.obj.snk_bin)
+    entries = nest.reconcile_registry().values()
+    show_subdirs = any(entry.subdir for entry in entries)
     table = Table("Workflow", "Version", show_header=True, show_lines=True)
+    if show_subdirs:
+        table.add_column("Subdirectory")
     if verbose:
         table.add_column("Path")
-    nest = Nest(snk_home=ctx.obj.snk_home, bin_dir=ctx.obj.snk_bin)
-    try:
-        workflows = nest.workflows
-    except FileNotFoundError:
-        workflows = []
-    for workflow in workflows:
-        snk_config = SnkConfig.from_workflow_dir(workflow.path, create_if_not_exists=True)
-        if snk_config.version == "editable":
+    if size:
+        table.add_column("Size", justify="right")
+        usage = {workflow.name: workflow for workflow in nest.disk_usage().workflows}
+    for entry in entries:
+        if entry.version == "editable":
             version_str = "[green]editable[/green]"
         else:
-            version_str = f"[blue]{snk_config.version}[/blue]"
+            version_str = f"[blue]{entry.version}[/blue]"
+        row = [entry.name, version_str]
+        if show_subdirs:
+            row.append(f"[magenta]{entry.subdir}[/magenta]" if entry.subdir else "")
         if verbose:
-            table.add_row(
-                workflow.name,
-                version_str,
-                f"[yellow]{str(workflow.path.resolve())}[/yellow]",
-            )
-        else:
-            table.add_row(workflow.name, version_str)
+            row.append(f"[yellow]{str(Path(entry.path).resolve())}[/yellow]")
+        if size:
+            row.append(_format_size(usage[entry.name].total))
+        table.add_row(*row)
     console = Console()
     console.print(table)
 
+@app.command()
+def du(
+    ctx: typer.Context,
+    names: Optional[List[str]] = typer.Argument(
+        None, help="Names of the workflows to measure. Defaults to all workflows."
+    ),
+):
+    """
+    Show the disk usage of the installed workflows.
+
+    Venvs shared between workflows count towards each of them, but only once
+    towards the total. Sizes are cached so running du again is fast.
+    """
+    from rich.console import Console
+    from rich.table import Table
+
+    nest = Nest(snk_home=ctx.obj.snk_home, bin_dir=ctx.obj.snk_bin)
+    try:
+        report = nest.disk_usage(names)
+    except WorkflowNotFoundError as e:
+        typer.secho(e, fg="red", err=True)
+        raise typer.Exit(1)
+    table = Table("Workflow", "Workflow files", "Venv", "Envs", "Total", show_header=True)
+    for column in table.columns[1:]:
+        column.justify = "right"
+    for workflow in report.workflows:
+        table.add_row(
+            workflow.name,
+            _format_size(workflow.workflow),
+            _format_size(workflow.venv),
+            _format_size(workflow.envs),
+            _format_size(workflow.total),
+        )
+    Console().print(table)
+    typer.echo(f"Total (shared files counted once): {_format_size(report.total)}")
+    if report.home is not None:
+        typer.echo(f"SNK_HOME (incl. caches and trash): {_format_size(report.home)}")
+
+
+@app.command()
+def dedupe(
+    ctx: typer.Context,
+    names: Optional[List[str]] = typer.Argument(
+        None, help="Names of the workflows to dedupe. Defaults to all workflows."
+    ),
+):
+    """
+    Store files shared between installed workflows once.
+
+    Identical files are hardlinked to a single copy in SNK_HOME/store. Only files
+    that changed since the last dedupe are hashed.
+    """
+    nest = Nest(snk_home=ctx.obj.snk_home, bin_dir=ctx.obj.snk_bin)
+    try:
+        counts = nest.dedupe(names)
+    except WorkflowNotFoundError as e:
+        typer.secho(e, fg="red", err=True)
+        raise typer.Exit(1)
+    typer.echo(f"Checked {counts['files']} files ({counts['hashed']} hashed).")
+    typer.secho(
+        f"Linked {counts['linked']} duplicates, saved {_format_size(counts['saved'])}.",
+        fg="green",
+    )
+
+
 @app.command()
 def create(path: Path, force: bool = typer.Option(False, "--force", "-f")):
     """Create a default snk.yaml project that can be installed with snk"""
+    from snk_cli.config import SnkConfig
+
     if path.exists():
         if not force:
             typer.secho(f"Directory '{path}' already exists! Use --force to overwrite.", fg="red", err=True)
@@ -284,16 +551,14 @@ def edit(
     """
     Access the snk.yaml configuration file for a workflow.
     """
+    from snk_cli.config import SnkConfig
+
     nest = Nest(snk_home=ctx.obj.snk_home, bin_dir=ctx.obj.snk_bin)
-    try:
-        workflows = nest.workflows
-    except FileNotFoundError:   
-        workflows = []
-    workflow = next((w for w in workflows if w.name == workflow_name), None) 
-    if not workflow:
+    entry = nest.registry.get(workflow_name)
+    if not entry:
         typer.secho(f"Workflow '{workflow_name}' not found!", fg="red", err=True)
         raise typer.Exit(1)
-    snk_config = SnkConfig.from_workflow_dir(workflow.path, create_if_not_exists=True)
+    snk_config = SnkConfig.from_workflow_dir(Path(entry.path), create_if_not_exists=True)
     snk_config.save()
     if path:
         typer.echo(snk_config._snk_config_path)
@@ -304,6 +569,89 @@ def edit(
             typer.secho(str(e), fg="red", err=True)
             raise typer.Exit(1)
 
+@app.command("pack-cli")
+def pack_cli(
+    ctx: typer.Context,
+    name: str = typer.Argument(..., help="Name of the workflow to pack."),
+    output: Optional[Path] = typer.Option(
+        None, "--output", "-o", dir_okay=False, help="Path of the archive. Defaults to <name>.pyz."
+    ),
+    interpreter: str = typer.Option(
+        "/usr/bin/env python3", "--python", help="Interpreter in the shebang of the archive."
+    ),
+):
+    """
+    Pack a workflow CLI into a single executable zipapp (.pyz).
+
+    The archive runs on any machine with python and snakemake, without SNK_HOME.
+    """
+    nest = Nest(snk_home=ctx.obj.snk_home, bin_dir=ctx.obj.snk_bin)
+    try:
+        packed = nest.pack_cli(name, output=output, interpreter=interpreter)
+    except WorkflowNotFoundError as e:
+        typer.secho(e, fg="red", err=True)
+        raise typer.Exit(1)
+    except Exception as e:
+        typer.secho(e, fg="red", err=True)
+        raise typer.Exit(1)
+    if packed["skipped"]:
+        skipped = ", ".join(packed["skipped"])
+        typer.secho(
+            f"Not packed (compiled code, must be installed where the archive runs): {skipped}",
+            fg="yellow",
+            err=True,
+        )
+    typer.secho(f"Packed {name} to {packed['path']}", fg="green")
+
+
+@app.command()
+def gc(
+    ctx: typer.Context,
+    dry_run: bool = typer.Option(
+        False, "--dry-run", "-n", help="Only show what would be deleted."
+    ),
+    trash: bool = typer.Option(
+        False, "--trash", help="Only empty the trash (waits until it is deleted)."
+    ),
+):
+    """
+    Delete unused files in SNK_HOME.
+
+    Removes venvs no installed workflow uses, executables, repos and SNK_BIN links
+    without a workflow, unused git mirrors and the leftovers of interrupted installs.
+    Uninstalled and replaced workflows are moved to the trash and deleted in the
+    background, gc deletes the trash right away.
+    """
+    from rich.console import Console
+    from rich.table import Table
+
+    nest = Nest(snk_home=ctx.obj.snk_home, bin_dir=ctx.obj.snk_bin)
+    if trash:
+        deleted = nest.empty_trash()
+        typer.secho(f"Emptied the trash ({deleted} entries).", fg="green")
+        return
+    garbage = nest.gc(dry_run=dry_run)
+    if not garbage:
+        typer.secho("Nothing to clean up.", fg="green")
+        return
+    table = Table("Kind", "Path", "Size", show_header=True)
+    for item in garbage:
+        table.add_row(item.kind, f"[yellow]{item.path}[/yellow]", _format_size(item.size))
+    Console().print(table)
+    total = _format_size(sum(item.size for item in garbage))
+    if dry_run:
+        typer.secho(f"Would reclaim {total} (dry run).", fg="yellow")
+    else:
+        typer.secho(f"Reclaimed {total}.", fg="green")
+
+
+def _format_size(size: int) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
 # @app.command()
 # def run(
 #         workflow: str = typer.Argument(
@@ -1,24 +1,45 @@
-import inspect
+import hashlib
+import json
 import os
 import shutil
 import stat
 import subprocess
 import sys
-import venv
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager, nullcontext
 from pathlib import Path
-from typing import List
-
-from git import GitCommandError, InvalidGitRepositoryError, Repo
-from packaging.version import parse as parse_version
-from snk_cli.config.config import SnkConfig
-from snk_cli.workflow import Workflow
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Union
 
 from .errors import (
     InvalidWorkflowError,
     InvalidWorkflowRepositoryError,
+    LockTimeoutError,
     WorkflowExistsError,
     WorkflowNotFoundError,
 )
+from .executable import (
+    COMPILE_CLI_SPEC_ENV,
+    SHIM_FLAVOURS,
+    executable_template,
+    freeze_interpreter,
+)
+from .registry import Registry, RegistryEntry
+
+if TYPE_CHECKING:
+    # git, packaging and snk_cli are imported where they are used so that
+    # light commands (e.g. `snk list`) do not pay for importing them
+    from git import Repo
+    from snk_cli.workflow import Workflow
+
+    from .du import DiskUsageReport
+    from .gc import Garbage
+    from .installers import Installer
+    from .locks import FileLock
+    from .store import Store
 
 
 class Nest:
@@ -28,6 +49,7 @@ class Nest:
     Args:
       snk_home (Path, optional): The path to the SNK home directory. Defaults to None.
       bin_dir (Path, optional): The path to the bin directory. Defaults to None.
+      installer (str, optional): The backend that builds isolated environments ("auto", "uv" or "pip"). Defaults to `$SNK_INSTALLER` or "auto".
 
     Side Effects:
       Creates the SNK home and bin directories if they do not exist.
@@ -36,13 +58,21 @@ class Nest:
       >>> nest = Nest()
     """
 
-    def __init__(self, snk_home: Path = None, bin_dir: Path = None) -> None:
+    def __init__(
+        self,
+        snk_home: Path = None,
+        bin_dir: Path = None,
+        installer: str = None,
+        lock_timeout: float = None,
+    ) -> None:
         """
         Initializes a Nest object.
 
         Args:
           snk_home (Path, optional): The path to the SNK home directory. Defaults to None.
           bin_dir (Path, optional): The path to the bin directory. Defaults to None.
+          installer (str, optional): The backend that builds isolated environments ("auto", "uv" or "pip"). Defaults to `$SNK_INSTALLER` or "auto".
+          lock_timeout (float, optional): Seconds to wait for other processes installing the same workflow (raises `LockTimeoutError`). Defaults to `$SNK_LOCK_TIMEOUT` or waiting until they finish.
 
         Side Effects:
           Creates the SNK home and bin directories if they do not exist.
@@ -73,6 +103,24 @@ class Nest:
         self.snk_workflows_dir = self.snk_home / "workflows"
         self.snk_venv_dir = self.snk_home / "venvs"
         self.snk_executable_dir = self.snk_home / "bin"
+        self.snk_wheelhouse_dir = self.snk_home / "wheelhouse"
+        self.snk_mirrors_dir = self.snk_home / "mirrors"
+        self.snk_repos_dir = self.snk_home / "repos"
+        self.snk_staging_dir = self.snk_home / ".staging"
+        self.snk_trash_dir = self.snk_home / ".trash"
+        self.snk_profiles_dir = self.snk_home / "profiles"
+        self.snk_cache_dir = self.snk_home / ".cache"
+        self.snk_store_dir = self.snk_home / "store"
+        self.snk_locks_dir = self.snk_home / ".locks"
+        self._installer_name = installer
+        self._installer = None
+
+        # locks for resources shared between concurrent installs (workflows, SNK_BIN, mirrors, venvs)
+        self.lock_timeout = lock_timeout
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        # the events of the install running in each thread
+        self._events = threading.local()
 
         # Create dirs
         self.snk_home.mkdir(parents=True, exist_ok=True)
@@ -80,6 +128,60 @@ class Nest:
         self.snk_executable_dir.mkdir(parents=True, exist_ok=True)
         self.bin_dir.mkdir(parents=True, exist_ok=True)
 
+        self.registry = Registry(
+            self.snk_home / "registry.json",
+            lock_path=self.snk_locks_dir / "registry.lock",
+            lock_timeout=lock_timeout,
+        )
+        if not self.registry.exists():
+            # index workflows installed before the registry existed
+            self.rebuild_registry()
+
+    @property
+    def installer(self) -> "Installer":
+        """
+        The backend that creates isolated environments and installs packages into them.
+
+        Returns:
+          Installer: uv if it is on the PATH (or requested), otherwise pip.
+
+        Examples:
+          >>> nest.installer.name
+          'uv'
+        """
+        if self._installer is None:
+            from .installers import get_installer
+
+            self._installer = get_installer(self._installer_name, self.snk_wheelhouse_dir)
+        return self._installer
+
+    def _lock(self, key: str) -> "FileLock":
+        """
+        Get the lock guarding a resource shared between concurrent installs.
+
+        The locks are files in SNK_HOME/.locks, so they are shared with the other
+        processes (and hosts) using SNK_HOME, see `snk.locks.FileLock`. Locks are
+        always taken in the order workflow, bin, store/venv/mirror.
+
+        Args:
+          key (str): The key of the resource, e.g. `workflow:<name>` or `bin` (links in SNK_BIN).
+
+        Returns:
+          FileLock: The lock for the resource.
+        """
+        from .locks import FileLock, default_lock_timeout
+
+        with self._locks_lock:
+            if key not in self._locks:
+                kind, _, name = key.partition(":")
+                description = f"the lock of {kind} '{name}'" if name else f"the {kind} lock"
+                self._locks[key] = FileLock(
+                    self.snk_locks_dir / f"{key.replace(':', '-')}.lock",
+                    timeout=default_lock_timeout() if self.lock_timeout is None else self.lock_timeout,
+                    description=description,
+                )
+            return self._locks[key]
+
     def bin_dir_in_path(self) -> bool:
         path_dirs = os.environ["PATH"].split(os.pathsep)
         return str(self.bin_dir) in path_dirs
@@ -118,7 +220,13 @@ class Nest:
         snakemake_version=None,
         dependencies=[],
         isolate=False,
-    ) -> Workflow:
+        offline=False,
+        subdir: Path = None,
+        layered=False,
+        on_event: Callable[[dict], None] = None,
+        shim: str = "standard",
+        dedupe: bool = False,
+    ) -> "Workflow":
         """
         Installs a Snakemake workflow as a CLI.
 
@@ -135,6 +243,13 @@ class Nest:
           conda (bool, optional): Modify the snk config file to control conda use. If None, will not modify the config file. Defaults to None.
           snakemake_version (str, optional): The version of Snakemake to install in the virtual environment. Defaults to None.
           dependencies (list, optional): A list of dependencies to install. Defaults to [].
+          isolate (bool, optional): Whether to install the workflow in an isolated environment. Defaults to False.
+          offline (bool, optional): Only install packages from the wheelhouse in SNK_HOME. Defaults to False.
+          subdir (Path, optional): The subdirectory of the repo containing the workflow. Only this subtree is checked out. Defaults to None.
+          layered (bool, optional): Install the dependencies in a layer over a shared Snakemake venv instead of a full venv. Defaults to False.
+          on_event (Callable[[dict], None], optional): Called with the events of the install, e.g. the duration of each phase (see `InstallEvents`). Defaults to None.
+          shim (str, optional): The flavour of the workflow executable, "standard" or "frozen" (see `create_executable`). Defaults to "standard".
+          dedupe (bool, optional): Link the workflow files to the dedupe store in SNK_HOME (see `dedupe`). Defaults to False.
         Returns:
           Workflow: The installed workflow.
 
@@ -147,120 +262,318 @@ class Nest:
           ... )
         """
 
-        def handle_force_installation(name: str):
-            try:
-                self.uninstall(name=name, force=True)
-            except WorkflowNotFoundError:
-                pass
+        from packaging.version import parse as parse_version
+        from snk_cli.workflow import Workflow
+
+        from .locks import heartbeat
 
         workflow = str(workflow)  # ensure it is a string
-        try:
-            workflow = self._format_repo_url(workflow)
-            if not name:
-                name = self._get_name_from_git_url(workflow)
-            if not force:
-                self._check_workflow_name_available(name)
-            else:
-                handle_force_installation(name)
-            workflow_path = self.download(workflow, name, tag_name=tag, commit=commit)
-        except WorkflowNotFoundError as e:
-            to_remove = self.get_paths_to_delete(name)
-            self.delete_paths(to_remove)
-            raise e
-        except InvalidWorkflowRepositoryError:
-            workflow_local_path = Path(workflow).resolve()
-            if workflow_local_path.is_file():
-                raise InvalidWorkflowError(
-                    f"When installing a local workflow, the path must be a directory. Found: {workflow_local_path}"
+        with self._track_install(workflow, on_event) as events, ExitStack() as locks:
+            dependencies = list(dependencies)  # do not modify the callers list
+            # the install is built in a staging directory and only replaces the previous
+            # install (with --force) once it is complete
+            stage = None
+            link = None
+            venv_path = None
+            venv_references = set()
+            source_path = None
+            sha = None
+            # the venv is created and its wheels are fetched while the workflow is downloaded,
+            # only installing the final requirements waits for the workflow
+            prepared_venv = None
+            if isolate or snakemake_version is not None or dependencies:
+                prepared_venv = self._background(
+                    self.prepare_virtual_environment,
+                    snakemake_version,
+                    [] if layered else dependencies,
+                    offline,
                 )
-            if (
-                self.snk_workflows_dir.resolve().is_relative_to(workflow_local_path)
-                and not editable
-            ):
-                raise InvalidWorkflowError(
-                    f"The workflow directory contains SNK_HOME!\nWORKFLOW: {workflow_local_path}\nSNK_HOME: {self.snk_workflows_dir.resolve()}.\n\nTry installing the workflow with --editable."
-                )
-            if not name:
-                name = workflow_local_path.name
-            if not force:
-                self._check_workflow_name_available(name)
-            else:
-                handle_force_installation(name)
-            workflow_path = self.local(workflow_local_path, name, editable)
-        try:
-            self.validate_Snakemake_repo(workflow_path)
-            # update non standard files
-            if config:
-                config_path = workflow_path / config
-                if not config_path.exists():
-                    raise FileNotFoundError(f"Config file not found at {config_path}")
-                self.modify_snk_config(workflow_path, configfile=config_path)
-            if snakefile:
-                snakefile_path = workflow_path / snakefile
-                if not snakefile_path.exists():
-                    raise FileNotFoundError(f"Snakefile not found at {snakefile_path}")
-                self.modify_snk_config(workflow_path, snakefile=snakefile_path)
-            # set the version of the workflow
-            if editable:
-                version = "editable"
-            elif tag:
-                version = tag
-            elif commit:
-                version = commit
-            else:
+            try:
                 try:
-                    repo = Repo(workflow_path)
-                    sha = repo.head.object.hexsha
-                    version = repo.git.rev_parse(sha, short=8)
-                except Exception:
-                    version = None
-            self.modify_snk_config(workflow_path, version=version)
-            # check if we need to install snakemake in a virtual environment
-            snakemake_version_to_install_in_venv = None
-            snakemake_min_version = self.check_for_snakemake_min_version(workflow_path, snakefile)
-            if snakemake_version is not None:
-                snakemake_version_to_install_in_venv = snakemake_version
-                if parse_version(self._current_snakemake_version) < parse_version(
-                    snakemake_min_version
-                ):
-                    # The current version of Snakemake is less than the minimum version required by the workflow
-                    snakemake_version_to_install_in_venv = f">={snakemake_min_version}"
-            min_snk_cli_version = self.check_for_snk_cli_min_version(workflow_path)
-            snk_cli_in_deps = len([dep for dep in dependencies if "snk_cli" in dep]) > 0
-            if min_snk_cli_version is not None and not snk_cli_in_deps:
-                if parse_version(self._current_snk_cli_version) < parse_version(
-                    min_snk_cli_version
-                ):
-                    # The current version of Snakemake is less than the minimum version required by the workflow
-                    dependencies.append(f"snk_cli>={min_snk_cli_version}")
-            if snakemake_version_to_install_in_venv is not None or dependencies:
-                isolate = True
-            if isolate:
-                venv_path = self.create_virtual_environment(name)
-                self._install_snk_cli_in_venv(
-                    venv_path,
-                    snakemake_version=snakemake_version_to_install_in_venv,
-                    dependencies=dependencies,
+                    events.step("resolve")
+                    workflow = self._format_repo_url(workflow)
+                    if not name:
+                        name = (
+                            Path(subdir).name if subdir else self._get_name_from_git_url(workflow)
+                        )
+                    # installs of the same workflow wait for each other
+                    locks.enter_context(self._lock(f"workflow:{name}"))
+                    if not force:
+                        self._check_workflow_name_available(name)
+                    venv_references = set(self._venv_references(name))
+                    stage = locks.enter_context(heartbeat.touching(self._create_stage(name)))
+                    events.name = name
+                    events.step("clone")
+                    workflow_path = self.download(
+                        workflow, name, tag_name=tag, commit=commit, subdir=subdir, home=stage
+                    )
+                except InvalidWorkflowRepositoryError:
+                    workflow_local_path = Path(workflow).resolve()
+                    if subdir:
+                        workflow_local_path = workflow_local_path / subdir
+                    if workflow_local_path.is_file():
+                        raise InvalidWorkflowError(
+                            f"When installing a local workflow, the path must be a directory. Found: {workflow_local_path}"
+                        )
+                    if (
+                        self.snk_workflows_dir.resolve().is_relative_to(workflow_local_path)
+                        and not editable
+                    ):
+                        raise InvalidWorkflowError(
+                            f"The workflow directory contains SNK_HOME!\nWORKFLOW: {workflow_local_path}\nSNK_HOME: {self.snk_workflows_dir.resolve()}.\n\nTry installing the workflow with --editable."
+                        )
+                    if not name:
+                        name = workflow_local_path.name
+                    # installs of the same workflow wait for each other
+                    locks.enter_context(self._lock(f"workflow:{name}"))
+                    if not force:
+                        self._check_workflow_name_available(name)
+                    venv_references = set(self._venv_references(name))
+                    stage = locks.enter_context(heartbeat.touching(self._create_stage(name)))
+                    events.name = name
+                    events.step("copy")
+                    workflow_path = self.local(workflow_local_path, name, editable, home=stage)
+                    source_path = workflow_local_path
+                # paths written to the snk config and executable point to the published install
+                install_path = self.snk_workflows_dir / name
+                events.step("validate")
+                self.validate_Snakemake_repo(workflow_path)
+                events.step("config")
+                # update non standard files
+                if config:
+                    config_path = workflow_path / config
+                    if not config_path.exists():
+                        raise FileNotFoundError(f"Config file not found at {config_path}")
+                    self.modify_snk_config(workflow_path, configfile=install_path / config)
+                if snakefile:
+                    snakefile_path = workflow_path / snakefile
+                    if not snakefile_path.exists():
+                        raise FileNotFoundError(f"Snakefile not found at {snakefile_path}")
+                    self.modify_snk_config(workflow_path, snakefile=install_path / snakefile)
+                # set the version of the workflow
+                if editable:
+                    version = "editable"
+                elif tag:
+                    version = tag
+                elif commit:
+                    version = commit
+                else:
+                    try:
+                        from git import Repo
+
+                        if source_path:
+                            # .git is not copied into local installs
+                            repo = Repo(source_path)
+                        else:
+                            repo = Repo(workflow_path.resolve(), search_parent_directories=True)
+                        sha = repo.head.object.hexsha
+                        version = repo.git.rev_parse(sha, short=8)
+                    except Exception:
+                        version = None
+                self.modify_snk_config(workflow_path, version=version)
+                # check if we need to install snakemake in a virtual environment
+                snakemake_version_to_install_in_venv = None
+                snakemake_min_version = self.check_for_snakemake_min_version(
+                    workflow_path, snakefile
                 )
-                python_interpreter_path = venv_path / "bin" / "python"
-            else:
-                python_interpreter_path = self.python_interpreter_path
-            # create the workflow executable
-            workflow_executable_path = self.create_executable(
-                workflow_path, name, python_interpreter_path=python_interpreter_path
-            )
-            self.link_workflow_executable_to_bin(workflow_executable_path)
-            if additional_resources:
-                self.additional_resources(workflow_path, additional_resources)
-            if conda is not None:
-                self.modify_snk_config(workflow_path, conda=conda)
-            self._confirm_installation(name)
-        except Exception as e:
-            # remove any half completed steps
-            to_remove = self.get_paths_to_delete(name)
-            self.delete_paths(to_remove)
-            raise e
-        return Workflow(workflow_path)
+                if snakemake_version is not None:
+                    snakemake_version_to_install_in_venv = snakemake_version
+                    if parse_version(self._current_snakemake_version) < parse_version(
+                        snakemake_min_version
+                    ):
+                        # The current version of Snakemake is less than the minimum version required by the workflow
+                        snakemake_version_to_install_in_venv = f">={snakemake_min_version}"
+                min_snk_cli_version = self.check_for_snk_cli_min_version(workflow_path)
+                snk_cli_in_deps = len([dep for dep in dependencies if "snk_cli" in dep]) > 0
+                if min_snk_cli_version is not None and not snk_cli_in_deps:
+                    if parse_version(self._current_snk_cli_version) < parse_version(
+                        min_snk_cli_version
+                    ):
+                        # The current version of Snakemake is less than the minimum version required by the workflow
+                        dependencies.append(f"snk_cli>={min_snk_cli_version}")
+                if snakemake_version_to_install_in_venv is not None or dependencies:
+                    isolate = True
+                if isolate:
+                    events.step("venv")
+                    prepared, prepared_venv = self._result(prepared_venv), None
+                    venv_path = self.get_virtual_environment(
+                        name,
+                        snakemake_version=snakemake_version_to_install_in_venv,
+                        dependencies=dependencies,
+                        offline=offline,
+                        prepared=prepared,
+                        layered=layered,
+                    )
+                    python_interpreter_path = venv_path / "bin" / "python"
+                else:
+                    python_interpreter_path = self.python_interpreter_path
+                # create the workflow executable
+                events.step("shim")
+                # subdirectory installs are linked into the workflows dir, the CLI uses the
+                # checkout itself so the workflow is not treated as editable
+                cli_workflow_path = install_path
+                if subdir and not editable:
+                    cli_workflow_path = self.snk_home / workflow_path.resolve().relative_to(
+                        stage.resolve()
+                    )
+                self.create_executable(
+                    cli_workflow_path,
+                    name,
+                    python_interpreter_path=python_interpreter_path,
+                    home=stage,
+                    shim=shim,
+                )
+                events.step("config")
+                if additional_resources:
+                    self.additional_resources(
+                        workflow_path, additional_resources, install_path=install_path
+                    )
+                if conda is not None:
+                    self.modify_snk_config(workflow_path, conda=conda)
+                if dedupe and not editable:
+                    events.step("dedupe")
+                    with self._lock("store"):
+                        self.store.dedupe(
+                            [stage / "repos" / name if subdir else workflow_path]
+                        )
+                events.step("confirm")
+                self._confirm_installation(name, home=stage)
+                events.step("link")
+                executable_name = self._executable_name(name)
+                if not (self.bin_dir / executable_name).is_symlink():
+                    # a new link, removed again if the install fails
+                    link = self.bin_dir / executable_name
+                # the link dangles until the executable is published
+                self.link_workflow_executable_to_bin(self.snk_executable_dir / executable_name)
+                events.step("registry")
+                entry = self._registry_entry(
+                    name,
+                    version=version,
+                    source=workflow,
+                    venv_path=venv_path,
+                    editable=editable,
+                    commit=sha if source_path else None,
+                    home=stage,
+                )
+                events.step("publish")
+                workflow_path = self._publish(name, stage, force=force, entry=entry)
+            except Exception as e:
+                if prepared_venv:
+                    prepared_venv.add_done_callback(self._discard_prepared_virtual_environment)
+                # the previous install is untouched, discard the staged one
+                for venv_reference in self._venv_references(name):
+                    if venv_reference not in venv_references:
+                        self._release_venv_reference(venv_reference)
+                if link and link.is_symlink():
+                    link.unlink()
+                if stage:
+                    self._discard([stage])
+                raise e
+            # the install is published, nothing after this may fail it
+            events.step("spec")
+            self.compile_cli_spec(self.snk_executable_dir / executable_name, python_interpreter_path)
+            try:
+                self._release_venv_references(name, keep=self._venv_layers(venv_path))
+                self.empty_trash(background=True)
+            except Exception:
+                # the previous venvs stay referenced until the workflow is reinstalled or
+                # uninstalled, the trash is emptied by the next install or gc
+                pass
+            return Workflow(workflow_path)
+
+    @contextmanager
+    def _track_install(self, workflow: str, on_event: Callable[[dict], None] = None):
+        """Time the install running in this thread, see `InstallEvents`."""
+        from .events import InstallEvents
+
+        self._events.current = InstallEvents(workflow, on_event)
+        try:
+            with self._events.current as events:
+                yield events
+        finally:
+            self._events.current = None
+
+    def _phase(self, phase: str):
+        """Time a phase of the install running in this thread (if any)."""
+        events = getattr(self._events, "current", None)
+        return events.phase(phase) if events else nullcontext()
+
+    def install_many(
+        self, workflows: List[Union[str, dict]], max_workers: int = 4, callback: Callable = None
+    ) -> List[Union["Workflow", Exception]]:
+        """
+        Install several workflows concurrently.
+
+        Workflows are installed by a bounded pool of workers so network clones and
+        venv builds overlap. Failures are isolated, a workflow that fails to install
+        does not stop the others.
+
+        Args:
+          workflows (List[Union[str, dict]]): The workflows to install. Either the URL or path of the workflow or a dict of `Nest.install` keyword arguments.
+          max_workers (int, optional): The maximum number of concurrent installs. Defaults to 4.
+          callback (Callable, optional): Called with the index and the result of each install as it finishes. Defaults to None.
+
+        Returns:
+          List[Union[Workflow, Exception]]: The installed workflow or the raised exception for each workflow, in order.
+
+        Examples:
+          >>> nest.install_many(
+          ...     [
+          ...         "https://github.com/example/repo.git",
+          ...         {"workflow": "https://github.com/example/other.git", "tag": "v1.0.0"},
+          ...     ]
+          ... )
+        """
+
+        def install(index: int, kwargs: dict):
+            try:
+                result = self.install(**kwargs)
+            except Exception as e:
+                result = e
+            if callback:
+                callback(index, result)
+            return result
+
+        workflows = [
+            {"workflow": workflow} if isinstance(workflow, str) else dict(workflow)
+            for workflow in workflows
+        ]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(install, index, kwargs) for index, kwargs in enumerate(workflows)
+            ]
+        return [future.result() for future in futures]
+
+    def _background(self, fn: Callable, *args) -> Future:
+        """
+        Run a step of an install in a background thread.
+
+        Args:
+          fn (Callable): The step to run.
+          *args: The arguments of the step.
+
+        Returns:
+          Future: The future result of the step.
+        """
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(fn, *args)
+        executor.shutdown(wait=False)
+        return future
+
+    def _result(self, future: Future):
+        # background steps are optimisations, failures are retried in the foreground
+        try:
+            return future.result()
+        except Exception:
+            return None
+
+    def _discard_prepared_virtual_environment(self, future: Future):
+        from .locks import heartbeat
+
+        prepared = self._result(future)
+        if prepared:
+            heartbeat.discard(prepared)
+            self._discard([prepared])
 
     def modify_snk_config(self, workflow_path: Path, **kwargs):
         """
@@ -273,6 +586,8 @@ class Nest:
         Examples:
           >>> nest.modify_snk_config(Path("/path/to/workflow"), logo=example)
         """
+        from snk_cli.config.config import SnkConfig
+
         snk_config = SnkConfig.from_workflow_dir(workflow_path, create_if_not_exists=True)
         modified = False
         for key, value in kwargs.items():
@@ -282,13 +597,16 @@ class Nest:
         if modified:
             snk_config.save()
 
-    def additional_resources(self, workflow_path: Path, resources: List[Path]):
+    def additional_resources(
+        self, workflow_path: Path, resources: List[Path], install_path: Path = None
+    ):
         """
         Modify the snk config file so that resources will be copied at runtime.
 
         Args:
           workflow_path (Path): The path to the workflow directory.
           resources (List[Path]): A list of additional resources to copy.
+          install_path (Path, optional): The path the workflow is published to if it is built in a staging directory. Defaults to None.
 
         Examples:
           >>> nest.additional_resources(
@@ -296,9 +614,19 @@ class Nest:
           ...     [Path("/path/to/resource1"), Path("/path/to/resource2")],
           ... )
         """
-        # validate_resources(resources)
+        from snk_cli.config.config import SnkConfig
+
         snk_config = SnkConfig.from_workflow_dir(workflow_path, create_if_not_exists=True)
-        snk_config.add_resources(resources, workflow_path)
+        resources = [r if r.is_absolute() else workflow_path / r for r in map(Path, resources)]
+        snk_config.validate_resources(resources)
+        if install_path:
+            # point resources in the staged workflow to the published workflow
+            for i, r in enumerate(resources):
+                try:
+                    resources[i] = install_path / r.relative_to(workflow_path)
+                except ValueError:
+                    pass
+        snk_config.resources.extend(resources)
         snk_config.save()
 
     def copy_nonstandard_config(self, workflow_dir: Path, config_path: Path):
@@ -342,15 +670,32 @@ class Nest:
             # editable
             to_delete.append(workflow_dir)
 
+        # remove sparse repo of subdirectory installs
+        repo_dir = self.snk_repos_dir / workflow_name
+        if repo_dir.exists():
+            to_delete.append(repo_dir)
+
         workflow_executable = self.snk_executable_dir / workflow_name
         if workflow_executable.exists():
             to_delete.append(workflow_executable)
 
+        cli_spec = self._cli_spec_path(workflow_name)
+        if cli_spec.exists():
+            to_delete.append(cli_spec)
+
         # remove venv
         venv_path = self.snk_venv_dir / workflow_name
         if venv_path.exists():
             to_delete.append(venv_path)
 
+        # release shared venvs, they are only removed once nothing else uses them (checked
+        # again under the venv lock when deleting)
+        for venv_reference in self._venv_references(workflow_name):
+            if os.listdir(venv_reference.parent) == [workflow_name]:
+                to_delete.append(venv_reference.parent.parent)
+            else:
+                to_delete.append(venv_reference)
+
         # remove link
         workflow_symlink_executable = self.bin_dir / workflow_name
         if workflow_symlink_executable.is_symlink():
@@ -363,6 +708,9 @@ class Nest:
         """
         Delete the given paths.
 
+        Directories are moved to the trash and deleted by a background reaper, so
+        deleting large directories (e.g. venvs) returns right away.
+
         Args:
           files (List[Path]): A list of paths to delete.
 
@@ -378,16 +726,14 @@ class Nest:
         # i.e. if it is a symlink read the link and check
         for path in files:
             if path.is_symlink():
-                print("Unlinking:", path)
-                path.unlink()
+                with self._lock("bin") if path.parent == self.bin_dir else nullcontext():
+                    path.unlink()
             elif path.is_file():
-                print("Deleting:", path)
                 assert str(self.snk_home) in str(path), "Cannot delete files outside of SNK_HOME"
                 path.unlink()
             elif path.is_dir():
-                print("Deleting:", path)
                 assert str(self.snk_home) in str(path), "Cannot delete folders outside of SNK_HOME"
-                shutil.rmtree(path)
+                self._discard([path])
             else:
                 raise TypeError("Invalid file type")
 
@@ -408,6 +754,10 @@ class Nest:
         """
         if not isinstance(name, str):
             raise TypeError(f"Name must be a string. Found: {name}")
+        with self._lock(f"workflow:{name}"):
+            return self._uninstall(name, force=force)
+
+    def _uninstall(self, name: str, force: bool = False) -> bool:
         to_remove = self.get_paths_to_delete(name)
         if not to_remove:
             raise WorkflowNotFoundError(f"Workflow '{name}' not found")
@@ -422,18 +772,181 @@ class Nest:
             proceed = ans.lower() in ["y", "yes", ""]
         if not proceed:
             return False
-        self.delete_paths(to_remove)
+        # shared venvs are released under their lock, another install may use them by now
+        venv_references = self._venv_references(name)
+        shared = set(venv_references) | {r.parent.parent for r in venv_references}
+        self.delete_paths([p for p in to_remove if p not in shared])
+        for venv_reference in venv_references:
+            self._release_venv_reference(venv_reference)
+        self.registry.remove(name)
+        self.empty_trash(background=True)
         return True
 
-    def _check_workflow_name_available(self, name: str):
+    def disk_usage(self, names: List[str] = None) -> "DiskUsageReport":
+        """
+        Measure the disk usage of installed workflows.
+
+        The workflow checkout, its venv and the conda envs and singularity images
+        created in the workflow directory are measured separately. Shared venvs
+        count towards every workflow using them, but only once towards the total.
+        Sizes are cached in SNK_HOME/.cache by directory mtime (see
+        `snk.du.DiskUsage`) so measuring again is fast.
+
+        Args:
+          names (List[str], optional): The workflows to measure. Defaults to all installed workflows (and SNK_HOME).
+
+        Returns:
+          DiskUsageReport: The disk usage of each workflow and the total.
+
+        Raises:
+          WorkflowNotFoundError: If a workflow is not installed.
+
+        Examples:
+          >>> nest.disk_usage(["example"]).workflows
+          [WorkflowUsage(name='example', workflow=1048576, venv=104857600, envs=0, total=105906176)]
+        """
+        from .du import DiskUsage, DiskUsageReport, WorkflowUsage
+
+        entries = self.registry.entries()
+        for name in names or []:
+            if name not in entries:
+                raise WorkflowNotFoundError(f"Workflow '{name}' not found")
+        usage = DiskUsage(self.snk_cache_dir / "du.pickle")
+        if not names:
+            names = sorted(entries)
+            # measure everything in one parallel scan
+            usage.scan([self.snk_home])
+        report = DiskUsageReport()
+        all_paths = []
+        for name in names:
+            entry = entries[name]
+            workflow_path = self.snk_workflows_dir / name
+            workflow_paths = [
+                workflow_path,
+                self.snk_repos_dir / name,
+                Path(entry.executable),
+                self._cli_spec_path(name),
+            ]
+            env_paths = []
+            if not entry.editable:
+                # editable workflows create their envs in the working directory
+                if entry.subdir:
+                    workflow_path = self.snk_repos_dir / name / entry.subdir
+                env_paths = [workflow_path / ".conda", workflow_path / ".singularity"]
+            venv_paths = self._venv_layers(self.snk_venv_dir / entry.venv) if entry.venv else []
+            paths = workflow_paths + env_paths + venv_paths
+            report.workflows.append(
+                WorkflowUsage(
+                    name=name,
+                    workflow=usage.size(workflow_paths, exclude=env_paths),
+                    venv=usage.size(venv_paths),
+                    envs=usage.size(env_paths),
+                    total=usage.size(paths),
+                )
+            )
+            all_paths += paths
+        report.total = usage.size(all_paths)
+        if len(names) == len(entries):
+            report.home = usage.size([self.snk_home])
+        usage.save()
+        return report
+
+    @property
+    def store(self) -> "Store":
+        from .store import Store
+
+        return Store(self.snk_store_dir)
+
+    def dedupe(self, names: List[str] = None) -> Dict[str, int]:
+        """
+        Link the files of installed workflows to the dedupe store in SNK_HOME.
+
+        Identical files (e.g. vendored scripts, reference files and environment
+        yamls) are stored once and hardlinked into each workflow, see
+        `snk.store.Store`. Files are only hashed if they changed since the last
+        dedupe. Editable workflows are skipped.
+
+        Args:
+          names (List[str], optional): The workflows to dedupe. Defaults to all installed workflows.
+
+        Returns:
+          Dict[str, int]: The number of `files` checked, the files `hashed`, the files `linked` to an existing blob and the bytes `saved`.
+
+        Raises:
+          WorkflowNotFoundError: If a workflow is not installed.
+
+        Examples:
+          >>> nest.dedupe()
+          {'files': 240, 'hashed': 12, 'linked': 118, 'saved': 10485760}
+        """
+        if names is None:
+            names = sorted(p.name for p in self.snk_workflows_dir.glob("*"))
+        roots = []
+        for name in names:
+            workflow_path = self.snk_workflows_dir / name
+            if not workflow_path.exists():
+                raise WorkflowNotFoundError(f"Workflow '{name}' not found")
+            if not workflow_path.is_symlink():
+                roots.append(workflow_path)
+            elif (self.snk_repos_dir / name).exists():
+                # subdirectory install
+                roots.append(self.snk_repos_dir / name)
+        with self._lock("store"):
+            return self.store.dedupe(roots)
+
+    def pack_cli(self, name: str, output: Path = None, interpreter: str = None) -> dict:
+        """
+        Pack an installed workflow CLI into a single executable zipapp (`.pyz`).
+
+        The archive holds the workflow, its precompiled CLI spec and the pure-python
+        packages of snk_cli, and runs on any machine with python and snakemake (no
+        SNK_HOME needed), e.g. `python example.pyz run`.
+
+        Args:
+          name (str): The name of the workflow.
+          output (Path, optional): The path of the archive. Defaults to `<name>.pyz` in the working directory.
+          interpreter (str, optional): The interpreter in the shebang of the archive. Defaults to "/usr/bin/env python3".
+
+        Returns:
+          dict: The `path` of the archive, and the packed `packages` and `skipped` packages with compiled code (these must be installed where the archive runs).
+
+        Examples:
+          >>> nest.pack_cli("example")
+          {'path': PosixPath('example.pyz'), 'packages': ['rich', 'snk-cli', 'typer', ...], 'skipped': []}
+        """
+        from .pack import pack_workflow
+
+        entry = self.registry.get(name)
+        workflow_path = self.snk_workflows_dir / name
+        if entry is None or not workflow_path.exists():
+            raise WorkflowNotFoundError(f"Workflow '{name}' not found")
+        python_interpreter_path = self.python_interpreter_path
+        if entry.venv:
+            python_interpreter_path = self.snk_venv_dir / entry.venv / "bin" / "python"
+        executable = self.snk_executable_dir / self._executable_name(name)
+        # make sure the spec matches the current snk.yaml and config
+        self.compile_cli_spec(executable, python_interpreter_path)
+        output = Path(output) if output else Path(f"{name}.pyz")
+        packed = pack_workflow(
+            workflow_path,
+            name,
+            self._cli_spec_path(name),
+            python_interpreter_path,
+            output,
+            install_paths=[workflow_path],
+            interpreter=interpreter or "/usr/bin/env python3",
+        )
+        return {"path": output, **packed}
+
+    def _check_workflow_name_available(self, name: str, include_bin: bool = True):
         if not name:
             return None
-        if name in os.listdir(self.snk_workflows_dir):
+        if name in os.listdir(self.snk_workflows_dir) or (self.snk_repos_dir / name).exists():
             raise WorkflowExistsError(
                 f"Workflow '{name}' already exists in SNK_HOME ({self.snk_workflows_dir})"
             )
 
-        if name in os.listdir(self.bin_dir):
+        if include_bin and name in os.listdir(self.bin_dir):
             # check if orfan symlink
             def is_orfan_symlink(name):
                 return (self.bin_dir / name).is_symlink() and str(self.snk_home) in os.readlink(
@@ -447,223 +960,1393 @@ class Nest:
                     f"File '{name}' already exists in SNK_BIN ({self.bin_dir})"
                 )
 
-    def _confirm_installation(self, name: str):
+    def _confirm_installation(self, name: str, home: Path = None):
         """
         Confirms that the installation was successful.
 
         Args:
           name (str): The name of the workflow.
+          home (Path, optional): The staging directory of the install. Defaults to SNK_HOME.
 
         Examples:
           >>> nest._confirm_installation("example")
         """
-        workflow_dir = self.snk_workflows_dir / name
+        home = Path(home) if home else self.snk_home
+        workflow_dir = home / "workflows" / name
         assert workflow_dir.exists()
-        workflows = [p.name.split(".")[0] for p in self.bin_dir.glob("*")]
-        assert name in workflows
+        executable = home / "bin" / self._executable_name(name)
+        assert executable.exists()
+        # the executable is linked into SNK_BIN once the install is published
+        link = self.bin_dir / executable.name
+        published_executable = self.snk_executable_dir / executable.name
+        if (link.exists() or link.is_symlink()) and not (
+            link.is_symlink() and os.readlink(link) == str(published_executable)
+        ):
+            raise WorkflowExistsError(f"File '{name}' already exists in SNK_BIN ({self.bin_dir})")
 
-    def _get_name_from_git_url(self, git_url: str):
+    def _executable_name(self, name: str) -> str:
+        if sys.platform.startswith("win"):
+            return name + ".exe"
+        return name
+
+    def _workflow_name(self, executable_name: str) -> str:
+        # the inverse of _executable_name (str.removesuffix needs Python 3.9)
+        return executable_name[:-4] if executable_name.endswith(".exe") else executable_name
+
+    def _create_stage(self, name: str) -> Path:
         """
-        Gets the name of the workflow from the git URL.
+        Create a staging directory to build an install of a workflow in.
+
+        The staging directory is laid out like SNK_HOME (workflows, repos and bin)
+        and lives in SNK_HOME so it can be published with renames.
 
         Args:
-          git_url (str): The URL of the git repository.
+          name (str): The name of the workflow.
 
         Returns:
-          str: The name of the workflow.
+          Path: The path to the staging directory.
         """
-        return git_url.split("/")[-1].split(".")[0]
+        from .locks import owner_tag
 
-    @property
-    def workflows(self):
-        return [
-            Workflow(workflow_dir.absolute()) for workflow_dir in self.snk_workflows_dir.glob("*")
-        ]
+        self.snk_staging_dir.mkdir(parents=True, exist_ok=True)
+        return Path(tempfile.mkdtemp(prefix=f"{name}-{owner_tag()}-", dir=self.snk_staging_dir))
 
-    def download(self, repo_url: str, name: str, tag_name: str = None, commit: str = None) -> Path:
+    def _publish(
+        self, name: str, stage: Path, force: bool = False, entry: RegistryEntry = None
+    ) -> Path:
         """
-        Clone a workflow from a git repository.
+        Publish a staged install of a workflow.
+
+        The staged workflow, repository and executable are renamed into SNK_HOME
+        and the registry entry is written. The parts of a previous install they
+        replace are moved to the trash.
 
         Args:
-          repo_url (str): The URL of the repo.
           name (str): The name of the workflow.
-          tag_name (str, optional): The tag of the workflow. Defaults to None.
-          commit (str, optional): The commit SHA of the workflow. Defaults to None.
+          stage (Path): The staging directory of the install.
+          force (bool, optional): Replace a previous install of the workflow. Defaults to False.
+          entry (RegistryEntry, optional): The registry entry of the install. Defaults to None.
 
         Returns:
-          Path: The path to the cloned workflow.
-
-        Examples:
-          >>> nest.download(
-          ...     "https://github.com/example/repo.git", "example", tag_name="v1.0.0"
-          ... )
+          Path: The path to the published workflow.
         """
-        location = self.snk_workflows_dir / name
-        options = []
-        if not commit:
-            options.append("--depth 1")
-        if tag_name:
-            options.append("--single-branch")
-            options.append(f"--branch {tag_name}")
-        try:
-            repo = Repo.clone_from(repo_url, location, multi_options=options)
-            if commit:
-                repo.git.checkout(commit)
-            else:
-                repo.git.checkout(tag_name)
-        except GitCommandError as e:
-            if "destination path" in e.stderr:
-                raise WorkflowExistsError(
-                    f"Workflow '{name}' already exists in {self.snk_workflows_dir}"
-                )
-            elif f"Remote branch {tag_name}" in e.stderr:
-                did_you_mean = ""
-                if len(tag_name) < 6:
-                    did_you_mean = f". Did you mean 'v{tag_name}'?"
-                raise WorkflowNotFoundError(f"Workflow tag '{tag_name}' not found{did_you_mean}")
-            elif f"pathspec '{commit}' did not match" in e.stderr:
-                if tag_name:
-                    raise WorkflowNotFoundError(
-                        f"Workflow commit '{commit}' not found on branch {tag_name}"
-                    )
-                else:
-                    raise WorkflowNotFoundError(f"Workflow commit '{commit}' not found")
-            elif "not found" in e.stderr:
-                raise WorkflowNotFoundError(f"Workflow repository '{repo_url}' not found")
-            raise e
-        return location
+        with self._lock(f"workflow:{name}"):
+            if not force:
+                # the workflow may have been installed while this install was staged, the
+                # link in SNK_BIN is already the one of this install
+                self._check_workflow_name_available(name, include_bin=False)
+            return self._publish_stage(name, stage, entry=entry)
 
-    def local(self, path: Path, name: str, editable=False) -> Path:
+    def _publish_stage(self, name: str, stage: Path, entry: RegistryEntry = None) -> Path:
         """
-        Install a local workflow.
+        Swap a staged install into SNK_HOME.
+
+        The paths are swapped one after the other: the sparse repo of subdirectory
+        installs (`repos/<name>`, first so the workflow link resolves), the workflow
+        directory (`workflows/<name>`) and the executable (`bin/<name>`). Each
+        previous path is renamed aside into the stage right before the staged path
+        is renamed into its place, so a path is only missing between two renames,
+        and the executable is replaced atomically. The registry entry is written
+        last. If a rename or the registry update fails, the paths swapped so far
+        are swapped back. The previous paths (and the venv of installs made before
+        venvs were shared) are discarded once everything is published.
 
         Args:
-          path (Path): The path to the local workflow.
           name (str): The name of the workflow.
-          editable (bool, optional): Whether to install the workflow in editable mode. Defaults to False.
+          stage (Path): The staging directory of the install.
+          entry (RegistryEntry, optional): The registry entry of the install. Defaults to None.
 
         Returns:
-          Path: The path to the installed workflow.
-
-        Examples:
-          >>> nest.local(Path("/path/to/workflow"), "example")
+          Path: The path to the published workflow.
         """
-        location = self.snk_workflows_dir / name
-        if editable:
-            os.symlink(path.absolute(), location, target_is_directory=True)
-            return location
-        shutil.copytree(path, location)
+        replaced_dir = stage / ".replaced"
+        swapped = []
+        executable_aside = None
+        executable_swapped = False
         try:
-            Repo(location)
-        except InvalidGitRepositoryError:
-            Repo.init(location, mkdir=False)
-        return location
+            for directory in [self.snk_repos_dir, self.snk_workflows_dir]:
+                staged_path = stage / directory.name / name
+                published_path = directory / name
+                aside = None
+                if published_path.exists() or published_path.is_symlink():
+                    aside = replaced_dir / directory.name
+                    aside.parent.mkdir(parents=True, exist_ok=True)
+                    os.rename(published_path, aside)
+                swapped.append((published_path, aside))
+                if staged_path.exists() or staged_path.is_symlink():
+                    directory.mkdir(parents=True, exist_ok=True)
+                    os.rename(staged_path, published_path)
+            executable_name = self._executable_name(name)
+            executable = self.snk_executable_dir / executable_name
+            if executable.exists():
+                # copied aside so the executable is still replaced atomically
+                executable_aside = replaced_dir / "bin" / executable_name
+                executable_aside.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(executable, executable_aside)
+            os.replace(stage / "bin" / executable_name, executable)
+            executable_swapped = True
+            if entry is not None:
+                self.registry.add(entry)
+        except Exception:
+            if executable_swapped and executable_aside:
+                os.replace(executable_aside, executable)
+            elif executable_swapped:
+                executable.unlink()
+            for published_path, aside in reversed(swapped):
+                if published_path.exists() or published_path.is_symlink():
+                    self._discard([published_path])
+                if aside:
+                    os.rename(aside, published_path)
+            raise
+        # the previous paths are discarded with the stage
+        replaced = [stage]
+        # venvs of installs made before venvs were shared between workflows
+        legacy_venv_path = self.snk_venv_dir / name
+        if legacy_venv_path.exists() and not (legacy_venv_path / "snk-venv.json").exists():
+            replaced.append(legacy_venv_path)
+        try:
+            self._discard(replaced)
+        except OSError:
+            # the install is published, the abandoned stage is emptied with the trash
+            pass
+        return self.snk_workflows_dir / name
 
-    def create_virtual_environment(self, name: str) -> Path:
+    def _discard(self, paths: List[Path]):
         """
-        Create a virtual environment for the workflow.
-
-        Args:
-          name (str): The name of the virtual environment.
-          snakemake_version (str, optional): The version of Snakemake to install in the virtual environment. Defaults to None.
+        Move paths to the trash in SNK_HOME.
 
-        Returns:
-          Path: The path to the virtual environment.
+        A rename is used so discarding a large directory (e.g. a venv) takes the same
+        time as discarding a file. The trash is emptied by `empty_trash`.
+        Symlinks are unlinked.
 
-        Examples:
-          >>> nest.create_virtual_environment("example")
+        Args:
+          paths (List[Path]): The paths to discard.
         """
-        venv_dir = self.snk_home / "venvs"
-        venv_dir.mkdir(exist_ok=True)
-        venv_path = venv_dir / name
-        try:
-            venv.create(venv_path, with_pip=True, symlinks=True)
-        except FileExistsError:
-            raise FileExistsError(
-                f"The venv {venv_path} already exists. Please choose a different location or name. Alternatively, use the --force flag to overwrite the existing venv."
-            )
-        return venv_path
+        for path in paths:
+            if path.is_symlink():
+                path.unlink()
+            elif path.exists():
+                assert str(self.snk_home) in str(path), "Cannot delete files outside of SNK_HOME"
+                self.snk_trash_dir.mkdir(parents=True, exist_ok=True)
+                os.rename(path, self.snk_trash_dir / f"{path.name}-{uuid.uuid4().hex}")
 
-    def _install_snk_cli_in_venv(self, venv_path: Path, snakemake_version=None, dependencies=[]):
+    def empty_trash(self, background: bool = False) -> int:
         """
-        Install snk_cli in the virtual environment.
+        Delete the discarded paths in the trash and abandoned staging directories.
+
+        Staging directories are abandoned if the install that created them crashed.
 
         Args:
-          venv_path (Path): The path to the virtual environment.
-          snakemake_version (str, optional): The version of Snakemake to install in the virtual
-          environment. Defaults to "7.32.4".
+          background (bool, optional): Delete the trash in a detached process (see `snk.trash.spawn_reaper`) and return right away. Defaults to False.
+
+        Returns:
+          int: The number of deleted trash entries (0 in the background).
 
         Examples:
-          >>> nest._install_snk_cli_in_venv(Path("/path/to/venv"), snakemake_version="7.32.4")
+          >>> nest.empty_trash()
+          2
         """
-        if not venv_path.exists():
-            raise FileNotFoundError(f"Virtual environment not found at {venv_path}")
-        if sys.platform.startswith("win"):
-            pip_path = venv_path / "Scripts" / "pip.exe"
-        else:
-            pip_path = venv_path / "bin" / "pip"
-        if not pip_path.exists():
-            raise FileNotFoundError(f"pip not found at {pip_path}")
-        # check if snakemake version starts with >= or <=
-        if snakemake_version:
-            # check if snakemake version starts with >, <, =, ~, ^,
-            if snakemake_version[0] in [">", "<", "="]:
-                snakemake_version = f"snakemake{snakemake_version}"
-            else:
-                snakemake_version = f"snakemake=={snakemake_version}"
-        else:
-            snakemake_version = "snakemake"
-        try:
-            snk_cli_in_deps = len([dep for dep in dependencies if "snk_cli" in dep]) > 0
-            if not snk_cli_in_deps:
-                dependencies.append("snk_cli")
-            subprocess.run(
-                [pip_path, "install", snakemake_version, "setuptools"] + dependencies,
-                check=True,
-            )
-        except subprocess.CalledProcessError as e:
-            raise Exception(f"Failed to install snk_cli in virtual environment. Error: {e}")
+        from .trash import has_garbage, reap, spawn_reaper
 
-    def create_executable(
-        self, workflow_path: Path, name: str, python_interpreter_path=None
-    ) -> Path:
-        if not python_interpreter_path:
-            python_interpreter_path = self.python_interpreter_path
-        template = inspect.cleandoc(
-            f"""
-            #!/bin/sh
-            '''exec' "{python_interpreter_path}" "$0" "$@"
-            ' '''
-            # -*- coding: utf-8 -*-
-            import re
-            import sys
-            from pathlib import Path
-            from snk_cli import CLI
-
-            def create_cli(p):
-                workflow_dir_path = Path(p)
-                cli = CLI(workflow_dir_path)
-                cli()
-
-            if __name__ == "__main__":
-                sys.argv[0] = re.sub(r'(-script\\.pyw|\\.exe)?$', '', sys.argv[0])
-                sys.exit(create_cli("{workflow_path}"))
-                
-        """
-        )
+        if self.snk_staging_dir.exists():
+            for stage in self.snk_staging_dir.iterdir():
+                if self._is_abandoned(stage):
+                    self._discard([stage])
+        if background:
+            if has_garbage(self.snk_trash_dir):
+                spawn_reaper(self.snk_trash_dir)
+            return 0
+        return reap(self.snk_trash_dir)
 
-        if sys.platform.startswith("win"):
-            name += ".exe"
+    def _pid_is_running(self, pid: int) -> bool:
+        from .trash import pid_is_running
 
-        workflow_executable = self.snk_executable_dir / name
+        return pid_is_running(pid)
 
-        with open(workflow_executable, "w") as f:
+    def _is_abandoned(self, path: Path) -> bool:
+        """
+        Check if the install that created a path named `<name>-<pid>@<host>-<suffix>` is gone.
+
+        Installs on other hosts are gone once they stopped touching the path, see
+        `snk.locks.owner_is_alive`.
+
+        Args:
+          path (Path): A staging directory or prepared venv.
+
+        Returns:
+          bool: True if the process that created the path is gone.
+        """
+        from .locks import owner_is_alive
+
+        tag = path.name.rsplit("-", 2)[-2] if path.name.count("-") >= 2 else ""
+        return not owner_is_alive(tag, path)
+
+    def _installing(self) -> bool:
+        """Check if an install is running (it has a staging directory or is preparing a venv)."""
+        paths = []
+        if self.snk_staging_dir.exists():
+            paths += list(self.snk_staging_dir.iterdir())
+        if self.snk_venv_dir.exists():
+            paths += list(self.snk_venv_dir.glob(".prepared-*"))
+        return any(not self._is_abandoned(path) for path in paths)
+
+    def find_garbage(self) -> List["Garbage"]:
+        """
+        Find the paths in SNK_HOME and SNK_BIN that no installed workflow needs.
+
+        The workflows in SNK_HOME/workflows are the source of truth. Venvs no
+        installed workflow references, executables and repos without a workflow,
+        links in SNK_BIN to missing executables, mirrors no installed workflow was
+        installed from, registry entries without a workflow and the leftovers of
+        interrupted installs are garbage. Venvs are only collected while no
+        install is running, because a running install may be about to use them.
+        The sizes are measured in parallel.
+
+        Returns:
+          List[Garbage]: The garbage and the bytes deleting it reclaims.
+
+        Examples:
+          >>> nest.find_garbage()
+          [Garbage(path=Path('/path/to/snk/venvs/3f0c2d9a1b7e4c55'), kind='venv', size=104857600)]
+        """
+
+        from .gc import Garbage, measure
+        from .locks import owner_is_alive
+
+        def listdir(path: Path) -> List[Path]:
+            return sorted(path.iterdir()) if path.is_dir() else []
+
+        installed = {p.name for p in listdir(self.snk_workflows_dir)}
+        # the mirrors of workflows missing from the registry are not garbage
+        entries = self.reconcile_registry()
+        garbage = []
+        stages = listdir(self.snk_staging_dir)
+        garbage += [Garbage(stage, "stage") for stage in stages if self._is_abandoned(stage)]
+        installing = self._installing()
+
+        # venvs
+        venvs = listdir(self.snk_venv_dir)
+        prepared = [venv for venv in venvs if venv.name.startswith(".prepared-")]
+        garbage += [Garbage(venv, "prepared") for venv in prepared if self._is_abandoned(venv)]
+        if not installing:
+            used = set()
+            for name in installed:
+                used.update(self._venv_layers(self.snk_venv_dir / name))
+                for venv_reference in self._venv_references(name):
+                    used.update(self._venv_layers(venv_reference.parent.parent))
+                if name in entries and entries[name].venv:
+                    used.update(self._venv_layers(self.snk_venv_dir / entries[name].venv))
+            for venv in venvs:
+                if venv in prepared:
+                    continue
+                if venv not in used:
+                    garbage.append(Garbage(venv, "venv"))
+                    continue
+                garbage += [
+                    Garbage(venv_reference, "reference")
+                    for venv_reference in listdir(venv / "snk-refs")
+                    if venv_reference.name not in installed
+                ]
+
+        # executables and CLI specs
+        for path in listdir(self.snk_executable_dir):
+            name = path.name
+            if name.startswith(".") and ".spec" in name:
+                # .<name>.spec and the temporary files of the executables writing it
+                spec_name, _, suffix = name[1:].partition(".spec")
+                pid = suffix.split(".")[1] if suffix.count(".") == 2 else ""
+                if spec_name not in installed or (
+                    pid.isdigit() and not self._pid_is_running(int(pid))
+                ):
+                    garbage.append(Garbage(path, "executable"))
+            elif self._workflow_name(name) not in installed:
+                garbage.append(Garbage(path, "executable"))
+
+        # links in SNK_BIN
+        for path in listdir(self.bin_dir):
+            if not path.is_symlink():
+                continue
+            target = Path(os.readlink(path))
+            if target.parent == self.snk_executable_dir and (
+                not target.exists() or self._workflow_name(target.name) not in installed
+            ):
+                garbage.append(Garbage(path, "link"))
+
+        if not installing:
+            # files of running installs may not be linked to their blob yet
+            garbage += [Garbage(blob, "blob") for blob in self.store.unused_blobs()]
+
+        # sparse repos of subdirectory installs
+        garbage += [
+            Garbage(repo, "repo") for repo in listdir(self.snk_repos_dir) if repo.name not in installed
+        ]
+
+        # git mirrors
+        sources = {
+            self._mirror_path(entry.source)
+            for name, entry in entries.items()
+            if entry.source and name in installed
+        }
+        for mirror in listdir(self.snk_mirrors_dir):
+            if mirror.name.endswith(".partial"):
+                # <mirror>.<pid>@<host>.partial
+                tag = mirror.name.rsplit(".", 2)[-2]
+                if not owner_is_alive(tag, mirror):
+                    garbage.append(Garbage(mirror, "mirror"))
+            elif mirror not in sources:
+                garbage.append(Garbage(mirror, "mirror"))
+
+        # registry entries
+        garbage += [
+            Garbage(Path(entry.path), "registry")
+            for name, entry in entries.items()
+            if name not in installed
+        ]
+
+        garbage += [Garbage(path, "trash") for path in listdir(self.snk_trash_dir)]
+        return measure(garbage)
+
+    def gc(self, dry_run: bool = False) -> List["Garbage"]:
+        """
+        Delete the paths in SNK_HOME and SNK_BIN that no installed workflow needs.
+
+        See `find_garbage`. Directories are moved to the trash, which is then
+        deleted in parallel.
+
+        Args:
+          dry_run (bool, optional): Only find the garbage. Defaults to False.
+
+        Returns:
+          List[Garbage]: The deleted (or with `dry_run` the deletable) garbage.
+
+        Examples:
+          >>> sum(garbage.size for garbage in nest.gc(dry_run=True))
+          104857600
+        """
+        from .gc import Garbage, measure
+        from .trash import reap
+
+        garbage = self.find_garbage()
+        if dry_run:
+            return garbage
+        stale_entries = []
+        for item in garbage:
+            if item.kind == "registry":
+                stale_entries.append(item.path.name)
+            elif item.kind == "trash":
+                continue
+            elif item.kind == "link":
+                with self._lock("bin"):
+                    # the workflow may have been installed again in the meantime
+                    target = Path(os.readlink(item.path)) if item.path.is_symlink() else None
+                    name = self._workflow_name(target.name) if target else ""
+                    if target and not (target.exists() and (self.snk_workflows_dir / name).exists()):
+                        item.path.unlink()
+            elif item.kind == "venv":
+                with self._lock(f"venv:{item.path.name}"):
+                    # an install may have started and referenced the venv in the meantime
+                    references_dir = item.path / "snk-refs"
+                    references = os.listdir(references_dir) if references_dir.is_dir() else []
+                    installed = any((self.snk_workflows_dir / r).exists() for r in references)
+                    if not installed and not self._installing():
+                        self._discard([item.path])
+            elif item.path.is_dir() and not item.path.is_symlink():
+                self._discard([item.path])
+            else:
+                item.path.unlink(missing_ok=True)
+        if stale_entries:
+            self.registry.update(remove=stale_entries)
+        reap(self.snk_trash_dir)
+        if not self._installing():
+            # blobs only linked from the deleted workflows
+            blobs = measure([Garbage(blob, "blob") for blob in self.store.unused_blobs()])
+            for item in blobs:
+                item.path.unlink(missing_ok=True)
+            garbage += blobs
+        return garbage
+
+    def _get_name_from_git_url(self, git_url: str):
+        """
+        Gets the name of the workflow from the git URL.
+
+        Args:
+          git_url (str): The URL of the git repository.
+
+        Returns:
+          str: The name of the workflow.
+        """
+        return git_url.split("/")[-1].split(".")[0]
+
+    @property
+    def workflows(self):
+        from snk_cli.workflow import Workflow
+
+        return [Workflow(Path(entry.path)) for entry in self.reconcile_registry().values()]
+
+    def _registry_entry(
+        self,
+        name: str,
+        version: str = None,
+        source: str = None,
+        venv_path: Path = None,
+        editable: bool = False,
+        commit: str = None,
+        home: Path = None,
+    ) -> RegistryEntry:
+        """
+        Create the registry entry of an installed workflow.
+
+        Args:
+          name (str): The name of the workflow.
+          version (str, optional): The installed version of the workflow. Defaults to None.
+          source (str, optional): The URL or local path the workflow was installed from. Defaults to None.
+          venv_path (Path, optional): The venv used by the workflow. Defaults to None.
+          editable (bool, optional): Whether the workflow is installed in editable mode. Defaults to False.
+          commit (str, optional): The installed commit SHA. Defaults to the HEAD of the installed repo.
+          home (Path, optional): Read the commit and subdirectory from the install in this directory (laid out like SNK_HOME), e.g. a staging directory. Defaults to None.
+
+        Returns:
+          RegistryEntry: The registry entry.
+        """
+        from git import Repo
+
+        workflow_path = self.snk_workflows_dir / name
+        if not editable and not commit:
+            try:
+                installed_path = Path(home) / "workflows" / name if home else workflow_path
+                repo = Repo(installed_path.resolve(), search_parent_directories=True)
+                commit = repo.head.object.hexsha
+            except Exception:
+                pass
+        subdir = self.get_workflow_subdir(name, home=home)
+        if sys.platform.startswith("win"):
+            name += ".exe"
+        return RegistryEntry(
+            name=workflow_path.name,
+            path=str(workflow_path),
+            executable=str(self.snk_executable_dir / name),
+            version=version,
+            source=source,
+            commit=commit,
+            venv=venv_path.name if venv_path else None,
+            subdir=str(subdir) if subdir else None,
+            editable=editable,
+            installed=time.time(),
+        )
+
+    def rebuild_registry(self):
+        """
+        Rebuild the registry from the workflows installed in SNK_HOME.
+
+        Examples:
+          >>> nest.rebuild_registry()
+        """
+        entries = [
+            self._discover_registry_entry(workflow_dir.name)
+            for workflow_dir in self.snk_workflows_dir.glob("*")
+        ]
+        self.registry.update(entries, remove=list(self.registry.entries()))
+
+    def reconcile_registry(self) -> Dict[str, RegistryEntry]:
+        """
+        Register the installed workflows that are missing from the registry.
+
+        An install that is killed between publishing its workflow and writing its
+        registry entry leaves the workflow out of the registry. Only the names in
+        SNK_HOME/workflows are compared with the registry, so this is cheap when
+        nothing is missing. Workflows that are being installed (their lock is held)
+        are left to their install. Entries of workflows that are gone are removed
+        by `gc`.
+
+        Returns:
+          Dict[str, RegistryEntry]: The registry entries by workflow name.
+
+        Examples:
+          >>> nest.reconcile_registry()["example"].version
+          'v1.0.0'
+        """
+        entries = self.registry.entries()
+        for name in sorted(set(os.listdir(self.snk_workflows_dir)) - set(entries)):
+            lock = self._lock(f"workflow:{name}")
+            try:
+                lock.acquire(timeout=0)
+            except LockTimeoutError:
+                continue
+            try:
+                entry = self.registry.get(name)
+                if entry is None:
+                    entry = self._discover_registry_entry(name)
+                    self.registry.add(entry)
+                entries[name] = entry
+            finally:
+                lock.release()
+        return entries
+
+    def _discover_registry_entry(self, name: str) -> RegistryEntry:
+        """
+        Create the registry entry of a workflow from its install in SNK_HOME.
+
+        Args:
+          name (str): The name of the workflow.
+
+        Returns:
+          RegistryEntry: The registry entry.
+        """
+        from git import Repo
+        from snk_cli.config.config import SnkConfig
+
+        workflow_dir = self.snk_workflows_dir / name
+        snk_config = SnkConfig.from_workflow_dir(workflow_dir, create_if_not_exists=True)
+        venv_path = None
+        if (self.snk_venv_dir / name).exists():
+            venv_path = self.snk_venv_dir / name
+        for venv_reference in self._venv_references(name):
+            venv_path = venv_reference.parent.parent
+        source = None
+        try:
+            source = Repo(workflow_dir.resolve(), search_parent_directories=True).remote().url
+        except Exception:
+            pass
+        editable = snk_config.version == "editable"
+        entry = self._registry_entry(
+            name,
+            version=snk_config.version,
+            source=str(workflow_dir.resolve()) if editable else source,
+            venv_path=venv_path,
+            editable=editable,
+        )
+        entry.installed = workflow_dir.lstat().st_mtime
+        return entry
+
+    def download(
+        self,
+        repo_url: str,
+        name: str,
+        tag_name: str = None,
+        commit: str = None,
+        subdir: Path = None,
+        home: Path = None,
+    ) -> Path:
+        """
+        Clone a workflow from a git repository.
+
+        The repository is fetched into a bare mirror in SNK_HOME and the workflow is
+        cloned from the mirror, hardlinking the git objects. Reinstalls and installs of
+        other tags only need an incremental fetch.
+
+        Args:
+          repo_url (str): The URL of the repo.
+          name (str): The name of the workflow.
+          tag_name (str, optional): The tag of the workflow. Defaults to None.
+          commit (str, optional): The commit SHA of the workflow. Defaults to None.
+          subdir (Path, optional): The subdirectory of the repo containing the workflow. See `sparse_download`. Defaults to None.
+          home (Path, optional): Install into this directory (laid out like SNK_HOME) instead of SNK_HOME, e.g. a staging directory. Defaults to None.
+
+        Returns:
+          Path: The path to the cloned workflow.
+
+        Examples:
+          >>> nest.download(
+          ...     "https://github.com/example/repo.git", "example", tag_name="v1.0.0"
+          ... )
+        """
+        from git import GitCommandError, Repo
+
+        location = (Path(home) if home else self.snk_home) / "workflows" / name
+        options = []
+        if tag_name:
+            options.append("--single-branch")
+            options.append(f"--branch {tag_name}")
+        try:
+            if subdir:
+                return self.sparse_download(
+                    repo_url, name, subdir, tag_name=tag_name, commit=commit, home=home
+                )
+            if commit and not self._mirror_path(repo_url).exists():
+                # only fetch the pinned commit instead of mirroring the full history
+                if location.exists():
+                    raise WorkflowExistsError(
+                        f"Workflow '{name}' already exists in {self.snk_workflows_dir}"
+                    )
+                self._fetch_commit(repo_url, location, commit, tag_name=tag_name)
+                return location
+            mirror_path = self.update_mirror(repo_url)
+            repo = Repo.clone_from(mirror_path, location, multi_options=options)
+            repo.remote().set_url(repo_url)
+            if commit:
+                repo.git.checkout(commit)
+            else:
+                repo.git.checkout(tag_name)
+        except GitCommandError as e:
+            if "destination path" in e.stderr:
+                raise WorkflowExistsError(
+                    f"Workflow '{name}' already exists in {self.snk_workflows_dir}"
+                )
+            elif f"Remote branch {tag_name}" in e.stderr or (
+                tag_name and f"couldn't find remote ref {tag_name}" in e.stderr
+            ):
+                did_you_mean = ""
+                if len(tag_name) < 6:
+                    did_you_mean = f". Did you mean 'v{tag_name}'?"
+                raise WorkflowNotFoundError(f"Workflow tag '{tag_name}' not found{did_you_mean}")
+            elif f"pathspec '{commit}' did not match" in e.stderr:
+                if tag_name:
+                    raise WorkflowNotFoundError(
+                        f"Workflow commit '{commit}' not found on branch {tag_name}"
+                    )
+                else:
+                    raise WorkflowNotFoundError(f"Workflow commit '{commit}' not found")
+            elif "not found" in e.stderr or "does not exist" in e.stderr:
+                raise WorkflowNotFoundError(f"Workflow repository '{repo_url}' not found")
+            raise e
+        return location
+
+    def sparse_download(
+        self,
+        repo_url: str,
+        name: str,
+        subdir: Path,
+        tag_name: str = None,
+        commit: str = None,
+        home: Path = None,
+    ) -> Path:
+        """
+        Clone a workflow that lives in a subdirectory of a git repository.
+
+        The repository is cloned with `--filter=blob:none` into SNK_HOME/repos and a cone
+        mode sparse-checkout of the subdirectory is used, so only the subdirectory (and the
+        files at the root of the repository) are fetched and checked out. The sparse
+        specification is kept in the repository so later pulls respect it. The workflow is
+        linked into the workflows directory.
+
+        Args:
+          repo_url (str): The URL of the repo.
+          name (str): The name of the workflow.
+          subdir (Path): The subdirectory of the repo containing the workflow.
+          tag_name (str, optional): The tag of the workflow. Defaults to None.
+          commit (str, optional): The commit SHA of the workflow. Defaults to None.
+          home (Path, optional): Install into this directory (laid out like SNK_HOME) instead of SNK_HOME. Defaults to None.
+
+        Returns:
+          Path: The path to the workflow in the workflows directory.
+
+        Examples:
+          >>> nest.sparse_download(
+          ...     "https://github.com/example/monorepo.git", "example", Path("workflows/example")
+          ... )
+        """
+        from git import Repo
+
+        home = Path(home) if home else self.snk_home
+        location = home / "workflows" / name
+        repo_location = home / "repos" / name
+        if location.exists() or location.is_symlink() or repo_location.exists():
+            raise WorkflowExistsError(
+                f"Workflow '{name}' already exists in {self.snk_workflows_dir}"
+            )
+        subdir = Path(subdir).as_posix().strip("/")
+        options = ["--filter=blob:none", "--no-checkout"]
+        if not commit:
+            options.append("--depth 1")
+        if tag_name:
+            options.append("--single-branch")
+            options.append(f"--branch {tag_name}")
+        repo = Repo.clone_from(repo_url, repo_location, multi_options=options)
+        with repo.config_writer() as config:
+            config.set_value("snk", "subdir", subdir)
+        repo.git.sparse_checkout("set", "--cone", subdir)
+        repo.git.checkout(commit or tag_name or "HEAD")
+        workflow_path = repo_location / subdir
+        if not workflow_path.is_dir():
+            raise WorkflowNotFoundError(
+                f"Workflow subdirectory '{subdir}' not found in '{repo_url}'"
+            )
+        location.parent.mkdir(parents=True, exist_ok=True)
+        # relative, so the link survives moving the install out of a staging directory
+        os.symlink(
+            Path("..") / "repos" / name / subdir, location, target_is_directory=True
+        )
+        return location
+
+    def get_workflow_subdir(self, name: str, home: Path = None) -> Path:
+        """
+        Get the repository subdirectory of a workflow installed with `sparse_download`.
+
+        Args:
+          name (str): The name of the workflow.
+          home (Path, optional): Look in this directory (laid out like SNK_HOME) instead of SNK_HOME, e.g. a staging directory. Defaults to None.
+
+        Returns:
+          Path: The subdirectory or None if the whole repository is installed.
+
+        Examples:
+          >>> nest.get_workflow_subdir("example")
+          PosixPath('workflows/example')
+        """
+        home = Path(home) if home else self.snk_home
+        repo_location = home / "repos" / name
+        if not repo_location.exists():
+            return None
+        return (home / "workflows" / name).resolve().relative_to(repo_location.resolve())
+
+    def _fetch_commit(self, repo_url: str, location: Path, commit: str, tag_name: str = None):
+        """
+        Fetch a single commit of a git repository.
+
+        The commit is fetched with a depth of 1. If the server refuses to serve the
+        commit directly (e.g. it is abbreviated) the branch is fetched with a
+        progressively increasing depth until the commit is found.
+
+        Args:
+          repo_url (str): The URL of the repo.
+          location (Path): The path to fetch the workflow into.
+          commit (str): The commit SHA of the workflow.
+          tag_name (str, optional): The tag or branch containing the commit. Defaults to None.
+
+        Returns:
+          Repo: The repository checked out at the commit.
+
+        Examples:
+          >>> nest._fetch_commit(
+          ...     "https://github.com/example/repo.git", Path("/path/to/workflow"), "0123456"
+          ... )
+        """
+        from git import GitCommandError, Repo
+
+        repo = Repo.init(location)
+        repo.create_remote("origin", repo_url)
+        try:
+            repo.git.fetch("--depth", "1", "origin", commit)
+        except GitCommandError as e:
+            if "not found" in e.stderr or "does not exist" in e.stderr:
+                raise e
+            for depth in ["50", "500", "5000", "2147483647"]:
+                repo.git.fetch("--depth", depth, "origin", tag_name or "HEAD")
+                try:
+                    repo.git.rev_parse("--verify", "--quiet", f"{commit}^{{commit}}")
+                    break
+                except GitCommandError:
+                    continue
+        repo.git.checkout(commit)
+        return repo
+
+    def _mirror_path(self, repo_url: str) -> Path:
+        """
+        Get the path to the bare mirror of a git repository.
+
+        Args:
+          repo_url (str): The URL of the repo.
+
+        Returns:
+          Path: The path to the mirror.
+        """
+        url_hash = hashlib.sha256(repo_url.encode()).hexdigest()[:16]
+        mirror_name = f"{self._get_name_from_git_url(repo_url)}-{url_hash}.git"
+        return self.snk_mirrors_dir / mirror_name
+
+    def update_mirror(self, repo_url: str) -> Path:
+        """
+        Create or update the bare mirror of a git repository.
+
+        Args:
+          repo_url (str): The URL of the repo.
+
+        Returns:
+          Path: The path to the mirror.
+
+        Examples:
+          >>> nest.update_mirror("https://github.com/example/repo.git")
+        """
+        mirror_path = self._mirror_path(repo_url)
+        with self._lock(f"mirror:{mirror_path.name}"):
+            return self._update_mirror(repo_url, mirror_path)
+
+    def _update_mirror(self, repo_url: str, mirror_path: Path) -> Path:
+        from git import Repo
+
+        from .locks import heartbeat, owner_tag
+
+        if mirror_path.exists():
+            repo = Repo(mirror_path)
+            self._configure_mirror(repo)
+            repo.git.fetch("origin", "--prune")
+            return mirror_path
+        self.snk_mirrors_dir.mkdir(parents=True, exist_ok=True)
+        # clone next to the mirror so an interrupted clone is never used
+        partial_mirror_path = mirror_path.with_name(f"{mirror_path.name}.{owner_tag()}.partial")
+        try:
+            with heartbeat.touching(partial_mirror_path):
+                repo = Repo.init(partial_mirror_path, bare=True)
+                repo.git.remote("add", "origin", repo_url)
+                self._configure_mirror(repo)
+                repo.git.fetch("origin")
+            os.rename(partial_mirror_path, mirror_path)
+        finally:
+            if partial_mirror_path.exists():
+                shutil.rmtree(partial_mirror_path)
+        return mirror_path
+
+    def _configure_mirror(self, repo: "Repo"):
+        """
+        Only fetch the branches and tags of the remote into a mirror.
+
+        `git clone --mirror` fetches every ref, including the `refs/pull/*` refs
+        GitHub keeps for each pull request. Mirrors created that way are converted
+        and their other refs deleted.
+
+        Args:
+          repo (Repo): The bare mirror.
+        """
+        refspecs = ["+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"]
+        with repo.config_reader() as config:
+            fetch = config.get_values('remote "origin"', "fetch", default=[])
+            mirror = config.get_value('remote "origin"', "mirror", default=False)
+        if list(fetch) == refspecs and not mirror:
+            return
+        repo.git.config("--unset-all", "remote.origin.fetch", with_exceptions=False)
+        repo.git.config("--unset", "remote.origin.mirror", with_exceptions=False)
+        for refspec in refspecs:
+            repo.git.config("--add", "remote.origin.fetch", refspec)
+        other_refs = [
+            ref
+            for ref in repo.git.for_each_ref("--format=%(refname)").splitlines()
+            if not ref.startswith(("refs/heads/", "refs/tags/"))
+        ]
+        if other_refs:
+            # delete them in one transaction, GitHub repos can have thousands of pull refs
+            with tempfile.TemporaryFile() as commands:
+                commands.write("".join(f"delete {ref}\n" for ref in other_refs).encode())
+                commands.seek(0)
+                repo.git.update_ref("--stdin", istream=commands)
+
+    def local(self, path: Path, name: str, editable=False, home: Path = None) -> Path:
+        """
+        Install a local workflow.
+
+        The workflow is copied without the paths ignored by its `.snkignore` and
+        `.gitignore` files, `.git`, `.snakemake` and other build directories (see
+        `snk.scan.DEFAULT_IGNORE_PATTERNS`). File contents are reflinked or hardlinked
+        instead of copied when SNK_HOME is on the same filesystem.
+
+        Args:
+          path (Path): The path to the local workflow.
+          name (str): The name of the workflow.
+          editable (bool, optional): Whether to install the workflow in editable mode. Defaults to False.
+          home (Path, optional): Install into this directory (laid out like SNK_HOME) instead of SNK_HOME. Defaults to None.
+
+        Returns:
+          Path: The path to the installed workflow.
+
+        Examples:
+          >>> nest.local(Path("/path/to/workflow"), "example")
+        """
+        from git import InvalidGitRepositoryError, Repo
+
+        from .copytree import copy_workflow
+
+        location = (Path(home) if home else self.snk_home) / "workflows" / name
+        location.parent.mkdir(parents=True, exist_ok=True)
+        if editable:
+            os.symlink(path.absolute(), location, target_is_directory=True)
+            return location
+        copy_workflow(path, location)
+        try:
+            Repo(location)
+        except InvalidGitRepositoryError:
+            Repo.init(location, mkdir=False)
+        return location
+
+    def create_virtual_environment(self, name: str, with_pip: bool = True) -> Path:
+        """
+        Create a virtual environment for the workflow.
+
+        Args:
+          name (str): The name of the virtual environment.
+          with_pip (bool, optional): Install pip in the virtual environment. Defaults to True.
+
+        Returns:
+          Path: The path to the virtual environment.
+
+        Examples:
+          >>> nest.create_virtual_environment("example")
+        """
+        venv_dir = self.snk_home / "venvs"
+        venv_dir.mkdir(exist_ok=True)
+        venv_path = venv_dir / name
+        try:
+            self.installer.create(venv_path, self.python_interpreter_path, with_pip=with_pip)
+        except FileExistsError:
+            raise FileExistsError(
+                f"The venv {venv_path} already exists. Please choose a different location or name. Alternatively, use the --force flag to overwrite the existing venv."
+            )
+        return venv_path
+
+    def get_virtual_environment(
+        self,
+        name: str,
+        snakemake_version=None,
+        dependencies=[],
+        offline=False,
+        prepared: Path = None,
+        layered=False,
+    ) -> Path:
+        """
+        Get a shared virtual environment for the workflow from the venv pool.
+
+        Venvs are keyed by a hash of the python interpreter, the snakemake version,
+        the dependencies and the snk_cli version. Workflows with the same key share
+        a venv which is only built once. Each workflow using the venv is recorded as
+        a reference so the venv can be removed once nothing uses it.
+
+        Layered venvs only contain the dependencies. They are stacked on the base venv
+        of the Snakemake version (a venv without dependencies) with a `.pth` file, so
+        workflows that only differ in their dependencies share Snakemake and snk_cli.
+        The workflow holds a reference on both venvs.
+
+        Args:
+          name (str): The name of the workflow using the virtual environment.
+          snakemake_version (str, optional): The version of Snakemake to install in the virtual environment. Defaults to None.
+          dependencies (list, optional): A list of dependencies to install. Defaults to [].
+          offline (bool, optional): Only install packages from the wheelhouse. Defaults to False.
+          prepared (Path, optional): A venv from `prepare_virtual_environment` to use if the venv is not in the pool yet. It is discarded otherwise. Defaults to None.
+          layered (bool, optional): Layer the dependencies over the base venv. Defaults to False.
+
+        Returns:
+          Path: The path to the virtual environment.
+
+        Examples:
+          >>> nest.get_virtual_environment("example", snakemake_version="7.32.4")
+          >>> nest.get_virtual_environment("example", dependencies=["pandas"], layered=True)
+        """
+        dependencies = list(dependencies)
+        if layered and dependencies:
+            base = self.get_virtual_environment(
+                name, snakemake_version, offline=offline, prepared=prepared
+            )
+            key = self._venv_pool_key(snakemake_version, dependencies, base=base.name)
+            with self._lock(f"venv:{key}"):
+                return self._get_virtual_environment(
+                    name, key, snakemake_version, dependencies, offline, base=base
+                )
+        key = self._venv_pool_key(snakemake_version, dependencies)
+        with self._lock(f"venv:{key}"):
+            return self._get_virtual_environment(
+                name, key, snakemake_version, dependencies, offline, prepared
+            )
+
+    def _get_virtual_environment(
+        self,
+        name: str,
+        key: str,
+        snakemake_version,
+        dependencies: List[str],
+        offline: bool,
+        prepared: Path = None,
+        base: Path = None,
+    ) -> Path:
+        from .locks import heartbeat
+
+        venv_path = self.snk_venv_dir / key
+        metadata_path = venv_path / "snk-venv.json"
+        if prepared:
+            heartbeat.discard(prepared)
+        if venv_path.exists() and not metadata_path.exists():
+            # left over from an interrupted install
+            self._discard([venv_path])
+        if venv_path.exists() and prepared:
+            # built by another install in the meantime
+            self._discard([prepared])
+        elif prepared:
+            os.rename(prepared, venv_path)
+            self._relocate_virtual_environment(prepared, venv_path)
+        elif not venv_path.exists():
+            # layers use the pip of their base venv
+            self.create_virtual_environment(key, with_pip=not base)
+        if not metadata_path.exists():
+            try:
+                with self._phase("pip"):
+                    if base:
+                        self._link_virtual_environment_layer(venv_path, base)
+                        self.installer.install(venv_path, dependencies, offline=offline)
+                    else:
+                        self._install_snk_cli_in_venv(
+                            venv_path,
+                            snakemake_version=snakemake_version,
+                            dependencies=dependencies,
+                            offline=offline,
+                        )
+            except Exception as e:
+                self._discard([venv_path])
+                raise e
+            metadata = {
+                "key": key,
+                "python": str(self.python_interpreter_path),
+                "snakemake": self._format_snakemake_requirement(snakemake_version),
+                "dependencies": dependencies,
+                "installer": self.installer.name,
+            }
+            if base:
+                metadata["base"] = base.name
+            metadata_path.write_text(json.dumps(metadata, indent=2))
+        references_dir = venv_path / "snk-refs"
+        references_dir.mkdir(exist_ok=True)
+        (references_dir / name).touch()
+        return venv_path
+
+    def prepare_virtual_environment(
+        self, snakemake_version=None, dependencies=[], offline=False
+    ) -> Optional[Path]:
+        """
+        Create a virtual environment and download its wheels ahead of an install.
+
+        This runs while the workflow is downloaded. The final requirements are only
+        known once the workflow is available (e.g. its Snakemake `min_version`), so the
+        venv is created under a temporary name without packages and the wheels of the
+        requirements known so far are fetched into the wheelhouse.
+        `get_virtual_environment` moves the venv into the pool and installs the final
+        requirements.
+
+        Args:
+          snakemake_version (str, optional): The version of Snakemake requested for the install. Defaults to None.
+          dependencies (list, optional): The dependencies requested for the install. Defaults to [].
+          offline (bool, optional): Do not download wheels. Defaults to False.
+
+        Returns:
+          Optional[Path]: The path to the prepared venv, or None if the venv is already in the pool.
+
+        Examples:
+          >>> nest.prepare_virtual_environment(snakemake_version="7.32.4")
+        """
+        from .locks import heartbeat, owner_tag
+
+        if sys.platform.startswith("win"):
+            # venv launchers can't be relocated on Windows
+            return None
+        key = self._venv_pool_key(snakemake_version, dependencies)
+        if (self.snk_venv_dir / key / "snk-venv.json").exists():
+            return None
+        # the tag tells `gc` whether the install preparing the venv is still running, it is
+        # touched until the install uses or discards it
+        venv_path = self.create_virtual_environment(
+            f".prepared-{owner_tag()}-{uuid.uuid4().hex}"
+        )
+        heartbeat.add(venv_path)
+        if not offline:
+            self.installer.prefetch(
+                venv_path, self._venv_requirements(snakemake_version, dependencies)
+            )
+        return venv_path
+
+    def _site_packages(self, venv_path: Path) -> Path:
+        if sys.platform.startswith("win"):
+            return venv_path / "Lib" / "site-packages"
+        python = f"python{sys.version_info.major}.{sys.version_info.minor}"
+        return venv_path / "lib" / python / "site-packages"
+
+    def _link_virtual_environment_layer(self, venv_path: Path, base: Path):
+        """
+        Make the packages of a base venv importable from a layer venv.
+
+        The base site-packages are appended to `sys.path` by a `.pth` file, so the
+        packages installed in the layer take precedence over the base.
+
+        Args:
+          venv_path (Path): The path to the layer venv.
+          base (Path): The path to the base venv.
+        """
+        site_packages = self._site_packages(venv_path)
+        site_packages.mkdir(parents=True, exist_ok=True)
+        (site_packages / "snk-base.pth").write_text(f"{self._site_packages(base)}\n")
+
+    def _venv_layers(self, venv_path: Path = None) -> List[Path]:
+        """
+        Get a venv and the base venvs it is layered over.
+
+        Args:
+          venv_path (Path, optional): The path to the venv. Defaults to None.
+
+        Returns:
+          List[Path]: The venv followed by its base venvs.
+        """
+        layers = []
+        while venv_path and venv_path not in layers:
+            layers.append(venv_path)
+            base = self.virtual_environment_metadata(venv_path.name).get("base")
+            venv_path = self.snk_venv_dir / base if base else None
+        return layers
+
+    def _relocate_virtual_environment(self, old_path: Path, venv_path: Path):
+        """
+        Rewrite the paths baked into the scripts of a venv that was moved.
+
+        Args:
+          old_path (Path): The path the venv was created at.
+          venv_path (Path): The current path to the venv.
+        """
+        old, new = str(old_path).encode(), str(venv_path).encode()
+        for path in list((venv_path / "bin").iterdir()) + [venv_path / "pyvenv.cfg"]:
+            if path.is_symlink() or not path.is_file():
+                continue
+            data = path.read_bytes()
+            if old in data:
+                path.write_bytes(data.replace(old, new))
+
+    def _venv_pool_key(self, snakemake_version=None, dependencies=[], base: str = None) -> str:
+        """
+        Hash the inputs that determine the contents of a virtual environment.
+
+        Args:
+          snakemake_version (str, optional): The version of Snakemake to install in the virtual environment. Defaults to None.
+          dependencies (list, optional): A list of dependencies to install. Defaults to [].
+          base (str, optional): The key of the venv the dependencies are layered over. Defaults to None.
+
+        Returns:
+          str: The key of the virtual environment in the venv pool.
+
+        Examples:
+          >>> nest._venv_pool_key("7.32.4", ["pandas"])
+          '3f0c2d9a1b7e4c55'
+        """
+        snk_cli_version = next((dep for dep in dependencies if "snk_cli" in dep), "snk_cli")
+        dependencies = sorted(dep for dep in dependencies if "snk_cli" not in dep)
+        key = json.dumps(
+            [
+                str(self.python_interpreter_path),
+                sys.version,
+                self._format_snakemake_requirement(snakemake_version),
+                dependencies,
+                snk_cli_version,
+            ]
+            + ([base] if base else [])
+        )
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def virtual_environment_metadata(self, key: str) -> dict:
+        """
+        Read the metadata of a virtual environment in the venv pool.
+
+        Args:
+          key (str): The key of the virtual environment (see `RegistryEntry.venv`).
+
+        Returns:
+          dict: The metadata (requirements and the installer backend), empty if the venv is missing.
+
+        Examples:
+          >>> nest.virtual_environment_metadata("3f0c2d9a1b7e4c55")["installer"]
+          'uv'
+        """
+        try:
+            return json.loads((self.snk_venv_dir / key / "snk-venv.json").read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _venv_references(self, name: str) -> List[Path]:
+        """
+        Get the references a workflow holds on shared virtual environments.
+
+        Args:
+          name (str): The name of the workflow.
+
+        Returns:
+          List[Path]: The reference files of the workflow.
+        """
+        if not self.snk_venv_dir.exists():
+            return []
+        return [
+            venv_path / "snk-refs" / name
+            for venv_path in self.snk_venv_dir.iterdir()
+            if (venv_path / "snk-refs" / name).exists()
+        ]
+
+    def _release_venv_references(self, name: str, keep: List[Path] = []):
+        """
+        Release the references a workflow holds on shared virtual environments.
+
+        Venvs without any remaining references are moved to the trash.
+
+        Args:
+          name (str): The name of the workflow.
+          keep (List[Path], optional): The venvs to keep the references to. Defaults to [].
+        """
+        for venv_reference in self._venv_references(name):
+            if venv_reference.parent.parent not in keep:
+                self._release_venv_reference(venv_reference)
+
+    def _release_venv_reference(self, venv_reference: Path):
+        venv_path = venv_reference.parent.parent
+        # installs add their references while holding the venv lock
+        with self._lock(f"venv:{venv_path.name}"):
+            try:
+                references = os.listdir(venv_reference.parent)
+            except FileNotFoundError:
+                return
+            if references == [venv_reference.name]:
+                self._discard([venv_path])
+            else:
+                venv_reference.unlink(missing_ok=True)
+
+    def _format_snakemake_requirement(self, snakemake_version=None) -> str:
+        """
+        Format a snakemake version as a pip requirement.
+
+        Args:
+          snakemake_version (str, optional): The version of Snakemake. Defaults to None.
+
+        Returns:
+          str: The pip requirement for snakemake.
+
+        Examples:
+          >>> nest._format_snakemake_requirement("7.32.4")
+          'snakemake==7.32.4'
+        """
+        if not snakemake_version:
+            return "snakemake"
+        # check if snakemake version starts with >, <, =
+        if snakemake_version[0] in [">", "<", "="]:
+            return f"snakemake{snakemake_version}"
+        return f"snakemake=={snakemake_version}"
+
+    def _venv_requirements(self, snakemake_version=None, dependencies=[]) -> List[str]:
+        """
+        Get the packages to install in a virtual environment.
+
+        Args:
+          snakemake_version (str, optional): The version of Snakemake. Defaults to None.
+          dependencies (list, optional): A list of dependencies. Defaults to [].
+
+        Returns:
+          List[str]: The pip requirements.
+        """
+        dependencies = list(dependencies)
+        snk_cli_in_deps = len([dep for dep in dependencies if "snk_cli" in dep]) > 0
+        if not snk_cli_in_deps:
+            dependencies.append("snk_cli")
+        snakemake_requirement = self._format_snakemake_requirement(snakemake_version)
+        return [snakemake_requirement, "setuptools"] + dependencies
+
+    def _install_snk_cli_in_venv(
+        self, venv_path: Path, snakemake_version=None, dependencies=[], offline=False
+    ):
+        """
+        Install snk_cli in the virtual environment.
+
+        Packages are installed by the installer backend (see `Nest.installer`). The pip
+        backend installs from the wheelhouse in SNK_HOME and resolves and builds
+        missing wheels into the wheelhouse first, unless installing offline.
+
+        Args:
+          venv_path (Path): The path to the virtual environment.
+          snakemake_version (str, optional): The version of Snakemake to install in the virtual
+          environment. Defaults to "7.32.4".
+          dependencies (list, optional): A list of dependencies to install. Defaults to [].
+          offline (bool, optional): Only install from the wheelhouse. Defaults to False.
+
+        Examples:
+          >>> nest._install_snk_cli_in_venv(Path("/path/to/venv"), snakemake_version="7.32.4")
+        """
+        if not venv_path.exists():
+            raise FileNotFoundError(f"Virtual environment not found at {venv_path}")
+        self.installer.install(
+            venv_path, self._venv_requirements(snakemake_version, dependencies), offline=offline
+        )
+
+    def create_executable(
+        self,
+        workflow_path: Path,
+        name: str,
+        python_interpreter_path=None,
+        home: Path = None,
+        shim: str = "standard",
+    ) -> Path:
+        """
+        Create the executable for a workflow CLI.
+
+        The "frozen" shim starts python in isolated mode without the `site` module and
+        with the `sys.path` of the interpreter recorded now, which avoids scanning the
+        site directories on every call (slow on network filesystems). It has to be
+        reinstalled if packages are added to the interpreter later.
+
+        Args:
+          workflow_path (Path): The path to the workflow directory.
+          name (str): The name of the workflow.
+          python_interpreter_path (Path, optional): The python interpreter used to run the CLI. Defaults to the current interpreter.
+          home (Path, optional): Write the executable to the bin directory of this directory (laid out like SNK_HOME) instead of SNK_HOME. Defaults to None.
+          shim (str, optional): The flavour of the executable, "standard" or "frozen". Defaults to "standard".
+
+        Returns:
+          Path: The path to the workflow executable.
+
+        Examples:
+          >>> nest.create_executable(Path("/path/to/workflow"), "example")
+        """
+        if not python_interpreter_path:
+            python_interpreter_path = self.python_interpreter_path
+        if shim not in SHIM_FLAVOURS:
+            raise ValueError(f"Unknown shim '{shim}'. Choose from: {', '.join(SHIM_FLAVOURS)}")
+        template = executable_template(
+            workflow_path,
+            python_interpreter_path,
+            self._cli_spec_path(name),
+            self.snk_profiles_dir,
+            frozen=freeze_interpreter(python_interpreter_path) if shim == "frozen" else None,
+        )
+
+        if sys.platform.startswith("win"):
+            name += ".exe"
+
+        workflow_executable = (Path(home) if home else self.snk_home) / "bin" / name
+        workflow_executable.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(workflow_executable, "w") as f:
             f.write(template)
 
         workflow_executable.chmod(workflow_executable.stat().st_mode | stat.S_IEXEC)
 
         return workflow_executable
 
+    def _cli_spec_path(self, name: str) -> Path:
+        """
+        Get the path to the precompiled CLI spec of a workflow executable.
+
+        Args:
+          name (str): The name of the workflow.
+
+        Returns:
+          Path: The path to the CLI spec.
+        """
+        return self.snk_executable_dir / f".{name}.spec"
+
+    def compile_cli_spec(self, workflow_executable_path: Path, python_interpreter_path=None):
+        """
+        Precompile the CLI spec of a workflow executable.
+
+        The spec is built by the executable itself so it matches the snk_cli version
+        of the interpreter that runs the workflow. Failures are ignored (it never
+        raises) as the executable rebuilds the spec when it is missing.
+
+        Args:
+          workflow_executable_path (Path): The path to the workflow executable.
+          python_interpreter_path (Path, optional): The python interpreter used to run the CLI. Defaults to the current interpreter.
+
+        Returns:
+          bool: Whether the spec was compiled.
+
+        Examples:
+          >>> nest.compile_cli_spec(Path("/path/to/bin/example"))
+          True
+        """
+        if not python_interpreter_path:
+            python_interpreter_path = self.python_interpreter_path
+        try:
+            process = subprocess.run(
+                [str(python_interpreter_path), str(workflow_executable_path)],
+                env={**os.environ, COMPILE_CLI_SPEC_ENV: "1"},
+                capture_output=True,
+            )
+        except OSError:
+            return False
+        return process.returncode == 0
+
     def link_workflow_executable_to_bin(self, workflow_executable_path: Path):
         """
         Links a workflow executable to the bin directory.
@@ -678,23 +2361,30 @@ class Nest:
           >>> nest.link_workflow_executable_to_bin(Path("/path/to/workflow_executable"))
         """
         name = workflow_executable_path.name
-        if (self.bin_dir / name).is_symlink() and os.readlink(self.bin_dir / name) == str(
-            workflow_executable_path
-        ):
-            # skip if it's already there
-            return self.bin_dir / name
-        try:
-            os.symlink(workflow_executable_path.absolute(), self.bin_dir / name)
-        except FileExistsError:
-            raise WorkflowExistsError(f"File '{name}' already exists in SNK_BIN ({self.bin_dir})")
+        with self._lock("bin"):
+            if (self.bin_dir / name).is_symlink() and os.readlink(self.bin_dir / name) == str(
+                workflow_executable_path
+            ):
+                # skip if it's already there
+                return self.bin_dir / name
+            try:
+                os.symlink(workflow_executable_path.absolute(), self.bin_dir / name)
+            except FileExistsError:
+                raise WorkflowExistsError(
+                    f"File '{name}' already exists in SNK_BIN ({self.bin_dir})"
+                )
         return self.bin_dir / name
 
     def check_for_snakemake_min_version(self, workflow_path: Path, snakefile: Path = None):
         """
         Check if the workflow has a minimum version of Snakemake.
 
+        The Snakefile and the files it includes are scanned for `min_version`, see
+        `snk.scan.snakemake_min_version`.
+
         Args:
           workflow_path (Path): The path to the workflow directory.
+          snakefile (Path, optional): The Snakefile relative to the workflow directory. Defaults to None.
 
         Returns:
           str: The minimum version of Snakemake.
@@ -702,24 +2392,9 @@ class Nest:
         Examples:
           >>> nest.check_for_snakemake_min_version(Path("/path/to/workflow"))
         """
-        import re
+        from .scan import snakemake_min_version
 
-        min_version = "0.0.0"
-        if snakefile:
-            snakefile = workflow_path / snakefile
-        else:
-            for snakefile in workflow_path.glob("**/Snakefile"):
-                if snakefile.exists():
-                    break
-            else:
-                return min_version
-        with open(snakefile, "r") as f:
-            for line in f:
-                match = re.search(r"min_version\((.*)\)", line)
-                if match:
-                    min_version = match.group(1).strip().strip('"').strip("'")
-                    break
-        return min_version
+        return snakemake_min_version(workflow_path, snakefile)
 
     @property
     def _current_snakemake_version(self):
@@ -732,9 +2407,9 @@ class Nest:
         Examples:
           >>> nest.get_current_current_snakemake_version()
         """
-        from snakemake.common import __version__
+        from importlib.metadata import version
 
-        return __version__
+        return version("snakemake")
 
     def check_for_snk_cli_min_version(self, workflow_path: Path):
         """
@@ -749,6 +2424,8 @@ class Nest:
         Examples:
           >>> nest.check_for_snk_cli_min_version(Path("/path/to/workflow"))
         """
+        from snk_cli.config.config import SnkConfig
+
         snk_config = SnkConfig.from_workflow_dir(workflow_path, create_if_not_exists=True)
         try:
             return snk_config.min_snk_cli_version
@@ -766,11 +2443,11 @@ class Nest:
         Examples:
           >>> nest.get_current_current_snk_cli_version()
         """
-        from snk_cli.__about__ import __version__
+        from importlib.metadata import version
 
-        return __version__
+        return version("snk_cli")
 
-    def validate_Snakemake_repo(self, repo: Repo):
+    def validate_Snakemake_repo(self, repo: "Repo"):
         """
         Validates a Snakemake repository.
 
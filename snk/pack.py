@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import stat
+import subprocess
+import zipfile
+from pathlib import Path
+from typing import List
+
+from .scan import walk
+
+# Prints the files of the pure-python distributions snk_cli needs at runtime that
+# are not installed with snakemake (which the target node provides). Run by the
+# interpreter of the workflow so the packed snk_cli matches the CLI spec.
+PACKAGES_SCRIPT = """
+import json, sys
+from importlib.metadata import PackageNotFoundError, distribution
+from packaging.requirements import Requirement
+from packaging.utils import canonicalize_name
+
+def closure(name):
+    found = {}
+    stack = [name]
+    while stack:
+        name = canonicalize_name(stack.pop())
+        if name in found:
+            continue
+        try:
+            found[name] = dist = distribution(name)
+        except PackageNotFoundError:
+            found[name] = None
+            continue
+        for requirement in map(Requirement, dist.requires or []):
+            if requirement.marker and not requirement.marker.evaluate({"extra": ""}):
+                continue
+            stack.append(requirement.name)
+    return found
+
+provided = closure("snakemake")
+packages, skipped = {}, []
+for name, dist in closure("snk_cli").items():
+    if name in provided or dist is None:
+        continue
+    files = [f for f in dist.files or [] if not str(f).startswith("..")]
+    if any(f.suffix in (".so", ".pyd", ".dylib", ".dll") for f in files):
+        skipped.append(name)
+        continue
+    packages[name] = [
+        (str(dist.locate_file(f)), f.as_posix())
+        for f in files
+        if "__pycache__" not in f.parts and f.name != "RECORD"
+    ]
+print(json.dumps({"packages": packages, "skipped": skipped}))
+"""
+
+MAIN = """\
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+
+ARCHIVE = getattr(__loader__, "archive", None) or os.path.dirname(os.path.abspath(__file__))
+
+
+def read(name):
+    with zipfile.ZipFile(ARCHIVE) as archive:
+        return archive.read(name)
+
+
+def extract_workflow(meta):
+    # extracted once per version of the archive, shared by later runs
+    cache = Path(os.environ.get("SNK_PACK_CACHE") or Path.home() / ".cache" / "snk" / "pyz")
+    target = cache / meta["hash"] / meta["name"]
+    if target.exists():
+        return target
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=".extract-", dir=target.parent))
+    try:
+        with zipfile.ZipFile(ARCHIVE) as archive:
+            for info in archive.infolist():
+                if not info.filename.startswith("workflow/"):
+                    continue
+                path = archive.extract(info, tmp)
+                mode = (info.external_attr >> 16) & 0o777
+                if mode:
+                    os.chmod(path, mode)
+        try:
+            os.rename(tmp / "workflow", target)
+        except OSError:
+            # extracted by another process in the meantime
+            pass
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return target
+
+
+def remap(path, meta, target):
+    # paths in the snk.yaml written at install time point to the install the archive was packed from
+    if path is None:
+        return path
+    for prefix in meta["paths"]:
+        try:
+            return type(path)(target / Path(path).relative_to(prefix))
+        except ValueError:
+            continue
+    return path
+
+
+def precompiled_help(spec, argv):
+    # the help of a command from the CLI spec, without importing snk_cli
+    if not argv or spec["prog"] != sys.argv[0]:
+        return None
+    path = []
+    for name in argv[:-1]:
+        if name not in spec["commands"][" ".join(path)]["commands"]:
+            return None
+        path.append(name)
+    command = spec["commands"][" ".join(path)]
+    return command["help"] if argv[-1] in command["help_options"] else None
+
+
+def main():
+    meta = json.loads(read("snk-pack.json"))
+    sys.argv[0] = meta["name"]
+    output = precompiled_help(json.loads(read("snk.spec")), sys.argv[1:])
+    if output is not None:
+        if not sys.stdout.isatty() or os.environ.get("NO_COLOR"):
+            output = re.sub(r"\\x1b\\[[0-9;]*m", "", output)
+        sys.stdout.write(output)
+        return 0
+    target = extract_workflow(meta)
+    from snk_cli import CLI
+    from snk_cli.config.config import SnkConfig
+
+    snk_config = SnkConfig.from_workflow_dir(target, create_if_not_exists=True)
+    for attr in ["snakefile", "configfile", "_snk_config_path"]:
+        setattr(snk_config, attr, remap(getattr(snk_config, attr), meta, target))
+    snk_config.resources = [remap(r, meta, target) for r in snk_config.resources]
+    CLI(target, snk_config=snk_config)()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+"""
+
+
+def pack_workflow(
+    workflow_path: Path,
+    name: str,
+    spec_path: Path,
+    python_interpreter_path: Path,
+    output: Path,
+    install_paths: List[Path] = [],
+    interpreter: str = "/usr/bin/env python3",
+) -> dict:
+    """
+    Pack a workflow CLI into a single executable zipapp.
+
+    The archive holds the workflow directory (without ignored paths, see
+    `snk.scan.load_ignore_patterns`), the precompiled CLI spec and the
+    pure-python packages snk_cli needs that are not installed with snakemake.
+    It runs with any python that has snakemake installed. The workflow is
+    extracted once to `$SNK_PACK_CACHE` (default `~/.cache/snk/pyz`) on the
+    first run.
+
+    Args:
+      workflow_path (Path): The path to the workflow directory.
+      name (str): The name of the workflow CLI.
+      spec_path (Path): The path to the precompiled CLI spec.
+      python_interpreter_path (Path): The python interpreter of the workflow (provides snk_cli).
+      output (Path): The path to write the archive to.
+      install_paths (List[Path], optional): Paths in the snk config that point to the workflow directory. Defaults to [].
+      interpreter (str, optional): The interpreter in the shebang of the archive. Defaults to "/usr/bin/env python3".
+
+    Returns:
+      dict: The packed `packages` and the `skipped` packages with compiled code.
+
+    Examples:
+      >>> pack_workflow(
+      ...     Path("/path/to/snk/workflows/example"),
+      ...     "example",
+      ...     Path("/path/to/snk/bin/.example.spec"),
+      ...     Path("/usr/bin/python"),
+      ...     Path("example.pyz"),
+      ... )
+      {'packages': ['rich', 'snk-cli', 'typer', ...], 'skipped': []}
+    """
+    workflow_path = Path(workflow_path).resolve()
+    output = Path(output)
+    process = subprocess.run(
+        [str(python_interpreter_path), "-c", PACKAGES_SCRIPT],
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise Exception(f"Failed to find the snk_cli packages to pack. Error: {process.stderr}")
+    packages = json.loads(process.stdout)
+    digest = hashlib.sha256()
+    tmp_path = output.with_name(f".{output.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(f"#!{interpreter}\n".encode())
+            with zipfile.ZipFile(f, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr("__main__.py", MAIN)
+                spec = Path(spec_path).read_bytes()
+                digest.update(spec)
+                archive.writestr("snk.spec", spec)
+                for entry in walk(workflow_path, follow_symlinks=True):
+                    path = Path(entry.path)
+                    if not path.is_file():
+                        continue
+                    arcname = f"workflow/{path.relative_to(workflow_path).as_posix()}"
+                    digest.update(arcname.encode())
+                    digest.update(path.read_bytes())
+                    archive.write(path, arcname)
+                for files in packages["packages"].values():
+                    for source, arcname in files:
+                        archive.write(source, arcname)
+                meta = {
+                    "name": name,
+                    "hash": digest.hexdigest()[:16],
+                    "paths": [str(p) for p in install_paths] + [str(workflow_path)],
+                }
+                archive.writestr("snk-pack.json", json.dumps(meta, indent=2))
+        os.chmod(tmp_path, os.stat(tmp_path).st_mode | stat.S_IEXEC | stat.S_IXGRP | stat.S_IXOTH)
+        os.replace(tmp_path, output)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return {"packages": sorted(packages["packages"]), "skipped": packages["skipped"]}
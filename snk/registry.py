@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from .locks import FileLock
+
+
+@dataclass
+class RegistryEntry:
+    """
+    An installed workflow in the registry.
+
+    Attributes:
+      name (str): The name of the workflow.
+      path (str): The path to the workflow in SNK_HOME.
+      executable (str): The path to the workflow executable.
+      version (str, optional): The installed version of the workflow. Defaults to None.
+      source (str, optional): The URL or local path the workflow was installed from. Defaults to None.
+      commit (str, optional): The installed commit SHA. Defaults to None.
+      venv (str, optional): The key of the shared venv used by the workflow. Defaults to None.
+      subdir (str, optional): The subdirectory of the repository containing the workflow. Defaults to None.
+      editable (bool): Whether the workflow is installed in editable mode. Defaults to False.
+      installed (float, optional): The time of the install (seconds since the epoch). Defaults to None.
+    """
+
+    name: str
+    path: str
+    executable: str
+    version: Optional[str] = None
+    source: Optional[str] = None
+    commit: Optional[str] = None
+    venv: Optional[str] = None
+    subdir: Optional[str] = None
+    editable: bool = False
+    installed: Optional[float] = None
+
+
+class Registry:
+    """
+    A JSON index of the workflows installed in SNK_HOME.
+
+    Listing and looking up workflows only needs to read the index instead of
+    scanning the workflows directory and parsing every snk.yaml. Updates rewrite
+    the index to a temporary file that atomically replaces the old index, while
+    holding a lock shared with the other processes using the registry.
+
+    Args:
+      path (Path): The path to the registry file.
+      lock_path (Path, optional): The path to the lock file held while updating the registry. Defaults to a lock file next to the registry.
+      lock_timeout (float, optional): Seconds to wait for the lock (see `snk.locks.FileLock`). Defaults to `$SNK_LOCK_TIMEOUT` or waiting until it is released.
+
+    Examples:
+      >>> registry = Registry(Path("/path/to/snk/registry.json"))
+    """
+
+    def __init__(self, path: Path, lock_path: Path = None, lock_timeout: float = None) -> None:
+        self.path = Path(path)
+        self.lock_path = (
+            Path(lock_path) if lock_path else self.path.with_name(f".{self.path.name}.lock")
+        )
+        self.lock_timeout = lock_timeout
+        self._lock = None
+
+    @property
+    def lock(self) -> "FileLock":
+        # created on the first update so reading the registry does not import the locks
+        if self._lock is None:
+            from .locks import FileLock, default_lock_timeout
+
+            self._lock = FileLock(
+                self.lock_path,
+                timeout=default_lock_timeout() if self.lock_timeout is None else self.lock_timeout,
+                description="the registry lock",
+            )
+        return self._lock
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def entries(self) -> Dict[str, RegistryEntry]:
+        """
+        Read the installed workflows.
+
+        Returns:
+          Dict[str, RegistryEntry]: The registry entries by workflow name.
+
+        Examples:
+          >>> registry.entries()
+          {'example': RegistryEntry(name='example', ...)}
+        """
+        try:
+            with open(self.path) as f:
+                workflows = json.load(f).get("workflows", {})
+        except FileNotFoundError:
+            return {}
+        names = {f.name for f in fields(RegistryEntry)}
+        return {
+            name: RegistryEntry(**{k: v for k, v in entry.items() if k in names})
+            for name, entry in workflows.items()
+        }
+
+    def get(self, name: str) -> Optional[RegistryEntry]:
+        """
+        Look up a workflow by name.
+
+        Args:
+          name (str): The name of the workflow.
+
+        Returns:
+          Optional[RegistryEntry]: The registry entry or None if the workflow is not installed.
+
+        Examples:
+          >>> registry.get("example")
+        """
+        return self.entries().get(name)
+
+    def add(self, entry: RegistryEntry):
+        """
+        Add (or replace) a workflow in the registry.
+
+        Args:
+          entry (RegistryEntry): The registry entry of the workflow.
+
+        Examples:
+          >>> registry.add(RegistryEntry("example", "/path/to/workflow", "/path/to/bin/example"))
+        """
+        self.update([entry])
+
+    def remove(self, name: str):
+        """
+        Remove a workflow from the registry.
+
+        Args:
+          name (str): The name of the workflow.
+
+        Examples:
+          >>> registry.remove("example")
+        """
+        self.update(remove=[name])
+
+    def update(self, entries: List[RegistryEntry] = [], remove: List[str] = []):
+        """
+        Add and remove workflows in a single transaction.
+
+        Args:
+          entries (List[RegistryEntry], optional): Entries to add or replace. Defaults to [].
+          remove (List[str], optional): Names of workflows to remove. Defaults to [].
+
+        Examples:
+          >>> registry.update(remove=["example"])
+        """
+        # other processes may update the registry between reading and replacing it
+        with self.lock:
+            workflows = self.entries()
+            for name in remove:
+                workflows.pop(name, None)
+            for entry in entries:
+                workflows[entry.name] = entry
+            self._write(workflows)
+
+    def _write(self, workflows: Dict[str, RegistryEntry]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(
+            f".{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        data = {"version": 1, "workflows": {n: asdict(e) for n, e in sorted(workflows.items())}}
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,353 @@
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+# Directories that never contain workflow sources but can hold millions of files
+# (snakemake metadata and conda envs, VCS data, virtual environments and outputs).
+DEFAULT_IGNORE_PATTERNS = [
+    ".git/",
+    ".hg/",
+    ".svn/",
+    ".snakemake/",
+    ".conda/",
+    ".pixi/",
+    ".venv/",
+    "venv/",
+    ".tox/",
+    ".nox/",
+    "__pycache__/",
+    "node_modules/",
+    "/results/",
+    "/logs/",
+]
+
+IGNORE_FILES = [".snkignore", ".gitignore"]
+
+# Snakefile locations searched by snakemake, in order
+STANDARD_SNAKEFILES = ["Snakefile", "snakefile", "workflow/Snakefile", "workflow/snakefile"]
+
+MIN_VERSION_RE = re.compile(r"""\bmin_version\(\s*["']([^"']+)["']\s*\)""")
+INCLUDE_RE = re.compile(r"""^\s*include\s*:\s*["']([^"']+)["']""")
+MODULE_RE = re.compile(r"^\s*module\s+\w+\s*:")
+MODULE_SNAKEFILE_RE = re.compile(r"""^\s*snakefile\s*[:=]\s*["']([^"']+)["']""")
+
+
+def load_ignore_patterns(root: Path, defaults: bool = True) -> List[str]:
+    """
+    Read the ignore patterns of a workflow directory.
+
+    Patterns are read from `.snkignore` and `.gitignore` in the root of the
+    workflow and use the `.gitignore` syntax (see `is_ignored`). The ignore
+    files of subdirectories are read by `walk`.
+
+    Args:
+      root (Path): The path to the workflow directory.
+      defaults (bool, optional): Include `DEFAULT_IGNORE_PATTERNS`. Defaults to True.
+
+    Returns:
+      List[str]: The ignore patterns.
+
+    Examples:
+      >>> load_ignore_patterns(Path("/path/to/workflow"))
+      ['.git/', '.snakemake/', ...]
+    """
+    patterns = list(DEFAULT_IGNORE_PATTERNS) if defaults else []
+    return patterns + _read_ignore_files(Path(root))
+
+
+def _read_ignore_files(directory: Path, relative_dir: str = "") -> List[str]:
+    """Read the ignore files of a directory, relative to the workflow if it is a subdirectory."""
+    patterns = []
+    for ignore_file in IGNORE_FILES:
+        try:
+            with open(directory / ignore_file) as f:
+                lines = [line.strip() for line in f]
+        except OSError:
+            continue
+        for line in lines:
+            if not line or line.startswith("#"):
+                continue
+            if relative_dir:
+                line = _relative_to_workflow(line, relative_dir)
+            patterns.append(line)
+    return patterns
+
+
+def _relative_to_workflow(pattern: str, relative_dir: str) -> str:
+    # patterns of a subdirectory only match in it: anchored patterns relative to
+    # the subdirectory, the others at any depth below it
+    negate = "!" if pattern.startswith("!") else ""
+    pattern = pattern[len(negate) :]
+    if "/" in pattern.rstrip("/"):
+        return f"{negate}{relative_dir}{pattern.lstrip('/')}"
+    return f"{negate}{relative_dir}**/{pattern}"
+
+
+@lru_cache(maxsize=None)
+def _compile(pattern: str) -> re.Pattern:
+    """Translate a `.gitignore` pattern (without `!` and trailing `/`) to a regex."""
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    regex = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**", i) and (i == 0 or pattern[i - 1] == "/"):
+            if pattern.startswith("/", i + 2):
+                # zero or more directories
+                regex.append("(?:.*/)?")
+                i += 3
+                continue
+            if i + 2 == len(pattern):
+                # everything inside
+                regex.append(".*")
+                i += 2
+                continue
+        if c == "*":
+            regex.append("[^/]*")
+            while pattern.startswith("*", i + 1):
+                i += 1
+        elif c == "?":
+            regex.append("[^/]")
+        elif c == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            chars = pattern[i + 1 : end]
+            if chars.startswith("!"):
+                chars = "^" + chars[1:]
+            regex.append("[" + chars.replace("\\", "\\\\") + "]")
+            i = end
+        elif c == "\\" and i + 1 < len(pattern):
+            i += 1
+            regex.append(re.escape(pattern[i]))
+        else:
+            regex.append(re.escape(c))
+        i += 1
+    # patterns without a slash match at any depth
+    prefix = "" if anchored else "(?:.*/)?"
+    return re.compile(prefix + "".join(regex))
+
+
+def is_ignored(relative_path: str, patterns: List[str], is_dir: bool = False) -> bool:
+    """
+    Check if a path matches the ignore patterns.
+
+    Patterns use the `.gitignore` syntax: `*` and `?` do not match `/`, `**/`
+    matches any number of directories and a trailing `/**` everything inside a
+    directory. A pattern with a `/` at the start or in the middle is anchored to
+    the workflow directory, other patterns match at any depth. A trailing `/`
+    only matches directories and a leading `!` re-includes a path. The last
+    matching pattern wins. Paths in an ignored directory are not checked here,
+    `walk` does not descend into ignored directories.
+
+    Args:
+      relative_path (str): The path relative to the workflow directory (using `/`).
+      patterns (List[str]): The ignore patterns, see `load_ignore_patterns`.
+      is_dir (bool, optional): Whether the path is a directory. Defaults to False.
+
+    Returns:
+      bool: True if the path is ignored.
+
+    Examples:
+      >>> is_ignored(".snakemake", [".snakemake/"], is_dir=True)
+      True
+      >>> is_ignored("docs/x.png", ["docs/**/*.png"])
+      True
+    """
+    ignored = False
+    for pattern in patterns:
+        negate = pattern.startswith("!")
+        if negate:
+            pattern = pattern[1:]
+        if pattern.endswith("/"):
+            if not is_dir:
+                continue
+            pattern = pattern.rstrip("/")
+        if pattern and _compile(pattern).fullmatch(relative_path):
+            ignored = not negate
+    return ignored
+
+
+def walk(
+    root: Path,
+    patterns: Optional[List[str]] = None,
+    include_dirs: bool = False,
+    follow_symlinks: bool = False,
+) -> Iterator[os.DirEntry]:
+    """
+    Walk a workflow directory, pruning ignored directories.
+
+    The `.snkignore` and `.gitignore` files of subdirectories add patterns for
+    the paths below them, like nested `.gitignore` files.
+
+    Args:
+      root (Path): The path to the workflow directory.
+      patterns (List[str], optional): The ignore patterns. Defaults to `load_ignore_patterns(root)`.
+      include_dirs (bool, optional): Also yield directories (before their contents). Defaults to False.
+      follow_symlinks (bool, optional): Walk into symlinked directories. Defaults to False.
+
+    Yields:
+      os.DirEntry: The files (and directories) that are not ignored.
+
+    Examples:
+      >>> [entry.path for entry in walk(Path("/path/to/workflow"))]
+    """
+    if patterns is None:
+        patterns = load_ignore_patterns(root)
+    stack = [(str(root), "", patterns)]
+    visited = set()
+    while stack:
+        path, relative_dir, patterns = stack.pop()
+        if follow_symlinks:
+            # symlinked directories can form cycles
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if (stat.st_dev, stat.st_ino) in visited:
+                continue
+            visited.add((stat.st_dev, stat.st_ino))
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        if relative_dir and any(entry.name in IGNORE_FILES for entry in entries):
+            patterns = patterns + _read_ignore_files(Path(path), relative_dir)
+        directories = []
+        for entry in entries:
+            relative_path = f"{relative_dir}{entry.name}"
+            try:
+                is_dir = entry.is_dir(follow_symlinks=follow_symlinks)
+            except OSError:
+                is_dir = False
+            if is_ignored(relative_path, patterns, is_dir=is_dir):
+                continue
+            if is_dir:
+                directories.append((entry, f"{relative_path}/"))
+            else:
+                yield entry
+        # depth first, in name order
+        for entry, relative_path in reversed(directories):
+            stack.append((entry.path, relative_path, patterns))
+        if include_dirs:
+            # yielded after the stack is extended so callers can create them in order
+            yield from (entry for entry, _ in directories)
+
+
+def find_snakefile(workflow_path: Path, snakefile: Path = None) -> Optional[Path]:
+    """
+    Find the main Snakefile of a workflow.
+
+    The configured Snakefile is used if given. Otherwise the standard snakemake
+    locations are checked before falling back to a pruned search of the workflow.
+
+    Args:
+      workflow_path (Path): The path to the workflow directory.
+      snakefile (Path, optional): The Snakefile relative to the workflow directory. Defaults to None.
+
+    Returns:
+      Optional[Path]: The path to the Snakefile or None if the workflow has no Snakefile.
+
+    Examples:
+      >>> find_snakefile(Path("/path/to/workflow"))
+      PosixPath('/path/to/workflow/workflow/Snakefile')
+    """
+    workflow_path = Path(workflow_path)
+    if snakefile:
+        path = workflow_path / snakefile
+        return path if path.is_file() else None
+    for name in STANDARD_SNAKEFILES:
+        path = workflow_path / name
+        if path.is_file():
+            return path
+    for entry in walk(workflow_path):
+        if entry.name == "Snakefile":
+            return Path(entry.path)
+    return None
+
+
+def snakefile_dependencies(snakefile: Path) -> Iterator[Path]:
+    """
+    Find the files included by a Snakefile.
+
+    Only literal paths of `include:` statements and `snakefile:` directives of
+    `module` definitions are followed, relative to the including file.
+    Remote (URL) modules are skipped.
+
+    Args:
+      snakefile (Path): The path to the Snakefile.
+
+    Yields:
+      Path: The paths of the included files.
+
+    Examples:
+      >>> list(snakefile_dependencies(Path("/path/to/workflow/Snakefile")))
+      [PosixPath('/path/to/workflow/rules/align.smk')]
+    """
+    in_module = False
+    with open(snakefile, errors="replace") as f:
+        for line in f:
+            if MODULE_RE.match(line):
+                in_module = True
+                continue
+            match = INCLUDE_RE.match(line)
+            if not match and in_module:
+                match = MODULE_SNAKEFILE_RE.match(line)
+                if line.strip() and not line[0].isspace():
+                    in_module = False
+            if match and "://" not in match.group(1):
+                yield snakefile.parent / match.group(1)
+
+
+def snakemake_min_version(workflow_path: Path, snakefile: Path = None) -> str:
+    """
+    Find the strictest `min_version` declared by a workflow.
+
+    Starting from the main Snakefile (see `find_snakefile`), every included rule
+    file and local module is streamed line by line.
+
+    Args:
+      workflow_path (Path): The path to the workflow directory.
+      snakefile (Path, optional): The Snakefile relative to the workflow directory. Defaults to None.
+
+    Returns:
+      str: The highest minimum version of Snakemake or "0.0.0" if none is declared.
+
+    Examples:
+      >>> snakemake_min_version(Path("/path/to/workflow"))
+      '7.0.0'
+    """
+    from packaging.version import InvalidVersion
+    from packaging.version import parse as parse_version
+
+    min_version = "0.0.0"
+    main_snakefile = find_snakefile(workflow_path, snakefile)
+    if main_snakefile is None:
+        return min_version
+    queue = [main_snakefile]
+    seen = set()
+    while queue:
+        path = queue.pop(0)
+        try:
+            key = path.resolve()
+        except OSError:
+            continue
+        if key in seen or not path.is_file():
+            continue
+        seen.add(key)
+        with open(path, errors="replace") as f:
+            for line in f:
+                if line.lstrip().startswith("#"):
+                    continue
+                match = MIN_VERSION_RE.search(line)
+                if not match:
+                    continue
+                try:
+                    if parse_version(match.group(1)) > parse_version(min_version):
+                        min_version = match.group(1)
+                except InvalidVersion:
+                    continue
+        queue.extend(snakefile_dependencies(path))
+    return min_version
@@ -0,0 +1,206 @@
+import hashlib
+import os
+import pickle
+import shutil
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from .copytree import NEVER_LINK
+
+# Directories of a workflow that are not deduplicated: the git metadata and the
+# environments and caches created at runtime.
+SKIP_DIRS = [".git", ".snakemake", ".conda", ".singularity"]
+
+
+class Store:
+    """
+    A content-addressed store of workflow files.
+
+    Files are stored once as blobs named by the sha256 of their contents and
+    their permissions. Deduplicating a workflow directory replaces its files
+    with hardlinks to the blobs, so workflows that vendor the same files share
+    them on disk. Files are shared, editing one in place edits it in every
+    workflow. Files snk edits in place (see `snk.copytree.NEVER_LINK`), `.git`
+    and the runtime directories (`SKIP_DIRS`) are skipped.
+
+    The index maps the inodes of the blobs to their names, so deduplicating
+    again only hashes files that are new or changed since.
+
+    Args:
+      path (Path): The path to the store directory.
+      max_workers (int, optional): The number of threads hashing files. Defaults to the number of CPUs (max 8).
+
+    Examples:
+      >>> store = Store(Path("/path/to/snk/store"))
+      >>> store.dedupe([Path("/path/to/snk/workflows/example")])
+      {'files': 120, 'hashed': 120, 'linked': 3, 'saved': 1048576}
+    """
+
+    def __init__(self, path: Path, max_workers: int = None) -> None:
+        self.path = Path(path)
+        self.objects_dir = self.path / "objects"
+        self.index_path = self.path / "index.pickle"
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+
+    def _load_index(self) -> Dict[tuple, tuple]:
+        # (dev, ino): (size, mtime_ns, blob name)
+        try:
+            with open(self.index_path, "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            return {}
+
+    def _save_index(self, index: Dict[tuple, tuple]):
+        tmp_path = self.index_path.with_name(f"{self.index_path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(index, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            pass
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def files(self, root: Path) -> Iterator[Path]:
+        """
+        Get the files of a workflow directory that are deduplicated.
+
+        Args:
+          root (Path): The path to the workflow directory.
+
+        Returns:
+          Iterator[Path]: The regular files, symlinks are skipped.
+        """
+        root = Path(root)
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                relative_path = path.relative_to(root).as_posix()
+                # the workflow may be in a subdirectory of the root (e.g. a sparse repo)
+                if any(relative_path == p or relative_path.endswith(f"/{p}") for p in NEVER_LINK):
+                    continue
+                yield path
+
+    def blob_path(self, name: str) -> Path:
+        return self.objects_dir / name[:2] / name
+
+    def dedupe(self, roots: List[Path]) -> Dict[str, int]:
+        """
+        Replace the files of workflow directories with hardlinks to blobs in the store.
+
+        Args:
+          roots (List[Path]): The paths to the workflow directories.
+
+        Returns:
+          Dict[str, int]: The number of `files` checked, the files `hashed`, the files `linked` to an existing blob and the bytes `saved` by linking.
+        """
+        index = self._load_index()
+        counts = {"files": 0, "hashed": 0, "linked": 0, "saved": 0}
+        to_hash = []
+        for root in roots:
+            for path in self.files(root):
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                counts["files"] += 1
+                indexed = index.get((st.st_dev, st.st_ino))
+                if indexed and indexed[:2] == (st.st_size, st.st_mtime_ns):
+                    # already a blob
+                    continue
+                if indexed:
+                    # a blob was edited in place, don't link files with the old contents to it
+                    index.pop((st.st_dev, st.st_ino))
+                    self._unlink(self.blob_path(indexed[2]))
+                to_hash.append((path, st))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            digests = list(executor.map(lambda item: _hash_file(item[0]), to_hash))
+        for (path, st), digest in zip(to_hash, digests):
+            if digest is None:
+                continue
+            counts["hashed"] += 1
+            name = f"{digest}-{stat.S_IMODE(st.st_mode):o}"
+            stored = self.blob_path(name).exists()
+            blob = self._store(path, name, st)
+            if blob is None:
+                continue
+            if stored:
+                counts["linked"] += 1
+                counts["saved"] += st.st_size
+            blob_st = os.lstat(blob)
+            index[(blob_st.st_dev, blob_st.st_ino)] = (blob_st.st_size, blob_st.st_mtime_ns, name)
+        if to_hash:
+            self._save_index(index)
+        return counts
+
+    def _store(self, path: Path, name: str, st: os.stat_result) -> Path:
+        """Link a file to its blob, the file becomes the blob if it is not stored yet."""
+        blob = self.blob_path(name)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            if st.st_nlink == 1:
+                os.link(path, blob)
+                return blob
+            # linked to files outside the store (e.g. the source of a local install), which
+            # must not change the blob when they are edited
+            tmp_blob = blob.with_name(f".{name}.{os.getpid()}.tmp")
+            try:
+                shutil.copy2(path, tmp_blob)
+                os.link(tmp_blob, blob)
+            finally:
+                self._unlink(tmp_blob)
+        except FileExistsError:
+            pass
+        except OSError:
+            # e.g. the workflow is on another filesystem
+            return None
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.dedupe")
+        try:
+            os.link(blob, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError:
+            self._unlink(tmp_path)
+            return None
+        return blob
+
+    def _unlink(self, path: Path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def unused_blobs(self) -> List[Path]:
+        """
+        Get the blobs that no workflow links to anymore.
+
+        Returns:
+          List[Path]: The paths to the unused blobs.
+        """
+        unused = []
+        if not self.objects_dir.exists():
+            return unused
+        for prefix in sorted(self.objects_dir.iterdir()):
+            for blob in sorted(prefix.iterdir()):
+                try:
+                    if os.lstat(blob).st_nlink == 1:
+                        unused.append(blob)
+                except OSError:
+                    continue
+        return unused
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
@@ -0,0 +1,170 @@
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+# Trash entries are renamed to `.reaping-<pid>@<host>-<name>` by the process deleting them.
+CLAIM_PREFIX = ".reaping-"
+
+
+def pid_is_running(pid: int) -> bool:
+    """
+    Check if a process is running.
+
+    Args:
+      pid (int): The process id.
+
+    Returns:
+      bool: False if the process is gone. Always True on Windows.
+    """
+    if sys.platform.startswith("win"):
+        # os.kill terminates the process on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _claimed_by(name: str) -> Optional[str]:
+    if not name.startswith(CLAIM_PREFIX):
+        return None
+    return name[len(CLAIM_PREFIX) :].split("-", 1)[0]
+
+
+def _unclaimed(trash_dir: Path) -> List[os.DirEntry]:
+    """Get the trash entries that are not being deleted by a running process."""
+    from .locks import owner_is_alive
+
+    try:
+        with os.scandir(trash_dir) as it:
+            entries = list(it)
+    except FileNotFoundError:
+        return []
+    return [
+        entry
+        for entry in entries
+        if _claimed_by(entry.name) is None
+        or not owner_is_alive(_claimed_by(entry.name), Path(entry.path))
+    ]
+
+
+def has_garbage(trash_dir: Path) -> bool:
+    """
+    Check if the trash holds entries that no running reaper is deleting.
+
+    Args:
+      trash_dir (Path): The path to the trash directory.
+
+    Returns:
+      bool: True if there is something to reap.
+    """
+    return len(_unclaimed(trash_dir)) > 0
+
+
+def reap(trash_dir: Path, max_workers: int = None) -> int:
+    """
+    Delete the contents of the trash.
+
+    Entries are claimed by renaming them first so several reapers can run at the
+    same time (on several hosts sharing the trash). Claimed entries are touched
+    while they are deleted, entries claimed by a reaper that died are claimed
+    again. The contents of the claimed directories are deleted in parallel.
+
+    Args:
+      trash_dir (Path): The path to the trash directory.
+      max_workers (int, optional): The number of threads deleting files. Defaults to the number of CPUs (max 8).
+
+    Returns:
+      int: The number of trash entries deleted.
+
+    Examples:
+      >>> reap(Path("/path/to/snk/.trash"))
+      3
+    """
+    from .locks import heartbeat, owner_tag
+
+    trash_dir = Path(trash_dir)
+    if max_workers is None:
+        max_workers = min(8, os.cpu_count() or 1)
+    claimed = []
+    for entry in _unclaimed(trash_dir):
+        name = entry.name
+        if _claimed_by(name) is not None:
+            name = name[len(CLAIM_PREFIX) :].split("-", 1)[-1]
+        claim = trash_dir / f"{CLAIM_PREFIX}{owner_tag()}-{name}"
+        try:
+            os.rename(entry.path, claim)
+        except OSError:
+            # claimed by another reaper
+            continue
+        claimed.append(claim)
+    # spread the work of deleting large directories (e.g. venvs) over the threads
+    tasks = []
+    for path in claimed:
+        if path.is_dir() and not path.is_symlink():
+            try:
+                tasks.extend(path.iterdir())
+            except OSError:
+                pass
+    for path in claimed:
+        heartbeat.add(path)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(_remove, tasks))
+        for path in claimed:
+            _remove(path)
+    finally:
+        for path in claimed:
+            heartbeat.discard(path)
+    return len(claimed)
+
+
+def _remove(path: Path):
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def spawn_reaper(trash_dir: Path) -> subprocess.Popen:
+    """
+    Delete the contents of the trash in a detached process.
+
+    The reaper keeps running after snk exits.
+
+    Args:
+      trash_dir (Path): The path to the trash directory.
+
+    Returns:
+      subprocess.Popen: The reaper process.
+
+    Examples:
+      >>> spawn_reaper(Path("/path/to/snk/.trash"))
+    """
+    kwargs = {}
+    if sys.platform.startswith("win"):
+        kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    return subprocess.Popen(
+        [sys.executable, "-m", "snk.trash", str(trash_dir)],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        close_fds=True,
+        **kwargs,
+    )
+
+
+if __name__ == "__main__":
+    reap(Path(sys.argv[1]))
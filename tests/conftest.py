@@ -1,8 +1,10 @@
+import shutil
 from pathlib import Path
 from typing import Tuple
 
 import pytest
 import yaml
+from git import Actor, Repo
 from snk_cli.config import SnkConfig
 
 from snk import Nest
@@ -22,7 +24,24 @@ def snk_home(tmp_path_factory: Path):
 
 @pytest.fixture()
 def nest(snk_home, bin_dir):
-    return Nest(snk_home, bin_dir)
+    # pin the installer so the pip commands don't depend on uv being on the PATH
+    return Nest(snk_home, bin_dir, installer="pip")
+
+
+@pytest.fixture()
+def workflow_repo(tmp_path_factory) -> str:
+    """A git repository of the test workflow with a v1.0.0 tag and a second commit."""
+    path = Path(tmp_path_factory.mktemp("remote")) / "workflow"
+    shutil.copytree("tests/data/workflow", path)
+    repo = Repo.init(path)
+    actor = Actor("snk", "snk@example.com")
+    repo.git.add(A=True)
+    repo.index.commit("Initial commit", author=actor, committer=actor)
+    repo.create_tag("v1.0.0")
+    (path / "CHANGELOG.md").write_text("v1.1.0")
+    repo.git.add(A=True)
+    repo.index.commit("Second commit", author=actor, committer=actor)
+    return f"file://{path}"
 
 
 @pytest.fixture()
@@ -0,0 +1,66 @@
+import os
+from pathlib import Path
+
+import pytest
+
+import snk.copytree
+from snk.copytree import copy_workflow
+
+
+@pytest.fixture()
+def workflow(tmp_path: Path) -> Path:
+    path = tmp_path / "workflow"
+    (path / "workflow" / "rules").mkdir(parents=True)
+    (path / "workflow" / "Snakefile").write_text('include: "rules/a.smk"\n')
+    (path / "workflow" / "rules" / "a.smk").write_text("rule a:\n")
+    (path / "config").mkdir()
+    (path / "config" / "config.yaml").write_text("msg: hello\n")
+    (path / "snk.yaml").write_text("tagline: hello\n")
+    (path / "empty").mkdir()
+    for ignored in [".snakemake/conda", ".git/objects", "results", "data"]:
+        (path / ignored).mkdir(parents=True)
+        (path / ignored / "file").write_text("ignored")
+    (path / "reads.bam").write_text("ignored")
+    (path / ".gitignore").write_text("*.bam\n")
+    (path / ".snkignore").write_text("data/\n")
+    return path
+
+
+def test_copy_workflow_links_files(workflow: Path, tmp_path: Path):
+    dst = tmp_path / "installed"
+    counts = copy_workflow(workflow, dst)
+    copied = sorted(p.relative_to(dst).as_posix() for p in dst.rglob("*"))
+    assert copied == [
+        ".gitignore",
+        ".snkignore",
+        "config",
+        "config/config.yaml",
+        "empty",
+        "snk.yaml",
+        "workflow",
+        "workflow/Snakefile",
+        "workflow/rules",
+        "workflow/rules/a.smk",
+    ]
+    # snk edits these in place so they are never linked
+    for path in ["snk.yaml", "config/config.yaml"]:
+        assert not os.path.samestat(os.stat(workflow / path), os.stat(dst / path))
+    assert counts["copied"] == 2
+    assert counts["reflinked"] + counts["hardlinked"] == 4
+    if counts["hardlinked"]:
+        assert os.path.samestat(
+            os.stat(workflow / "workflow" / "Snakefile"), os.stat(dst / "workflow" / "Snakefile")
+        )
+
+
+def test_copy_workflow_chunked(workflow: Path, tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(snk.copytree, "CHUNK_SIZE", 7)
+    data = os.urandom(100)
+    (workflow / "resources.bin").write_bytes(data)
+    os.chmod(workflow / "resources.bin", 0o750)
+    dst = tmp_path / "installed"
+    counts = copy_workflow(workflow, dst, link=False, max_workers=4)
+    assert counts == {"reflinked": 0, "hardlinked": 0, "copied": 7}
+    assert (dst / "resources.bin").read_bytes() == data
+    assert (dst / "resources.bin").stat().st_mode & 0o777 == 0o750
+    assert (dst / "workflow" / "Snakefile").read_text() == 'include: "rules/a.smk"\n'
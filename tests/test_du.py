@@ -0,0 +1,70 @@
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+from snk import Nest
+from snk.du import DiskUsage
+
+
+def make_tree(path: Path):
+    (path / "a" / "b").mkdir(parents=True)
+    (path / "a" / "file").write_bytes(b"x" * 10)
+    (path / "a" / "b" / "file").write_bytes(b"x" * 100)
+    os.link(path / "a" / "b" / "file", path / "a" / "link")
+    (path / "a" / "symlink").symlink_to(path / "a" / "b" / "file")
+    (path / "env").mkdir()
+    (path / "env" / "file").write_bytes(b"x" * 1000)
+
+
+def test_disk_usage_counts_hardlinks_once(tmp_path: Path):
+    make_tree(tmp_path)
+    symlink_size = os.lstat(tmp_path / "a" / "symlink").st_size
+    usage = DiskUsage()
+    assert usage.size([tmp_path]) == 1110 + symlink_size
+    assert usage.size([tmp_path], exclude=[tmp_path / "env"]) == 110 + symlink_size
+    assert usage.size([tmp_path / "a" / "b", tmp_path / "a" / "link"]) == 100
+    assert usage.size([tmp_path / "missing"]) == 0
+
+
+def test_disk_usage_cache(tmp_path: Path):
+    home = tmp_path / "home"
+    make_tree(home)
+    # directories modified in the last seconds are not cached
+    for root, dirs, files in os.walk(home):
+        os.utime(root, (0, 0))
+    cache_path = tmp_path / "du.pickle"
+    usage = DiskUsage(cache_path)
+    size = usage.size([home])
+    usage.save()
+    with patch("os.scandir", side_effect=AssertionError("listed a cached directory")):
+        assert DiskUsage(cache_path).size([home]) == size
+    (home / "env" / "other").write_bytes(b"x" * 5)
+    assert DiskUsage(cache_path).size([home]) == size + 5
+
+
+def test_nest_disk_usage(nest: Nest):
+    nest.install("tests/data/workflow")
+    nest.install("tests/data/workflow", name="other")
+    venv = nest.snk_venv_dir / "shared"
+    (venv / "snk-refs").mkdir(parents=True)
+    (venv / "lib").write_bytes(b"x" * 1000)
+    for name in ["workflow", "other"]:
+        (venv / "snk-refs" / name).touch()
+        entry = nest.registry.get(name)
+        entry.venv = "shared"
+        nest.registry.add(entry)
+    conda = nest.snk_workflows_dir / "workflow" / ".conda"
+    conda.mkdir()
+    (conda / "env").write_bytes(b"x" * 100)
+    report = nest.disk_usage()
+    workflow, other = sorted(report.workflows, key=lambda w: w.name != "workflow")
+    assert workflow.venv == other.venv == 1000
+    assert workflow.envs == 100
+    assert other.envs == 0
+    assert workflow.workflow > 0 and other.workflow > 0
+    assert workflow.total == workflow.workflow + 1100
+    # the shared venv (and files hardlinked between the copies) are counted once
+    assert report.total <= workflow.total + other.total - 1000
+    assert report.home >= report.total
+    assert (nest.snk_cache_dir / "du.pickle").exists()
+    assert nest.disk_usage(["other"]).workflows == [other]
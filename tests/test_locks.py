@@ -0,0 +1,115 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from snk import Nest
+from snk.errors import LockTimeoutError, WorkflowExistsError
+from snk.locks import STALE_AFTER, FileLock
+
+
+def write_lock(path: Path, pid: int, host: str = None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    owner = {"pid": pid, "host": host or socket.gethostname(), "time": 0, "token": "other"}
+    path.write_text(json.dumps(owner))
+
+
+def test_file_lock(tmp_path: Path):
+    path = tmp_path / "locks" / "workflow-example.lock"
+    lock = FileLock(path, timeout=0.1, description="the lock of workflow 'example'")
+    with lock:
+        with lock:
+            # reentrant
+            assert lock.owner()["pid"] == os.getpid()
+        assert path.exists()
+        with pytest.raises(LockTimeoutError, match=f"held by pid {os.getpid()}"):
+            FileLock(path, timeout=0.1).acquire()
+    assert not path.exists()
+    # held by another process that is running
+    write_lock(path, os.getppid())
+    with pytest.raises(LockTimeoutError, match="the lock of workflow 'example'"):
+        lock.acquire()
+    assert lock.owner()["token"] == "other"
+
+
+def test_file_lock_breaks_stale_locks(tmp_path: Path):
+    path = tmp_path / "workflow-example.lock"
+    lock = FileLock(path, timeout=1)
+    # pids are at most 2**22 on linux so this process is gone
+    write_lock(path, 2**22 + 1)
+    with lock:
+        assert lock.owner()["pid"] == os.getpid()
+    # a process on another host that stopped touching the lock
+    write_lock(path, os.getppid(), host="elsewhere")
+    os.utime(path, (0, 0))
+    assert lock.is_stale(lock.owner())
+    with lock:
+        assert lock.owner()["pid"] == os.getpid()
+    write_lock(path, os.getppid(), host="elsewhere")
+    assert not lock.is_stale(lock.owner())
+    assert STALE_AFTER > 0
+
+
+def test_uninstall_waits_for_install_lock(nest: Nest):
+    nest.install("tests/data/workflow")
+    other = Nest(nest.snk_home, nest.bin_dir, lock_timeout=0.1)
+    with nest._lock("workflow:workflow"):
+        with pytest.raises(LockTimeoutError):
+            other.uninstall("workflow", force=True)
+    assert other.uninstall("workflow", force=True)
+
+
+def test_concurrent_installs(nest: Nest):
+    script = (
+        "import sys\n"
+        "from snk import Nest\n"
+        "from snk.errors import WorkflowExistsError\n"
+        "nest = Nest(sys.argv[1], sys.argv[2], installer='pip')\n"
+        "try:\n"
+        "    nest.install('tests/data/workflow', name=sys.argv[3])\n"
+        "except WorkflowExistsError:\n"
+        "    sys.exit(3)\n"
+    )
+    names = ["same", "same", "same", "other"]
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", script, str(nest.snk_home), str(nest.bin_dir), name]
+        )
+        for name in names
+    ]
+    codes = [process.wait() for process in processes]
+    # installs of the same name wait for each other and the later ones fail cleanly
+    assert sorted(codes[:3]) == [0, 3, 3]
+    assert codes[3] == 0
+    assert sorted(nest.registry.entries()) == ["other", "same"]
+    for name in ["same", "other"]:
+        assert (nest.bin_dir / name).resolve() == nest.snk_executable_dir / name
+    assert list(nest.snk_locks_dir.glob("*.lock")) == []
+    with pytest.raises(WorkflowExistsError):
+        nest.install("tests/data/workflow", name="same")
+
+
+def test_uninstall_keeps_venv_referenced_meanwhile(nest: Nest, monkeypatch):
+    nest.install("tests/data/workflow")
+    # a shared venv only the workflow uses
+    venv_path = nest.snk_venv_dir / "shared"
+    venv_reference = venv_path / "snk-refs" / "workflow"
+    venv_reference.parent.mkdir(parents=True)
+    (venv_path / "snk-venv.json").write_text("{}")
+    venv_reference.touch()
+    assert venv_path in nest.get_paths_to_delete("workflow")
+    delete_paths = nest.delete_paths
+
+    def delete_paths_while_installing(paths):
+        # another install references the venv after the paths to delete were found
+        (venv_reference.parent / "other").touch()
+        delete_paths(paths)
+
+    monkeypatch.setattr(nest, "delete_paths", delete_paths_while_installing)
+    assert nest.uninstall("workflow", force=True)
+    assert venv_path.exists()
+    assert os.listdir(venv_reference.parent) == ["other"]
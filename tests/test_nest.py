@@ -1,6 +1,21 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import zipfile
 from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from git import Repo
+from snk_cli.config import SnkConfig
 
 from snk import Nest
+from snk.errors import WorkflowExistsError, WorkflowNotFoundError
+from snk.executable import executable_template
+from snk.trash import CLAIM_PREFIX, has_garbage, reap
 
 
 def test_init(bin_dir, snk_home):
@@ -17,6 +32,87 @@ def test_download(nest: Nest):
     assert path == expected_location
 
 
+def test_download_uses_mirror(nest: Nest, workflow_repo: str):
+    path = nest.download(workflow_repo, "latest")
+    assert (path / "CHANGELOG.md").exists()
+    mirrors = list(nest.snk_mirrors_dir.iterdir())
+    assert len(mirrors) == 1
+    path = nest.download(workflow_repo, "tagged", tag_name="v1.0.0")
+    assert not (path / "CHANGELOG.md").exists()
+    assert list(nest.snk_mirrors_dir.iterdir()) == mirrors
+    assert Repo(path).remote().url == workflow_repo
+
+
+def test_mirror_only_fetches_branches_and_tags(nest: Nest, workflow_repo: str):
+    remote = Repo(workflow_repo[len("file://") :])
+    remote.git.update_ref("refs/pull/1/head", remote.head.commit.hexsha)
+    nest.download(workflow_repo, "latest")
+    (mirror_path,) = nest.snk_mirrors_dir.iterdir()
+    refs = Repo(mirror_path).git.for_each_ref("--format=%(refname)").splitlines()
+    assert "refs/tags/v1.0.0" in refs
+    assert not [ref for ref in refs if ref.startswith("refs/pull/")]
+    # mirrors cloned with --mirror are converted when they are updated
+    shutil.rmtree(mirror_path)
+    Repo.clone_from(workflow_repo, mirror_path, mirror=True)
+    nest.download(workflow_repo, "again")
+    mirror = Repo(mirror_path)
+    assert not [
+        ref
+        for ref in mirror.git.for_each_ref("--format=%(refname)").splitlines()
+        if ref.startswith("refs/pull/")
+    ]
+    assert mirror.git.config("--get-all", "remote.origin.fetch").splitlines() == [
+        "+refs/heads/*:refs/heads/*",
+        "+refs/tags/*:refs/tags/*",
+    ]
+
+
+def test_download_tag_not_found(nest: Nest, workflow_repo: str):
+    with pytest.raises(WorkflowNotFoundError, match="Did you mean 'v1.0'"):
+        nest.download(workflow_repo, "missing", tag_name="1.0")
+
+
+def test_download_commit_is_shallow(nest: Nest, workflow_repo: str):
+    remote = Repo(workflow_repo[len("file://") :])
+    first_commit = remote.head.commit.parents[0].hexsha
+    path = nest.download(workflow_repo, "pinned", commit=first_commit)
+    repo = Repo(path)
+    assert repo.head.commit.hexsha == first_commit
+    assert (path / ".git" / "shallow").exists()
+    assert not nest.snk_mirrors_dir.exists()
+
+
+def test_download_short_commit_deepens(nest: Nest, workflow_repo: str):
+    remote = Repo(workflow_repo[len("file://") :])
+    first_commit = remote.head.commit.parents[0].hexsha
+    path = nest.download(workflow_repo, "pinned", commit=first_commit[:8])
+    assert Repo(path).head.commit.hexsha == first_commit
+
+
+def test_download_commit_not_found(nest: Nest, workflow_repo: str):
+    with pytest.raises(WorkflowNotFoundError, match="Workflow commit 'deadbeef' not found"):
+        nest.download(workflow_repo, "pinned", commit="deadbeef")
+
+
+def test_download_subdir(nest: Nest, workflow_repo: str):
+    path = nest.download(workflow_repo, "subworkflow", subdir="workflow")
+    repo_dir = nest.snk_repos_dir / "subworkflow"
+    assert path == nest.snk_workflows_dir / "subworkflow"
+    assert path.resolve() == (repo_dir / "workflow").resolve()
+    assert (path / "Snakefile").exists()
+    assert (repo_dir / "snk.yaml").exists()
+    assert not (repo_dir / "things").exists()
+    assert nest.get_workflow_subdir("subworkflow") == Path("workflow")
+    nest.delete_paths(nest.get_paths_to_delete("subworkflow"))
+    assert not repo_dir.exists()
+    assert not path.is_symlink()
+
+
+def test_download_subdir_not_found(nest: Nest, workflow_repo: str):
+    with pytest.raises(WorkflowNotFoundError, match="subdirectory 'missing' not found"):
+        nest.download(workflow_repo, "subworkflow", subdir="missing")
+
+
 def test_create_package(nest: Nest):
     test_workflow_path = nest.snk_workflows_dir / "workflow-name"
     test_workflow_path.mkdir()
@@ -42,6 +138,64 @@ def test_install_custom_name(nest: Nest):
     assert workflow.name == "custom-name"
 
 
+def test_install_compiles_cli_spec(nest: Nest, tmp_path: Path):
+    workflow_dir = tmp_path / "spec-workflow"
+    shutil.copytree("tests/data/workflow", workflow_dir)
+    workflow = nest.install(workflow_dir, editable=True)
+    spec_path = nest.snk_executable_dir / ".spec-workflow.spec"
+    assert spec_path.exists()
+    result = subprocess.run([workflow.executable, "-h"], capture_output=True, text=True)
+    assert result.returncode == 0
+    assert "Usage" in result.stdout
+    # editing the snk config rebuilds the spec
+    snk_config = SnkConfig.from_workflow_dir(workflow_dir)
+    snk_config.tagline = "A freshly edited tagline"
+    snk_config.save()
+    result = subprocess.run([workflow.executable, "-h"], capture_output=True, text=True)
+    assert "A freshly edited tagline" in result.stdout
+    spec = json.loads(spec_path.read_text(encoding="utf-8"))
+    assert "A freshly edited tagline" in spec["commands"][""]["help"]
+
+
+def test_cli_spec_answers_help_and_completion_without_snk_cli(nest: Nest):
+    workflow = nest.install("tests/data/workflow")
+    python = [sys.executable, "-X", "importtime", workflow.executable]
+    process = subprocess.run(python + ["run", "-h"], capture_output=True, text=True)
+    assert process.returncode == 0
+    assert "Usage: workflow run" in process.stdout
+    assert "\x1b[" not in process.stdout
+    assert "snk_cli" not in process.stderr
+    assert "typer" not in process.stderr
+    env = {
+        **os.environ,
+        "_WORKFLOW_COMPLETE": "complete_bash",
+        "COMP_WORDS": "workflow r",
+        "COMP_CWORD": "1",
+    }
+    process = subprocess.run(python, env=env, capture_output=True, text=True)
+    assert process.stdout.split() == ["run"]
+    assert "snk_cli" not in process.stderr
+    env.update(COMP_WORDS="workflow run --con", COMP_CWORD="2")
+    process = subprocess.run([workflow.executable], env=env, capture_output=True, text=True)
+    assert process.stdout.split() == ["--config"]
+    env = {**os.environ, "_WORKFLOW_COMPLETE": "source_bash"}
+    process = subprocess.run([workflow.executable], env=env, capture_output=True, text=True)
+    assert "complete -o default -F _workflow_completion workflow" in process.stdout
+
+
+def test_cli_spec_is_rebuilt_when_a_config_file_is_added(nest: Nest, tmp_path: Path):
+    workflow_dir = tmp_path / "spec-workflow"
+    shutil.copytree("tests/data/workflow", workflow_dir)
+    workflow = nest.install(workflow_dir, editable=True)
+    result = subprocess.run([workflow.executable, "run", "-h"], capture_output=True, text=True)
+    assert "--beta" not in result.stdout
+    # config/config.yaml takes precedence over the config.yaml the spec was compiled from
+    (workflow_dir / "config").mkdir()
+    (workflow_dir / "config" / "config.yaml").write_text("beta: 2\n")
+    result = subprocess.run([workflow.executable, "run", "-h"], capture_output=True, text=True)
+    assert "--beta" in result.stdout
+
+
 def test_link_workflow_executable_to_bin(nest: Nest):
     workflow_executable_path = Path("tests/data/bin/snk-basic-pipeline")
     executable_path = nest.link_workflow_executable_to_bin(workflow_executable_path)
@@ -55,3 +209,316 @@ def test_uninstall(nest: Nest):
     assert len(nest.workflows) == 0
     assert not (nest.snk_workflows_dir / "workflow").exists()
     assert not (nest.snk_home / "bin" / "workflow").exists()
+
+
+def test_install_many(nest: Nest):
+    finished = []
+    results = nest.install_many(
+        ["tests/data/workflow", {"workflow": "tests/data/workflow", "name": "workflow"}],
+        callback=lambda index, result: finished.append(index),
+    )
+    assert sorted(finished) == [0, 1]
+    assert sum(isinstance(r, Exception) for r in results) == 1
+    assert len(nest.workflows) == 1
+
+
+def test_install_is_staged(nest: Nest):
+    nest.install(
+        "tests/data/workflow",
+        config=Path("config.yaml"),
+        additional_resources=[Path("resources/data.txt")],
+    )
+    workflow_path = nest.snk_workflows_dir / "workflow"
+    snk_config = SnkConfig.from_workflow_dir(workflow_path)
+    assert snk_config.configfile == workflow_path / "config.yaml"
+    assert snk_config.resources[-1] == workflow_path / "resources" / "data.txt"
+    assert f'create_cli("{workflow_path}")' in (nest.snk_executable_dir / "workflow").read_text()
+    assert list(nest.snk_staging_dir.iterdir()) == []
+    # the trash is deleted by a background reaper
+    for _ in range(100):
+        if not list(nest.snk_trash_dir.iterdir()):
+            break
+        time.sleep(0.05)
+    assert list(nest.snk_trash_dir.iterdir()) == []
+
+
+def test_failed_force_install_keeps_previous_install(nest: Nest):
+    nest.install("tests/data/workflow")
+    with pytest.raises(FileNotFoundError):
+        nest.install("tests/data/workflow", config=Path("missing.yaml"), force=True)
+    assert (nest.snk_workflows_dir / "workflow" / "snk.yaml").exists()
+    assert (nest.bin_dir / "workflow").resolve() == nest.snk_executable_dir / "workflow"
+    assert nest.registry.get("workflow") is not None
+    assert list(nest.snk_staging_dir.iterdir()) == []
+    nest.install("tests/data/workflow", force=True)
+    assert nest.registry.get("workflow") is not None
+
+
+def test_failed_publish_swaps_previous_install_back(nest: Nest):
+    nest.install("tests/data/workflow")
+    workflow_path = nest.snk_workflows_dir / "workflow"
+    (workflow_path / "previous.txt").write_text("previous")
+    replace = os.replace
+
+    def fail_to_replace_executable(src, dst):
+        if Path(dst).parent == nest.snk_executable_dir:
+            raise OSError("disk full")
+        replace(src, dst)
+
+    with patch("snk.nest.os.replace", side_effect=fail_to_replace_executable):
+        with pytest.raises(OSError, match="disk full"):
+            nest.install("tests/data/workflow", force=True)
+    # the workflow renamed into place before the failure is swapped back
+    assert (workflow_path / "previous.txt").read_text() == "previous"
+    assert list(nest.snk_staging_dir.iterdir()) == []
+
+
+def test_failed_registry_update_swaps_previous_install_back(nest: Nest):
+    nest.install("tests/data/workflow")
+    workflow_path = nest.snk_workflows_dir / "workflow"
+    (workflow_path / "previous.txt").write_text("previous")
+    executable = nest.snk_executable_dir / "workflow"
+    executable.write_text(executable.read_text() + "# previous\n")
+    entry = nest.registry.get("workflow")
+    with patch.object(nest.registry, "add", side_effect=OSError("disk full")):
+        with pytest.raises(OSError, match="disk full"):
+            nest.install("tests/data/workflow", force=True)
+        with pytest.raises(OSError, match="disk full"):
+            nest.install("tests/data/workflow", name="other")
+    # the registry is written while the install can still be swapped back
+    assert (workflow_path / "previous.txt").read_text() == "previous"
+    assert executable.read_text().endswith("# previous\n")
+    assert nest.registry.get("workflow") == entry
+    # a new install leaves no workflow, executable or link behind
+    assert not (nest.snk_workflows_dir / "other").exists()
+    assert not (nest.snk_executable_dir / "other").exists()
+    assert not os.path.lexists(nest.bin_dir / "other")
+    assert list(nest.snk_staging_dir.iterdir()) == []
+
+
+def test_empty_trash_removes_abandoned_stages(nest: Nest):
+    # pids are at most 2**22 on linux so this stage belongs to a process that is gone
+    abandoned = nest.snk_staging_dir / f"workflow-{2**22 + 1}-abcd"
+    abandoned.mkdir(parents=True)
+    active = nest._create_stage("workflow")
+    discarded = nest._create_stage("workflow")
+    nest._discard([discarded])
+    nest.empty_trash()
+    assert not abandoned.exists()
+    assert active.exists()
+    assert list(nest.snk_trash_dir.iterdir()) == []
+
+
+def test_stages_of_other_hosts_are_kept_while_touched(nest: Nest):
+    # the pid of this process, but on another host sharing SNK_HOME
+    remote = nest.snk_staging_dir / f"workflow-{2**22 + 1}@elsewhere-abcd"
+    remote.mkdir(parents=True)
+    nest.empty_trash()
+    assert remote.exists()
+    assert nest._installing()
+    os.utime(remote, (0, 0))
+    assert not nest._installing()
+    nest.empty_trash()
+    assert not remote.exists()
+
+
+def test_delete_paths_moves_directories_to_trash(nest: Nest):
+    workflow = nest.snk_workflows_dir / "workflow"
+    (workflow / "data").mkdir(parents=True)
+    (workflow / "data" / "file.txt").write_text("data")
+    with patch("snk.trash.spawn_reaper") as mock_spawn:
+        nest.delete_paths([workflow])
+        nest.empty_trash(background=True)
+    assert not workflow.exists()
+    assert [p.name.split("-")[0] for p in nest.snk_trash_dir.iterdir()] == ["workflow"]
+    mock_spawn.assert_called_once_with(nest.snk_trash_dir)
+
+
+def test_reap_reclaims_abandoned_claims(tmp_path: Path):
+    trash = tmp_path / ".trash"
+    (trash / "venv" / "lib").mkdir(parents=True)
+    (trash / "venv" / "lib" / "module.py").write_text("")
+    (trash / "file").write_text("")
+    # claimed by a reaper that is gone
+    (trash / f"{CLAIM_PREFIX}{2**22 + 1}-workflow" / "data").mkdir(parents=True)
+    # claimed by a running reaper
+    (trash / f"{CLAIM_PREFIX}{os.getpid()}-other").mkdir()
+    assert has_garbage(trash)
+    assert reap(trash) == 3
+    assert [p.name for p in trash.iterdir()] == [f"{CLAIM_PREFIX}{os.getpid()}-other"]
+    assert not has_garbage(trash)
+    # claimed by a reaper on another host, reclaimed once it stopped touching the claim
+    remote = trash / f"{CLAIM_PREFIX}{2**22 + 1}@elsewhere-workflow"
+    remote.mkdir()
+    assert not has_garbage(trash)
+    os.utime(remote, (0, 0))
+    assert reap(trash) == 1
+
+
+def test_gc(nest: Nest):
+    nest.install("tests/data/workflow")
+    nest.registry.add(nest._registry_entry("gone", editable=True))
+    # the venv of the installed workflow with a reference of a workflow that is gone
+    used = nest.snk_venv_dir / "used"
+    (used / "snk-refs").mkdir(parents=True)
+    (used / "snk-venv.json").write_text("{}")
+    (used / "snk-refs" / "workflow").touch()
+    (used / "snk-refs" / "gone").touch()
+    unused = nest.snk_venv_dir / "unused"
+    (unused / "snk-refs").mkdir(parents=True)
+    (unused / "snk-refs" / "gone").touch()
+    # pids are at most 2**22 on linux so these belong to processes that are gone
+    prepared = nest.snk_venv_dir / f".prepared-{2**22 + 1}-abcd"
+    prepared.mkdir()
+    (nest.snk_executable_dir / "gone").write_text("#!/bin/sh")
+    (nest.snk_executable_dir / ".gone.spec").write_text("spec")
+    (nest.bin_dir / "gone").symlink_to(nest.snk_executable_dir / "gone")
+    (nest.snk_repos_dir / "gone").mkdir(parents=True)
+    mirror = nest.snk_mirrors_dir / "gone-abcd.git"
+    mirror.mkdir(parents=True)
+    expected = [
+        (prepared, "prepared"),
+        (used / "snk-refs" / "gone", "reference"),
+        (unused, "venv"),
+        (nest.snk_executable_dir / ".gone.spec", "executable"),
+        (nest.snk_executable_dir / "gone", "executable"),
+        (nest.bin_dir / "gone", "link"),
+        (nest.snk_repos_dir / "gone", "repo"),
+        (mirror, "mirror"),
+        (nest.snk_workflows_dir / "gone", "registry"),
+    ]
+    # the trash of the install is deleted in the background
+    garbage = [g for g in nest.gc(dry_run=True) if g.kind != "trash"]
+    assert sorted((g.path, g.kind) for g in garbage) == sorted(expected)
+    assert {g.path: g.size for g in garbage}[nest.snk_executable_dir / ".gone.spec"] == 4
+    assert all(path.exists() or path.is_symlink() for path, kind in expected[:-1])
+    nest.gc()
+    assert not any(path.exists() or path.is_symlink() for path, kind in expected)
+    assert nest.registry.get("gone") is None
+    assert (used / "snk-refs" / "workflow").exists()
+    assert (nest.bin_dir / "workflow").resolve() == nest.snk_executable_dir / "workflow"
+    assert nest.gc(dry_run=True) == []
+    assert list(nest.snk_trash_dir.iterdir()) == []
+
+
+def test_gc_keeps_venvs_while_installing(nest: Nest):
+    unused = nest.snk_venv_dir / "unused"
+    unused.mkdir(parents=True)
+    active = nest._create_stage("workflow")
+    assert nest.gc(dry_run=True) == []
+    active.rmdir()
+    assert [g.path for g in nest.gc(dry_run=True)] == [unused]
+
+
+def test_install_local_git_workflow(nest: Nest, workflow_repo: str):
+    source = Path(workflow_repo[len("file://") :])
+    (source / ".snakemake" / "conda").mkdir(parents=True)
+    workflow = nest.install(source)
+    sha = Repo(source).head.commit.hexsha
+    entry = nest.registry.get(workflow.name)
+    assert entry.version == sha[:8]
+    assert entry.commit == sha
+    assert not (workflow.path / ".snakemake").exists()
+    assert (workflow.path / "CHANGELOG.md").exists()
+
+
+def test_install_events(nest: Nest):
+    events = []
+    nest.install("tests/data/workflow", on_event=events.append)
+    phases = [e["phase"] for e in events if e["event"] == "phase_end"]
+    assert phases == [
+        "resolve",
+        "copy",
+        "validate",
+        "config",
+        "shim",
+        "config",
+        "confirm",
+        "link",
+        "registry",
+        "publish",
+        "spec",
+    ]
+    end = events[-1]
+    assert end["event"] == "install_end"
+    assert end["name"] == "workflow"
+    assert end["status"] == "ok"
+    assert end["duration"] >= sum(end["timings"].values()) - 1e-3
+    events.clear()
+    with pytest.raises(WorkflowExistsError):
+        nest.install("tests/data/workflow", on_event=events.append)
+    assert events[-2]["phase"] == "resolve"
+    assert events[-2]["status"] == "error"
+    assert events[-1]["status"] == "error"
+    assert "already exists" in events[-1]["error"]
+
+
+@pytest.mark.parametrize(
+    "mode,suffix", [("wall", "json"), ("cprofile", "prof"), ("imports", "txt")]
+)
+def test_executable_profile(nest: Nest, mode: str, suffix: str):
+    workflow = nest.install("tests/data/workflow")
+    env = {**os.environ, "SNK_PROFILE": mode}
+    process = subprocess.run([workflow.executable, "info"], env=env, capture_output=True, text=True)
+    assert process.returncode == 0
+    assert json.loads(process.stdout)["name"] == "workflow"
+    profiles = list(nest.snk_profiles_dir.glob(f"workflow-*-{mode}.{suffix}"))
+    assert len(profiles) == 1
+    assert str(profiles[0]) in process.stderr
+    if mode == "wall":
+        timings = json.loads(profiles[0].read_text())["timings"]
+        assert set(timings) == {"import", "spec", "cli", "dispatch", "total"}
+    if mode == "imports":
+        assert "snk_cli" in profiles[0].read_text()
+
+
+def test_frozen_executable(nest: Nest):
+    workflow = nest.install("tests/data/workflow", shim="frozen")
+    lines = Path(workflow.executable).read_text().splitlines()
+    assert lines[0] == f"#!{nest.python_interpreter_path} -IS"
+    assert lines[2].startswith("sys.path[:] = ")
+    process = subprocess.run([workflow.executable, "-h"], capture_output=True, text=True)
+    assert process.returncode == 0
+    assert "Usage" in process.stdout
+    with pytest.raises(ValueError, match="Unknown shim"):
+        nest.create_executable(workflow.path, "other", shim="fast")
+
+
+def test_frozen_executable_long_interpreter_path():
+    frozen = {"path": ["/lib"], "prefix": "/", "exec_prefix": "/", "pth_imports": ["import os"]}
+    python = Path("/" + "long" * 40) / "bin" / "python"
+    template = executable_template(
+        Path("/workflow"), python, Path("/spec"), Path("/profiles"), frozen=frozen
+    )
+    lines = template.splitlines()
+    # the shebang would be truncated, python is started through /bin/sh
+    assert lines[0] == "#!/bin/sh"
+    assert lines[1] == f'\'\'\'exec\' "{python}" -I -S "$0" "$@"'
+    assert "exec('import os')" in lines
+
+
+def test_pack_cli(nest: Nest, tmp_path: Path):
+    nest.install("tests/data/workflow", config="config.yaml")
+    packed = nest.pack_cli("workflow", output=tmp_path / "workflow.pyz")
+    assert "snk-cli" in packed["packages"]
+    with zipfile.ZipFile(packed["path"]) as archive:
+        names = archive.namelist()
+    assert "workflow/workflow/Snakefile" in names
+    assert "snk_cli/__init__.py" in names
+    # the archive runs without SNK_HOME
+    shutil.rmtree(nest.snk_home)
+    env = {**os.environ, "SNK_PACK_CACHE": str(tmp_path / "cache")}
+    process = subprocess.run(
+        [sys.executable, packed["path"], "config"], env=env, capture_output=True, text=True
+    )
+    assert process.returncode == 0, process.stderr
+    assert "hello.txt" in process.stdout
+    assert len(list((tmp_path / "cache").glob("*/workflow/workflow/Snakefile"))) == 1
+    # the help is answered from the CLI spec in the archive
+    process = subprocess.run(
+        [sys.executable, packed["path"], "run", "-h"], env=env, capture_output=True, text=True
+    )
+    assert process.returncode == 0, process.stderr
+    assert "Usage: workflow run" in process.stdout
+    with pytest.raises(WorkflowNotFoundError):
+        nest.pack_cli("missing")
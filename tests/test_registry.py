@@ -0,0 +1,70 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from snk import Nest
+from snk.registry import Registry, RegistryEntry
+
+
+def test_registry_add_remove(tmp_path: Path):
+    registry = Registry(tmp_path / "registry.json")
+    assert not registry.exists()
+    assert registry.entries() == {}
+    registry.add(RegistryEntry("example", "/snk/workflows/example", "/snk/bin/example"))
+    registry.add(RegistryEntry("other", "/snk/workflows/other", "/snk/bin/other"))
+    assert registry.get("example").path == "/snk/workflows/example"
+    registry.remove("example")
+    assert registry.get("example") is None
+    assert list(Registry(tmp_path / "registry.json").entries()) == ["other"]
+
+
+def test_registry_concurrent_updates(tmp_path: Path):
+    path = tmp_path / "registry.json"
+    script = (
+        "import sys\n"
+        "from snk.registry import Registry, RegistryEntry\n"
+        "registry = Registry(sys.argv[1])\n"
+        "for i in range(50):\n"
+        "    name = f'{sys.argv[2]}-{i}'\n"
+        "    registry.add(RegistryEntry(name, f'/snk/workflows/{name}', f'/snk/bin/{name}'))\n"
+    )
+    processes = [
+        subprocess.Popen([sys.executable, "-c", script, str(path), str(n)]) for n in range(3)
+    ]
+    assert [process.wait() for process in processes] == [0, 0, 0]
+    # no process overwrote the entries added by the others
+    assert len(Registry(path).entries()) == 150
+
+
+def test_install_registers_workflow(nest: Nest):
+    nest.install("tests/data/workflow", name="registered")
+    entry = nest.registry.get("registered")
+    assert entry.path == str(nest.snk_workflows_dir / "registered")
+    assert entry.executable == str(nest.snk_executable_dir / "registered")
+    assert entry.source == "tests/data/workflow"
+    assert entry.installed is not None
+    nest.uninstall("registered", force=True)
+    assert nest.registry.get("registered") is None
+
+
+def test_rebuild_registry(nest: Nest):
+    nest.install("tests/data/workflow", editable=True)
+    nest.registry.path.unlink()
+    nest = Nest(nest.snk_home, nest.bin_dir)
+    entry = nest.registry.get("workflow")
+    assert entry.editable
+    assert entry.version == "editable"
+    assert [w.name for w in nest.workflows] == ["workflow"]
+
+
+def test_reconcile_registry(nest: Nest):
+    nest.install("tests/data/workflow", editable=True)
+    nest.install("tests/data/workflow", name="other")
+    # an install killed after publishing its workflow, before writing its entry
+    nest.registry.update(remove=["workflow", "other"])
+    with Nest(nest.snk_home, nest.bin_dir)._lock("workflow:other"):
+        # other is still being installed
+        assert list(nest.reconcile_registry()) == ["workflow"]
+    assert nest.registry.get("workflow").editable
+    assert sorted(w.name for w in nest.workflows) == ["other", "workflow"]
+    assert nest.registry.get("other") is not None
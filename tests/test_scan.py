@@ -0,0 +1,84 @@
+from pathlib import Path
+
+from snk.scan import find_snakefile, is_ignored, load_ignore_patterns, snakemake_min_version, walk
+
+
+def test_snakemake_min_version_follows_includes(tmp_path: Path):
+    (tmp_path / "workflow" / "rules").mkdir(parents=True)
+    (tmp_path / "modules").mkdir()
+    (tmp_path / "workflow" / "Snakefile").write_text(
+        'min_version("6.0")\n'
+        'include: "rules/align.smk"\n'
+        "module other:\n"
+        '    snakefile: "../modules/Snakefile"\n'
+        "use rule * from other\n"
+    )
+    (tmp_path / "workflow" / "rules" / "align.smk").write_text(
+        '# min_version("99.0")\nmin_version("7.1.0")\n'
+    )
+    (tmp_path / "modules" / "Snakefile").write_text('min_version("7.10")\n')
+    assert snakemake_min_version(tmp_path) == "7.10"
+
+
+def test_snakemake_min_version_configured_snakefile(tmp_path: Path):
+    (tmp_path / "Snakefile").write_text('min_version("6.0")\n')
+    (tmp_path / "other.smk").write_text('include: "other.smk"\nmin_version("8.0")\n')
+    assert snakemake_min_version(tmp_path, Path("other.smk")) == "8.0"
+    assert snakemake_min_version(tmp_path / "missing") == "0.0.0"
+
+
+def test_find_snakefile_prunes_ignored_dirs(tmp_path: Path):
+    (tmp_path / ".snakemake" / "conda").mkdir(parents=True)
+    (tmp_path / ".snakemake" / "conda" / "Snakefile").touch()
+    (tmp_path / "results").mkdir()
+    (tmp_path / "results" / "Snakefile").touch()
+    assert find_snakefile(tmp_path) is None
+    (tmp_path / "pipeline").mkdir()
+    (tmp_path / "pipeline" / "Snakefile").touch()
+    assert find_snakefile(tmp_path) == tmp_path / "pipeline" / "Snakefile"
+
+
+def test_ignore_patterns(tmp_path: Path):
+    (tmp_path / ".snkignore").write_text("# data\n*.bam\ndata/\n!keep.bam\n")
+    patterns = load_ignore_patterns(tmp_path)
+    assert is_ignored(".git", patterns, is_dir=True)
+    assert not is_ignored(".git", patterns)
+    assert is_ignored("sub/reads.bam", patterns)
+    assert not is_ignored("keep.bam", patterns)
+    assert is_ignored("sub/data", patterns, is_dir=True)
+    assert not is_ignored("sub/results", patterns, is_dir=True)
+    assert is_ignored("results", patterns, is_dir=True)
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "x.txt").touch()
+    (tmp_path / "Snakefile").touch()
+    assert [entry.name for entry in walk(tmp_path, patterns)] == [".snkignore", "Snakefile"]
+
+
+def test_ignore_patterns_use_gitignore_semantics(tmp_path: Path):
+    patterns = ["docs/**/*.png", "/build", "*.log", "cache/**", "a*/b"]
+    assert is_ignored("docs/x.png", patterns)
+    assert is_ignored("docs/img/deep/x.png", patterns)
+    assert not is_ignored("other/docs/x.png", patterns)
+    assert is_ignored("build", patterns, is_dir=True)
+    assert not is_ignored("sub/build", patterns, is_dir=True)
+    assert is_ignored("sub/run.log", patterns)
+    assert is_ignored("cache/x/y.txt", patterns)
+    assert is_ignored("abc/b", patterns)
+    # * does not cross /
+    assert not is_ignored("a/x/b", patterns)
+    assert is_ignored("data/reads.bam", ["**/reads.bam"])
+
+
+def test_walk_reads_nested_ignore_files(tmp_path: Path):
+    (tmp_path / "sub" / "deep").mkdir(parents=True)
+    (tmp_path / "sub" / ".gitignore").write_text("*.tmp\n/only-here.txt\n")
+    for path in ["a.tmp", "only-here.txt", "sub/a.tmp", "sub/only-here.txt", "sub/deep/b.tmp"]:
+        (tmp_path / path).touch()
+    (tmp_path / "sub" / "deep" / "only-here.txt").touch()
+    files = sorted(Path(entry.path).relative_to(tmp_path).as_posix() for entry in walk(tmp_path))
+    assert files == [
+        "a.tmp",
+        "only-here.txt",
+        "sub/.gitignore",
+        "sub/deep/only-here.txt",
+    ]
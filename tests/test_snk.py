@@ -1,8 +1,14 @@
+import json
+import subprocess
+import sys
 from pathlib import Path
+from typing import List
 
+import pytest
 from snk_cli.workflow import Workflow
 from typer.testing import CliRunner
 
+from snk import Nest
 from snk.main import app
 
 runner = CliRunner()
@@ -65,6 +71,32 @@ def test_config_path_cli(local_workflow: Workflow):
     assert result.exit_code == 0
     assert "/workflows/workflow/snk.yaml" in result.stdout  
 
+def test_snk_du(local_workflow: Workflow):
+    snk_home = local_workflow.path.parent.parent
+    bin_dir = local_workflow.path.parent.parent.parent / "bin"
+    result = runner.invoke(app, ["--home", snk_home, "--bin", bin_dir, "du"])
+    assert result.exit_code == 0
+    assert "workflow" in result.stdout
+    assert "SNK_HOME" in result.stdout
+    result = runner.invoke(app, ["--home", snk_home, "--bin", bin_dir, "du", "missing"])
+    assert result.exit_code == 1
+    result = runner.invoke(app, ["--home", snk_home, "--bin", bin_dir, "list", "--size"])
+    assert result.exit_code == 0
+    assert "Size" in result.stdout
+
+def test_snk_dedupe(snk_home: Path, bin_dir: Path):
+    for name in ["first", "second"]:
+        result = runner.invoke(
+            app,
+            ["--home", snk_home, "--bin", bin_dir, "install", "tests/data/workflow", "-n", name],
+        )
+        assert result.exit_code == 0
+    result = runner.invoke(app, ["--home", snk_home, "--bin", bin_dir, "dedupe"])
+    assert result.exit_code == 0
+    assert "Linked" in result.stdout
+    result = runner.invoke(app, ["--home", snk_home, "--bin", bin_dir, "dedupe", "missing"])
+    assert result.exit_code == 1
+
 def test_snk_uninstall(local_workflow: Workflow):
     snk_home = local_workflow.path.parent.parent
     bin_dir = local_workflow.path.parent.parent.parent / "bin"
@@ -75,6 +107,25 @@ def test_snk_uninstall(local_workflow: Workflow):
     )
     assert result.exit_code == 0
     assert "Successfully uninstalled" in result.stdout
+    assert not (snk_home / "workflows" / "workflow").exists()
+    result = runner.invoke(app, ["--home", snk_home, "--bin", bin_dir, "gc", "--trash"])
+    assert result.exit_code == 0
+    assert list((snk_home / ".trash").iterdir()) == []
+
+def test_snk_gc(snk_home: Path, bin_dir: Path):
+    result = runner.invoke(app, ["--home", snk_home, "--bin", bin_dir, "gc"])
+    assert result.exit_code == 0
+    assert "Nothing to clean up" in result.stdout
+    (snk_home / "venvs" / "unused").mkdir(parents=True)
+    (snk_home / "venvs" / "unused" / "file").write_text("data")
+    result = runner.invoke(app, ["--home", snk_home, "--bin", bin_dir, "gc", "--dry-run"])
+    assert result.exit_code == 0
+    assert "Would reclaim 4 B" in result.stdout
+    assert (snk_home / "venvs" / "unused").exists()
+    result = runner.invoke(app, ["--home", snk_home, "--bin", bin_dir, "gc"])
+    assert result.exit_code == 0
+    assert "Reclaimed 4 B" in result.stdout
+    assert not (snk_home / "venvs" / "unused").exists()
 
 def test_snk_create(local_workflow: Workflow, tmp_path: Path):
     result = runner.invoke(app, ["create", str(tmp_path), "--force"])
@@ -100,3 +151,63 @@ def test_import_create_cli(capsys):
     captured = capsys.readouterr()
     assert "Usage" in captured.out
 
+
+def test_snk_install_json_events(snk_home: Path, bin_dir: Path):
+    result = runner.invoke(
+        app,
+        ["--home", snk_home, "--bin", bin_dir, "install", "tests/data/workflow", "--json-events"],
+    )
+    assert result.exit_code == 0
+    events = [json.loads(line) for line in result.stdout.splitlines()]
+    assert events[0]["event"] == "install_start"
+    assert events[-1]["event"] == "install_end"
+    assert events[-1]["status"] == "ok"
+    assert "copy" in events[-1]["timings"]
+
+
+def test_snk_install_manifest(snk_home: Path, bin_dir: Path, tmp_path: Path):
+    manifest = tmp_path / "workflows.yaml"
+    manifest.write_text(
+        "workflows:\n"
+        "  - tests/data/workflow\n"
+        "  - workflow: tests/data/workflow\n"
+        "    name: renamed\n"
+        "  - tests/data/config.yaml\n"
+    )
+    result = runner.invoke(
+        app, ["--home", snk_home, "--bin", bin_dir, "install", "-r", str(manifest)]
+    )
+    assert result.exit_code == 1
+    assert "Successfully installed 2 of 3 workflows" in result.stdout
+    assert "must be a directory" in result.stderr
+    assert (bin_dir / "workflow").is_symlink()
+    assert (bin_dir / "renamed").is_symlink()
+
+
+@pytest.mark.parametrize(
+    "args,forbidden",
+    [
+        (["--version"], ["git", "snakemake", "snk_cli", "packaging", "rich"]),
+        (["--help"], ["git", "snakemake", "snk_cli", "packaging"]),
+        (["list"], ["git", "snakemake", "snk_cli", "packaging"]),
+    ],
+)
+def test_snk_import_budget(nest: Nest, args: List[str], forbidden: List[str]):
+    # light commands must not import the modules needed to install or run workflows
+    script = (
+        "import sys\n"
+        "from snk.main import app\n"
+        "sys.argv[0] = 'snk'\n"
+        "try:\n"
+        "    app()\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(' '.join(sys.modules), file=sys.stderr)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script, "--home", nest.snk_home, "--bin", nest.bin_dir] + args,
+        capture_output=True,
+        text=True,
+    )
+    modules = {m.split(".")[0] for m in result.stderr.split()}
+    assert not modules.intersection(forbidden)
@@ -0,0 +1,66 @@
+import os
+from pathlib import Path
+
+from snk import Nest
+from snk.store import Store
+
+
+def make_workflow(path: Path, script: str = "print('hello')"):
+    (path / "scripts").mkdir(parents=True)
+    (path / ".git").mkdir()
+    (path / "scripts" / "script.py").write_text(script)
+    (path / "envs.yaml").write_text("dependencies: [python]")
+    (path / "snk.yaml").write_text("logo: example")
+    (path / ".git" / "HEAD").write_text("ref: refs/heads/main")
+    return path
+
+
+def test_store_dedupe(tmp_path: Path):
+    first = make_workflow(tmp_path / "first")
+    second = make_workflow(tmp_path / "second", script="print('other')")
+    store = Store(tmp_path / "store")
+    assert store.dedupe([first]) == {"files": 2, "hashed": 2, "linked": 0, "saved": 0}
+    counts = store.dedupe([second])
+    assert counts == {"files": 2, "hashed": 2, "linked": 1, "saved": 22}
+    assert os.path.samefile(first / "envs.yaml", second / "envs.yaml")
+    assert not os.path.samefile(first / "scripts" / "script.py", second / "scripts" / "script.py")
+    # files snk edits and .git are not linked
+    assert os.stat(first / "snk.yaml").st_nlink == 1
+    assert os.stat(first / ".git" / "HEAD").st_nlink == 1
+    # only new and changed files are hashed again
+    assert store.dedupe([first, second])["hashed"] == 0
+    (second / "scripts" / "script.py").write_text("print('hello')")
+    counts = store.dedupe([first, second])
+    assert counts["hashed"] == 1 and counts["linked"] == 1
+    assert os.path.samefile(first / "scripts" / "script.py", second / "scripts" / "script.py")
+    assert store.unused_blobs() == []
+
+
+def test_store_does_not_share_linked_sources(tmp_path: Path):
+    source = make_workflow(tmp_path / "source")
+    installed = tmp_path / "installed"
+    installed.mkdir()
+    os.link(source / "envs.yaml", installed / "envs.yaml")
+    Store(tmp_path / "store").dedupe([installed])
+    # editing the source must not edit the stored file
+    assert not os.path.samefile(source / "envs.yaml", installed / "envs.yaml")
+    (source / "envs.yaml").write_text("dependencies: [r]")
+    assert (installed / "envs.yaml").read_text() == "dependencies: [python]"
+
+
+def test_nest_dedupe(nest: Nest):
+    nest.install("tests/data/workflow", dedupe=True)
+    nest.install("tests/data/workflow", name="other")
+    snakefile = Path("workflow") / "Snakefile"
+    first = nest.snk_workflows_dir / "workflow" / snakefile
+    second = nest.snk_workflows_dir / "other" / snakefile
+    assert not os.path.samefile(first, second)
+    counts = nest.dedupe()
+    assert counts["linked"] > 0
+    assert os.path.samefile(first, second)
+    assert nest.dedupe()["hashed"] == 0
+    nest.uninstall("workflow", force=True)
+    nest.uninstall("other", force=True)
+    blobs = [g for g in nest.gc() if g.kind == "blob"]
+    assert len(blobs) == counts["files"] - counts["linked"]
+    assert nest.store.unused_blobs() == []
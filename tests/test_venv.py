@@ -1,9 +1,13 @@
+import subprocess
+import threading
+import time
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 import pytest
 
 from snk import Nest
+from snk.installers import PipInstaller, UvInstaller, get_installer
 
 
 @pytest.mark.parametrize(
@@ -27,8 +31,8 @@ def test_install_snk_cli_in_venv(nest: Nest, args):
             pip_path = venv_path / "bin" / "pip"
             with patch.object(Path, "__truediv__", return_value=pip_path):
                 with patch("subprocess.run") as mock_run:
-                    # Assume subprocess.run does not raise an exception
-                    mock_run.return_value = None
+                    # Assume every wheel is already in the wheelhouse
+                    mock_run.return_value = MagicMock(returncode=0)
 
                     # Call the method under test
                     nest._install_snk_cli_in_venv(venv_path, **args)
@@ -39,9 +43,218 @@ def test_install_snk_cli_in_venv(nest: Nest, args):
                     else:
                         snakemake = f"snakemake=={args['snakemake_version']}"
                     mock_run.assert_called_once_with(
-                        [pip_path, "install", snakemake, "setuptools"]
-                        + args["dependencies"],
-                        check=True,
+                        [
+                            pip_path,
+                            "install",
+                            "--no-index",
+                            "--find-links",
+                            str(nest.snk_wheelhouse_dir),
+                            snakemake,
+                            "setuptools",
+                        ]
+                        + args["dependencies"]
+                        + ["snk_cli"],
+                        capture_output=True,
                     )
                     # Verify that the Path.exists method was called on both venv_path and pip_path
                     mock_exists.assert_any_call()
+
+
+def test_install_snk_cli_in_venv_fills_wheelhouse(nest: Nest, tmp_path: Path):
+    pip_path = tmp_path / "bin" / "pip"
+    pip_path.parent.mkdir()
+    pip_path.touch()
+    with patch("subprocess.run") as mock_run:
+        # the first attempt only uses the wheelhouse and is missing a wheel
+        mock_run.side_effect = [MagicMock(returncode=1), None, None]
+        nest._install_snk_cli_in_venv(tmp_path)
+    commands = [c.args[0] for c in mock_run.call_args_list]
+    assert commands[1][:4] == [pip_path, "wheel", "--wheel-dir", str(nest.snk_wheelhouse_dir)]
+    assert commands[2] == commands[0]
+    assert "--no-index" in commands[2]
+
+
+def test_install_snk_cli_in_venv_offline(nest: Nest, tmp_path: Path):
+    pip_path = tmp_path / "bin" / "pip"
+    pip_path.parent.mkdir()
+    pip_path.touch()
+    with patch("subprocess.run") as mock_run:
+        mock_run.side_effect = subprocess.CalledProcessError(1, "pip")
+        with pytest.raises(Exception, match="offline"):
+            nest._install_snk_cli_in_venv(tmp_path, offline=True)
+    mock_run.assert_called_once()
+    assert "--no-index" in mock_run.call_args.args[0]
+
+
+def fake_virtual_environment(nest: Nest):
+    def create_virtual_environment(name, with_pip=True):
+        venv_path = nest.snk_venv_dir / name
+        (venv_path / "bin").mkdir(parents=True)
+        if with_pip:
+            (venv_path / "bin" / "pip").touch()
+        return venv_path
+
+    return create_virtual_environment
+
+
+def test_get_virtual_environment_is_shared(nest: Nest):
+    with patch.object(
+        nest, "create_virtual_environment", side_effect=fake_virtual_environment(nest)
+    ) as mock_create, patch.object(nest, "_install_snk_cli_in_venv") as mock_install:
+        first = nest.get_virtual_environment("first", snakemake_version="7.0.0")
+        second = nest.get_virtual_environment("second", snakemake_version="==7.0.0")
+        other = nest.get_virtual_environment("other", dependencies=["pandas"])
+    assert first == second
+    assert first != other
+    assert mock_create.call_count == 2
+    assert mock_install.call_count == 2
+    assert sorted(p.name for p in (first / "snk-refs").iterdir()) == ["first", "second"]
+
+
+def test_shared_venv_removed_with_last_reference(nest: Nest):
+    with patch.object(
+        nest, "create_virtual_environment", side_effect=fake_virtual_environment(nest)
+    ), patch.object(nest, "_install_snk_cli_in_venv"):
+        venv_path = nest.get_virtual_environment("first")
+        nest.get_virtual_environment("second")
+    nest.delete_paths(nest.get_paths_to_delete("first"))
+    assert venv_path.exists()
+    assert not (venv_path / "snk-refs" / "first").exists()
+    nest.delete_paths(nest.get_paths_to_delete("second"))
+    assert not venv_path.exists()
+
+
+def test_install_prepares_venv_during_download(nest: Nest):
+    threads = []
+
+    def create_virtual_environment(name, with_pip=True):
+        threads.append(threading.current_thread())
+        return fake_virtual_environment(nest)(name)
+
+    with patch.object(
+        nest, "create_virtual_environment", side_effect=create_virtual_environment
+    ) as mock_create, patch.object(nest, "_install_snk_cli_in_venv") as mock_install, patch(
+        "subprocess.run"
+    ) as mock_run:
+        nest.install("tests/data/workflow", dependencies=["pandas"])
+    assert mock_create.call_count == 1
+    assert mock_create.call_args.args[0].startswith(".prepared-")
+    assert threads[0] is not threading.main_thread()
+    # the wheels are fetched before the workflow requirements are known
+    wheel_command = mock_run.call_args_list[0].args[0]
+    assert wheel_command[1] == "wheel"
+    assert "pandas" in wheel_command
+    mock_install.assert_called_once()
+    venv_path = nest.snk_venv_dir / nest.registry.get("workflow").venv
+    assert (venv_path / "snk-refs" / "workflow").exists()
+    assert [p.name for p in nest.snk_venv_dir.iterdir()] == [venv_path.name]
+
+
+def test_prepared_venv_is_relocated(nest: Nest):
+    prepared = nest.snk_venv_dir / ".prepared-test"
+    (prepared / "bin").mkdir(parents=True)
+    (prepared / "bin" / "pip").write_text(f"#!{prepared}/bin/python\n")
+    with patch.object(nest, "create_virtual_environment") as mock_create, patch.object(
+        nest, "_install_snk_cli_in_venv"
+    ):
+        venv_path = nest.get_virtual_environment("workflow", prepared=prepared)
+    mock_create.assert_not_called()
+    assert not prepared.exists()
+    assert (venv_path / "bin" / "pip").read_text() == f"#!{venv_path}/bin/python\n"
+
+
+def test_prepared_venv_discarded_on_failure(nest: Nest):
+    with patch.object(
+        nest, "create_virtual_environment", side_effect=fake_virtual_environment(nest)
+    ), patch("subprocess.run"):
+        with pytest.raises(FileNotFoundError):
+            nest.install("tests/data/workflow", config="missing.yaml", isolate=True)
+        # the venv is discarded once the background step finishes
+        for _ in range(100):
+            if list(nest.snk_trash_dir.glob(".prepared-*")):
+                break
+            time.sleep(0.05)
+    assert len(list(nest.snk_trash_dir.glob(".prepared-*"))) == 1
+    assert list(nest.snk_venv_dir.glob(".prepared-*")) == []
+
+
+def test_get_installer(monkeypatch, tmp_path: Path):
+    monkeypatch.delenv("SNK_INSTALLER", raising=False)
+    with patch("shutil.which", return_value="/usr/bin/uv"):
+        assert get_installer(None, tmp_path).name == "uv"
+        assert get_installer("pip", tmp_path).name == "pip"
+        monkeypatch.setenv("SNK_INSTALLER", "pip")
+        assert get_installer(None, tmp_path).name == "pip"
+    with patch("shutil.which", return_value=None):
+        # pip is the fallback
+        assert get_installer("auto", tmp_path).name == "pip"
+        with pytest.raises(ValueError, match="uv was not found"):
+            get_installer("uv", tmp_path)
+    with pytest.raises(ValueError, match="Unknown installer"):
+        get_installer("conda", tmp_path)
+
+
+def test_uv_installer(tmp_path: Path):
+    installer = UvInstaller(tmp_path / "wheelhouse", "/usr/bin/uv")
+    venv_path = tmp_path / "venv"
+    with patch("subprocess.run") as mock_run:
+        installer.create(venv_path, Path("/usr/bin/python3"))
+        installer.install(venv_path, ["snakemake", "snk_cli"])
+        installer.install(venv_path, ["snakemake"], offline=True)
+    create, install, install_offline = [c.args[0] for c in mock_run.call_args_list]
+    assert create[:2] == ["/usr/bin/uv", "venv"]
+    assert create[-1] == str(venv_path)
+    assert install == [
+        "/usr/bin/uv",
+        "pip",
+        "install",
+        "--python",
+        str(venv_path / "bin" / "python"),
+        "snakemake",
+        "snk_cli",
+    ]
+    assert "--offline" in install_offline
+
+
+def test_venv_records_installer(nest: Nest):
+    with patch.object(
+        nest, "create_virtual_environment", side_effect=fake_virtual_environment(nest)
+    ), patch.object(nest, "_install_snk_cli_in_venv"):
+        venv_path = nest.get_virtual_environment("workflow")
+    assert nest.virtual_environment_metadata(venv_path.name)["installer"] == "pip"
+    assert nest.virtual_environment_metadata("missing") == {}
+
+
+def test_layered_venvs_share_base(nest: Nest):
+    with patch.object(
+        nest, "create_virtual_environment", side_effect=fake_virtual_environment(nest)
+    ), patch.object(nest, "_install_snk_cli_in_venv") as mock_install, patch.object(
+        nest.installer, "install"
+    ) as mock_layer_install:
+        first = nest.get_virtual_environment("first", dependencies=["pandas"], layered=True)
+        second = nest.get_virtual_environment("second", dependencies=["numpy"], layered=True)
+    assert first != second
+    # snakemake and snk_cli are only installed once, in the base venv
+    mock_install.assert_called_once()
+    assert [c.args[1] for c in mock_layer_install.call_args_list] == [["pandas"], ["numpy"]]
+    base = nest.snk_venv_dir / nest.virtual_environment_metadata(first.name)["base"]
+    assert nest.virtual_environment_metadata(second.name)["base"] == base.name
+    assert nest._venv_layers(first) == [first, base]
+    pth = nest._site_packages(first) / "snk-base.pth"
+    assert pth.read_text().strip() == str(nest._site_packages(base))
+    assert sorted(p.name for p in (base / "snk-refs").iterdir()) == ["first", "second"]
+    nest.delete_paths(nest.get_paths_to_delete("first"))
+    assert not first.exists()
+    assert base.exists()
+    nest.delete_paths(nest.get_paths_to_delete("second"))
+    assert not base.exists()
+
+
+def test_pip_installer_uses_base_pip_in_layers(tmp_path: Path):
+    installer = PipInstaller(tmp_path / "wheelhouse")
+    (tmp_path / "bin").mkdir()
+    (tmp_path / "bin" / "python").touch()
+    with patch("subprocess.run") as mock_run:
+        mock_run.return_value = MagicMock(returncode=0)
+        installer.install(tmp_path, ["pandas"])
+    assert mock_run.call_args.args[0][:4] == [tmp_path / "bin" / "python", "-m", "pip", "install"]